@@ -1,9 +1,40 @@
 #!/usr/bin/env python
 # coding: utf-8
+'''
+Submodules and the classes below are imported on first access, so importing
+the package doesn't load pandas or PyTables.
+'''
+import importlib
+import sys
 
 #from . import aml_to_hdf
-from . import datasethandler
-from . import parser
 
-from .datasethandler import DataSetHandler
-from .datasethandler import DataSet
\ No newline at end of file
+_LAZY_ATTRIBUTES = {'DataSetHandler': 'datasethandler',
+                    'DataSet': 'datasethandler'}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module('.' + _LAZY_ATTRIBUTES[name],
+                                         __name__)
+        return getattr(module, name)
+    try:
+        return importlib.import_module('.' + name, __name__)
+    except ModuleNotFoundError as error:
+        # a dependency missing inside an existing submodule is no typo
+        if error.name != '{}.{}'.format(__name__, name):
+            raise
+    raise AttributeError('module {} has no attribute {}'.format(__name__,
+                                                                name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRIBUTES.keys()))
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ is ignored before python 3.7
+    from . import datasethandler
+    from . import parser
+    from .datasethandler import DataSetHandler
+    from .datasethandler import DataSet
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Registry of storage backends for files other than hdf5 and i3.
+
+hdf5 and i3 files are read by DataSet itself with i3hdf_to_df, every other
+file ending is dispatched to the backend registered for it. Parquet and
+Feather/Arrow IPC files are read with pyarrow, which is only needed once
+such files are loaded or written.
+'''
+from __future__ import division, print_function
+
+import operator
+from collections import OrderedDict
+
+from .parser import is_ending_in
+
+HDF_SUFFIX = ['h5', 'hd5', 'hdf5']
+I3_SUFFIX = ['i3', 'i3.gz', 'i3.bz2']
+ID_COLS = ['Run', 'Event', 'SubEvent']
+
+BACKENDS = OrderedDict()
+
+
+def register_backend(backend):
+    ''' Register a Backend class under its name, usable as decorator '''
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(files):
+    ''' Registered backend able to read all files
+
+        Raises:
+            TypeError if no backend handles the endings of the files, which
+            includes hdf5 and i3 files
+    '''
+    for backend in BACKENDS.values():
+        if is_ending_in(backend.suffixes, files):
+            return backend()
+    raise TypeError("File ending unknown.")
+
+
+def get_backend_by_name(name):
+    if name not in BACKENDS:
+        raise ValueError('Backend has to be one of: {}'.format(
+            ', '.join(BACKENDS.keys())))
+    return BACKENDS[name]()
+
+
+class Backend(object):
+    ''' Base class of storage backends '''
+    name = None
+    suffixes = []
+
+    def observables(self, file_list):
+        ''' Observables stored in file_list '''
+        raise NotImplementedError
+
+    def load(self, file_list, keys=None, cuts=None):
+        ''' DataFrame with keys of all files in file_list
+
+            Args:
+                file_list (list): Paths of the files to read
+                keys (list): Observables to read, None reads all
+                cuts (list): Tuples (observable, operator, value) rows have
+                    to pass
+        '''
+        raise NotImplementedError
+
+    def export(self, df, path):
+        ''' Write df to the file path '''
+        raise NotImplementedError("Can't export to {} files.".format(
+            self.name))
+
+
+CUT_OPERATORS = OrderedDict([('==', operator.eq),
+                             ('!=', operator.ne),
+                             ('>=', operator.ge),
+                             ('<=', operator.le),
+                             ('>', operator.gt),
+                             ('<', operator.lt)])
+
+
+class ArrowBackend(Backend):
+    ''' Files readable by pyarrow.dataset, written with id columns as data
+
+        Only the requested columns are read and cuts are pushed down to
+        pyarrow, which skips row groups (or record batches) via their
+        statistics where the format provides them.
+    '''
+    format = None
+
+    def _dataset(self, file_list):
+        try:
+            import pyarrow.dataset as ds
+        except ImportError:
+            raise ImportError('Reading {} files needs pyarrow.'.format(
+                self.name))
+        return ds, ds.dataset(list(file_list), format=self.format)
+
+    def observables(self, file_list):
+        _, dataset = self._dataset(file_list)
+        return [name for name in dataset.schema.names if name not in ID_COLS]
+
+    def load(self, file_list, keys=None, cuts=None):
+        ds, dataset = self._dataset(file_list)
+        id_cols = [c for c in ID_COLS if c in dataset.schema.names]
+        columns = None if keys is None else \
+            id_cols + [str(k) for k in keys if str(k) not in id_cols]
+        expression = None
+        for key, op, value in cuts or []:
+            if op not in CUT_OPERATORS:
+                raise ValueError('Operator has to be: {}'.format(
+                    ', '.join(CUT_OPERATORS.keys())))
+            cut = CUT_OPERATORS[op](ds.field(str(key)), value)
+            expression = cut if expression is None else expression & cut
+        df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        if len(id_cols) > 0:
+            df.set_index(id_cols, inplace=True)
+        return df
+
+    def _table(self, df):
+        import pyarrow as pa
+        return pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+
+
+@register_backend
+class ParquetBackend(ArrowBackend):
+    name = 'parquet'
+    suffixes = ['parquet', 'pq']
+    format = 'parquet'
+    row_group_size = 65536
+
+    def export(self, df, path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing parquet files needs pyarrow.')
+        pq.write_table(self._table(df), path,
+                       row_group_size=self.row_group_size)
+
+
+@register_backend
+class FeatherBackend(ArrowBackend):
+    name = 'feather'
+    suffixes = ['feather', 'arrow', 'ipc']
+    format = 'ipc'
+    chunk_size = 65536
+
+    def export(self, df, path):
+        try:
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError('Writing feather files needs pyarrow.')
+        feather.write_feather(self._table(df), path,
+                              chunksize=self.chunk_size)
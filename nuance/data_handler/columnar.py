@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Store DataFrames as one flat .npy file per column and index level.
+
+A store is a directory holding the arrays and a manifest.json describing
+columns, dtypes and index. Reading the arrays back needs no decoding, with
+mmap=True they are memory mapped instead of read, so processes reading the
+same store share the page cache.
+
+Data sets can be converted file by file with ColumnarWriter or from the
+command line:
+
+    python -m nuance.data_handler.columnar -i '/data/numu/*.hd5' \\
+        -o /data/numu.columnar -e exists -k LineFit.zenith -k L4.score
+'''
+from __future__ import division, print_function
+
+import glob
+import json
+import os
+import shutil
+from collections import OrderedDict
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = 'manifest.json'
+
+
+def _is_nullable(values):
+    return isinstance(values, (pd.arrays.IntegerArray,
+                               pd.arrays.BooleanArray))
+
+
+def _storable(values):
+    ''' Numpy array of values, object columns (bool + NaN) become float '''
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        values = values.astype(float)
+    return values
+
+
+def _split_object(values):
+    ''' Values and missing mask of an object column, e.g. bool + NaN
+
+        Returns:
+            bool array if all present values are bool, float array else
+            and the boolean mask of missing values
+    '''
+    mask = np.asarray(pd.isna(values))
+    present = values[~mask]
+    if all(isinstance(v, (bool, np.bool_)) for v in present):
+        data = np.zeros(len(values), dtype=bool)
+        data[~mask] = present.astype(bool)
+    else:
+        data = values.astype(float)
+    return data, mask
+
+
+def _join_object(values, mask):
+    ''' Object column of values with NaN where mask, see _split_object '''
+    values = np.asarray(values).astype(object)
+    values[mask] = np.nan
+    return values
+
+
+def write_columnar(df, path):
+    ''' Write df to the directory path, replacing an existing store
+
+        The store is written to a temporary directory first and renamed, so
+        readers never see half written stores.
+
+        Args:
+            df (DataFrame): Data to store, columns need numpy or nullable
+                integer/bool dtypes
+            path (str): Directory of the store
+    '''
+    tmp_path = '{}.{}.tmp'.format(path.rstrip('/'), os.getpid())
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    manifest = {'n_rows': len(df), 'columns': [], 'index': []}
+    index = df.index
+    for i in range(index.nlevels):
+        name = 'index_{}.npy'.format(i)
+        np.save(join(tmp_path, name), _storable(index.get_level_values(i)))
+        manifest['index'].append({'name': index.names[i], 'file': name})
+    for i, col in enumerate(df.columns):
+        values = df[col].values
+        entry = {'name': col, 'file': 'col_{}.npy'.format(i)}
+        if _is_nullable(values):
+            dtype = values.dtype.numpy_dtype
+            np.save(join(tmp_path, entry['file']),
+                    values.to_numpy(dtype=dtype, na_value=0))
+            entry['mask'] = 'mask_{}.npy'.format(i)
+            np.save(join(tmp_path, entry['mask']), np.asarray(pd.isna(values)))
+        elif values.dtype.kind == 'O':
+            # read back as object column with NaNs, like it was loaded
+            data, mask = _split_object(np.asarray(values))
+            np.save(join(tmp_path, entry['file']), data)
+            entry['mask'] = 'mask_{}.npy'.format(i)
+            entry['object'] = True
+            np.save(join(tmp_path, entry['mask']), mask)
+        else:
+            np.save(join(tmp_path, entry['file']), _storable(values))
+        manifest['columns'].append(entry)
+    with open(join(tmp_path, MANIFEST), 'w') as output:
+        json.dump(manifest, output, indent=4, separators=(',', ': '))
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def read_manifest(path):
+    ''' Manifest of the store in path '''
+    with open(join(path, MANIFEST), 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def read_column(path, entry, mmap=False):
+    ''' Array of the manifest entry of a column or index level '''
+    mmap_mode = 'r' if mmap else None
+    values = np.load(join(path, entry['file']), mmap_mode=mmap_mode)
+    if 'mask' in entry:
+        mask = np.load(join(path, entry['mask']))
+        if entry.get('object', False):
+            return _join_object(values, mask)
+        if values.dtype.kind == 'b':
+            return pd.arrays.BooleanArray(np.asarray(values), mask)
+        return pd.arrays.IntegerArray(np.asarray(values), mask)
+    return values
+
+
+def read_columnar(path, columns=None, mmap=False):
+    ''' Read the store in path into a DataFrame
+
+        Args:
+            path (str): Directory of the store
+            columns (list): Columns to read, None reads all
+            mmap (bool): Memory map the arrays instead of reading them
+
+        Returns:
+            DataFrame with the stored index
+    '''
+    manifest = read_manifest(path)
+    entries = manifest['columns']
+    if columns is not None:
+        by_name = {entry['name']: entry for entry in entries}
+        missing = [col for col in columns if col not in by_name]
+        if len(missing) > 0:
+            raise KeyError('{} not in {}'.format(missing, path))
+        entries = [by_name[col] for col in columns]
+    levels = [read_column(path, entry, mmap) for entry in manifest['index']]
+    names = [entry['name'] for entry in manifest['index']]
+    if len(levels) == 1:
+        index = pd.Index(levels[0], name=names[0])
+    else:
+        index = pd.MultiIndex.from_arrays(levels, names=names)
+    data = pd.DataFrame(
+        dict((entry['name'], read_column(path, entry, mmap))
+             for entry in entries),
+        index=index, columns=[entry['name'] for entry in entries],
+        copy=False)
+    return data
+
+
+def store_size(path):
+    ''' Size of all files of the store in bytes '''
+    return sum(os.path.getsize(join(path, name)) for name in os.listdir(path))
+
+
+class ColumnarWriter(object):
+    ''' Write a columnar store chunk by chunk without holding all data
+
+        Chunks are appended to raw files first. close() promotes every column
+        to the common dtype of all its chunks and writes the final .npy files
+        block by block, so memory stays bounded by a chunk.
+    '''
+    def __init__(self, path, block_rows=1048576):
+        ''' Args:
+                path (str): Directory of the store to create
+                block_rows (int): Rows copied at once while finalizing
+        '''
+        self.path = path
+        self.block_rows = block_rows
+        self._tmp_path = '{}.{}.tmp'.format(path.rstrip('/'), os.getpid())
+        if os.path.isdir(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+        os.makedirs(self._tmp_path)
+        self._index_names = None
+        self._columns = None
+        # per array: list of (dtype, n_rows) of the appended chunks
+        self._chunks = OrderedDict()
+        self._nullable = set()
+        self.n_rows = 0
+
+    def _append(self, name, values, mask=None):
+        with open(join(self._tmp_path, name + '.raw'), 'ab') as raw:
+            raw.write(np.ascontiguousarray(values).tobytes())
+        self._chunks.setdefault(name, []).append((values.dtype, len(values)))
+        if mask is not None:
+            with open(join(self._tmp_path, name + '.mask'), 'ab') as raw:
+                raw.write(np.ascontiguousarray(mask).tobytes())
+
+    def append(self, df):
+        ''' Append the rows of df, all chunks need the same columns '''
+        if self._columns is None:
+            self._columns = list(df.columns)
+            self._index_names = list(df.index.names)
+        elif list(df.columns) != self._columns:
+            raise ValueError('All chunks need the columns {}.'.format(
+                self._columns))
+        for i in range(df.index.nlevels):
+            self._append('index_{}'.format(i),
+                         _storable(df.index.get_level_values(i)))
+        for i, col in enumerate(df.columns):
+            values = df[col].values
+            if _is_nullable(values):
+                dtype = values.dtype.numpy_dtype
+                self._nullable.add(i)
+                self._append('col_{}'.format(i),
+                             values.to_numpy(dtype=dtype, na_value=0),
+                             mask=np.asarray(pd.isna(values)))
+            else:
+                values = _storable(values)
+                self._append('col_{}'.format(i), values,
+                             mask=np.zeros(len(values), dtype=bool))
+        self.n_rows += len(df)
+
+    def _finalize(self, name, file_name):
+        ''' Copy the raw chunks of name into file_name with one dtype '''
+        chunks = self._chunks.get(name, [])
+        dtype = np.result_type(*[d for d, _ in chunks]) if chunks \
+            else np.dtype(float)
+        out = np.lib.format.open_memmap(join(self._tmp_path, file_name),
+                                        mode='w+', dtype=dtype,
+                                        shape=(self.n_rows,))
+        offset = 0
+        with open(join(self._tmp_path, name + '.raw'), 'rb') as raw:
+            for chunk_dtype, n_rows in chunks:
+                for start in range(0, n_rows, self.block_rows):
+                    count = min(self.block_rows, n_rows - start)
+                    out[offset:offset + count] = np.fromfile(
+                        raw, dtype=chunk_dtype, count=count)
+                    offset += count
+        out.flush()
+        del out
+        os.remove(join(self._tmp_path, name + '.raw'))
+
+    def close(self):
+        ''' Write the final arrays and manifest and move the store in place '''
+        manifest = {'n_rows': self.n_rows, 'columns': [], 'index': []}
+        for i, name in enumerate(self._index_names or []):
+            file_name = 'index_{}.npy'.format(i)
+            self._finalize('index_{}'.format(i), file_name)
+            manifest['index'].append({'name': name, 'file': file_name})
+        for i, col in enumerate(self._columns or []):
+            entry = {'name': col, 'file': 'col_{}.npy'.format(i)}
+            self._finalize('col_{}'.format(i), entry['file'])
+            mask_path = join(self._tmp_path, 'col_{}.mask'.format(i))
+            if i in self._nullable:
+                entry['mask'] = 'mask_{}.npy'.format(i)
+                np.save(join(self._tmp_path, entry['mask']),
+                        np.fromfile(mask_path, dtype=bool))
+            os.remove(mask_path)
+            manifest['columns'].append(entry)
+        with open(join(self._tmp_path, MANIFEST), 'w') as output:
+            json.dump(manifest, output, indent=4, separators=(',', ': '))
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self._tmp_path, self.path)
+
+
+def convert(container, observables, path, chunk_rows=None):
+    ''' Convert observables of an HDFContainer into a columnar store
+
+        The files are read one by one via HDFContainer.iter_chunks, so rows
+        are aligned per file.
+
+        Args:
+            container (HDFContainer): Files and loading options to convert
+            observables (list): Observables to store
+            path (str): Directory of the store
+            chunk_rows (int): Maximum number of rows read at once
+    '''
+    writer = ColumnarWriter(path)
+    for chunk in container.iter_chunks(observables, chunk_rows=chunk_rows):
+        writer.append(chunk)
+    writer.close()
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    from .i3hdf_to_df import HDFContainer
+
+    parser = OptionParser()
+    parser.add_option("-i", "--input", dest="input",
+                      help="Glob pattern of the hdf5 files to convert.")
+    parser.add_option("-o", "--output", dest="output",
+                      help="Directory of the columnar store to create.")
+    parser.add_option("-k", "--key", dest="keys", action="append",
+                      help="Observable to store, can be given multiple "\
+                           "times. All observables are stored by default.")
+    parser.add_option("-e", "--exists-col", dest="exists_col", default=None,
+                      help="Column marking valid rows, e.g. exists.")
+    parser.add_option("-c", "--compact", dest="compact", default=False,
+                      action="store_true", help="Store compact dtypes.")
+    (options, args) = parser.parse_args()
+
+    container = HDFContainer(file_list=sorted(glob.glob(options.input)),
+                             exists_col=options.exists_col,
+                             compact=options.compact)
+    keys = options.keys
+    if keys is None:
+        keys = container.get_observables()
+    convert(container, keys, options.output)
+    print('Wrote {} observables to {}'.format(len(keys), options.output))
@@ -17,23 +17,53 @@ from os.path import join
 import subprocess
 
 import copy
-from glob import glob
 import json
-
-from functools import reduce
-
-import numpy as np
-from tqdm import tqdm
-
+import math
+import shutil
+import tempfile
+import time
+import traceback
+from multiprocessing import Pool, Process, Queue
+from multiprocessing.pool import ThreadPool
+
+from collections import OrderedDict
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+from ..lazy import lazy_import
 from .parser import check_type, is_ending_in
-from .i3hdf_to_df import HDFContainer, ObservableName
+from .backends import HDF_SUFFIX, I3_SUFFIX
+from .backends import get_backend, get_backend_by_name
+from .lrucache import LRUCache, nbytes
+from .jsonfile import read_json, write_json
+from .registry import DataSetRegistry, LazyDataSets
+
+# heavy dependencies are imported on first use
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+tqdm = lazy_import('tqdm')
+columnar = lazy_import('.columnar', __package__)
+i3hdf_to_df = lazy_import('.i3hdf_to_df', __package__)
+loadcache = lazy_import('.loadcache', __package__)
+transfer = lazy_import('.transfer', __package__)
+manifest = lazy_import('.manifest', __package__)
+schema = lazy_import('.schema', __package__)
+_selection = lazy_import('.selection', __package__)
 
 # TO DO: export these to config file
 DB_CACHE = expandvars('$THESIS/scripts/database/')
 DB_SUFFIX = "dataset"
+SCHEMA_SUFFIX = "schema"
+LOADED_SUFFIX = "loaded"
+LOAD_CACHE_DIR = "load_cache"
+LOAD_CACHE_MAX_BYTES = 20 * 1024**3
+COLUMNAR_SUFFIX = "columnar"
+MANIFEST_SUFFIX = "manifest"
+LISTING_SUFFIX = "listing"
+REGISTRY_FILE = "registry.json"
 DATA_DIR = expandvars('$THESIS/data/')
-HDF_SUFFIX = ['h5', 'hd5', 'hdf5']
-I3_SUFFIX = ['i3', 'i3.gz', 'i3.bz2']
 
 
 def create_folder(path):
@@ -64,9 +94,77 @@ def get_burnsample(path, months=None):
     return result
 
 
+def _scan_observables(properties, files, data_dir, db_dir, blacklists):
+    ''' Observables of the data set described by properties '''
+    dataset = DataSet(properties, data_dir=data_dir, db_dir=db_dir)
+    dataset._files = files
+    return dataset.type, dataset.observables(**blacklists)
+
+
+def _load_dataset(dataset, options, path):
+    ''' Load dataset in a worker process and store its data in path '''
+    start = time.time()
+    # a spilled file belongs to the parent process
+    dataset._spill_path = None
+    dataset.load(**options)
+    columnar.write_columnar(dataset.data, path)
+    return {'observables': dataset._observables,
+            'files_loaded': dataset.files_loaded,
+            'time': time.time() - start}
+
+
+def _queue_call(queue, i, func, args):
+    try:
+        queue.put((i, True, func(*args)))
+    except Exception:
+        queue.put((i, False, traceback.format_exc()))
+
+
+def _run_processes(func, args_list, n_parallel):
+    ''' Call func for all args in up to n_parallel processes at once
+
+        Unlike the workers of multiprocessing.Pool, the processes aren't
+        daemonic, so func may start a Pool itself. Results are sent back
+        through a Queue and should therefore be small.
+
+        Yields:
+            Tuples (position in args_list, result) in order of completion
+
+        Raises:
+            RuntimeError if func raised or a process died
+    '''
+    queue = Queue()
+    pending = list(enumerate(args_list))
+    running = dict()
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < n_parallel:
+                i, args = pending.pop(0)
+                running[i] = Process(target=_queue_call,
+                                     args=(queue, i, func, args))
+                running[i].start()
+            try:
+                i, success, result = queue.get(timeout=1)
+            except Empty:
+                for i, process in running.items():
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError('Worker {} died with exit code '\
+                            '{}.'.format(i, process.exitcode))
+                continue
+            running.pop(i).join()
+            if not success:
+                raise RuntimeError('Worker {} failed:\n{}'.format(i, result))
+            yield i, result
+    finally:
+        for process in running.values():
+            process.terminate()
+            process.join()
+
+
 class DataSetHandler(object):
     ''' A handler for multiple data sets'''
-    def __init__(self, db_dir=DB_CACHE, data_dir=DATA_DIR, settings=None):
+    def __init__(self, db_dir=DB_CACHE, data_dir=DATA_DIR, settings=None,
+                 n_workers=None, max_bytes=None, spill_dir=None):
         ''' Scan database for all available dataset files
             
             Args:
@@ -76,6 +174,17 @@ class DataSetHandler(object):
                     Root directory of data sets
                 settings:
                     Path to general setting file concerning all data sets
+                n_workers:
+                    Number of processes used to scan and load data sets,
+                    None works in this process only
+                max_bytes:
+                    Memory budget of the data of all data sets. Above it the
+                    least recently used data sets are spilled to spill_dir
+                    and read back on their next access. None keeps
+                    everything in memory.
+                spill_dir:
+                    Directory on a fast local disk for spilled data sets,
+                    None creates a temporary directory
         '''
         if not settings is None:
             with open(settings, 'r') as s:
@@ -88,29 +197,27 @@ class DataSetHandler(object):
             self._settings = None
             self._blacklists = dict()
             self._loading_properties = dict()
-        self._datasets = dict()
+        self._data_dir = data_dir
+        self._db_dir = db_dir
         try:
-            self._dataset_paths = glob(join(db_dir, '*.' + DB_SUFFIX))
-            if len(self._dataset_paths) == 0:
+            self._registry = DataSetRegistry(db_dir, suffix=DB_SUFFIX,
+                                             file_name=REGISTRY_FILE)
+            if len(self._registry) == 0:
                 print('No file with .dataset ending found.')
-        except:
+        except (IOError, OSError):
             raise IOError("Can't find data sets in {}. Please provide a valid \
                 path.".format(db_dir))
-
-        path_dict = {}
-        for path in self._dataset_paths:
-            with open(path, 'r') as current_file:
-                json_file = json.load(current_file)
-                data_type = json_file['type']
-                path_dict[data_type] = path
-                self._datasets[data_type] = DataSet(json_file,
-                                                            data_dir=data_dir)
-                try:
-                    self._datasets[data_type]._weight_names = self._loading_properties[data_type]['weights']
-                except:
-                    pass
-        self._dataset_paths = path_dict
+        self._dataset_paths = self._registry.paths
+        self._datasets = LazyDataSets(self._dataset_paths.keys(),
+                                      self._create_dataset)
         self._observables = None
+        self.n_workers = n_workers
+        self._spill_dir = spill_dir
+        self._memory = None
+        if max_bytes is not None:
+            self._memory = LRUCache(max_bytes,
+                                    sizeof=lambda dataset: dataset.nbytes,
+                                    on_evict=self._spill)
 
 
     @property
@@ -122,20 +229,125 @@ class DataSetHandler(object):
     def observables(self):
         ''' Get intersection of all observables '''
         if self._observables is None:
-            # TODO: parallelize observable loading
-            all_attributes = [dataset.observables(**self._blacklists) \
-                              for dataset in tqdm(self._datasets.values(),
-                                desc="Scanning datasets for observables ") \
-                              if not ":" in dataset.path]
-            self._observables = list(reduce(set.intersection,
-                                     map(set, all_attributes)))
-            self._observables = list(map(str, self._observables))
-            self._observables = sorted(self._observables)
+            self._observables = self.get_observables(n_workers=self.n_workers)
         return self._observables
 
 
+    def get_observables(self, n_workers=None):
+        ''' Intersection of the observables of all local data sets
+
+            Data sets which know their observables or whose first file is in
+            their schema index are resolved right away without opening any
+            file. The others are scanned in up to n_workers processes, the
+            intersection is updated as their results arrive.
+
+            Args:
+                n_workers (int): Number of data sets scanned at once. None
+                    scans one after another.
+
+            Returns:
+                Sorted list of observable names
+        '''
+        datasets = [dataset for dataset in self._datasets.values()
+                    if not ":" in dataset.path]
+        common = [None]
+
+        def intersect(observables):
+            observables = set(map(str, observables))
+            common[0] = observables if common[0] is None \
+                else common[0] & observables
+
+        to_scan = []
+        for dataset in datasets:
+            if dataset._observables is not None or \
+                    dataset.is_schema_indexed():
+                intersect(dataset.observables(**self._blacklists))
+            else:
+                to_scan.append(dataset)
+        progress = tqdm.tqdm(total=len(to_scan),
+                        desc="Scanning datasets for observables ")
+        if n_workers is None or n_workers < 2 or len(to_scan) < 2:
+            for dataset in to_scan:
+                intersect(dataset.observables(**self._blacklists))
+                progress.update(1)
+        else:
+            by_type = dict((dataset.type, dataset) for dataset in to_scan)
+            pool = Pool(min(n_workers, len(to_scan)))
+            try:
+                for data_type, observables in pool.imap_unordered(
+                        i3hdf_to_df._star_call,
+                        [(_scan_observables,
+                          (dataset.properties, dataset.files,
+                           dataset._data_dir, dataset._db_dir,
+                           self._blacklists))
+                         for dataset in to_scan]):
+                    dataset = by_type[data_type]
+                    dataset._observables = observables
+                    # the worker extended the index on disk
+                    dataset._schema_index = None
+                    intersect(observables)
+                    progress.update(1)
+            finally:
+                pool.close()
+                pool.join()
+        progress.close()
+        return sorted(common[0] or [])
+
+
     def __getitem__(self, dataset_name):
-        return self._datasets[dataset_name]
+        dataset = self._datasets[dataset_name]
+        self._track(dataset_name)
+        return dataset
+
+
+    def _create_dataset(self, data_type):
+        dataset = DataSet(self._registry.properties(data_type),
+                          data_dir=self._data_dir, db_dir=self._db_dir)
+        if self._memory is not None:
+            # data read back or selected later counts against max_bytes
+            dataset._on_resize = lambda: self._track(data_type)
+        props = self._loading_properties.get(data_type, dict())
+        if 'weights' in props:
+            dataset._weight_names = props['weights']
+        return dataset
+
+
+    @property
+    def spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='nuance_spill_')
+        return self._spill_dir
+
+
+    def _spill(self, dataset_name, dataset):
+        dataset.spill(self.spill_dir)
+
+
+    def _track(self, dataset_name):
+        ''' Mark dataset_name as most recently used and spill the least
+            recently used data sets if the memory budget is exceeded
+        '''
+        if self._memory is None:
+            return
+        # footprints change by loading, so measure all of them again
+        self._memory[dataset_name] = self._datasets[dataset_name]
+        for name in list(self._memory):
+            if name != dataset_name and name in self._memory:
+                self._memory.resize(name)
+
+
+    def _iter_loaded(self):
+        ''' Loaded data sets, spilled ones are read back one at a time '''
+        for name, dataset in self._datasets.created():
+            if dataset.loaded:
+                yield name, dataset
+                self._track(name)
+
+
+    @property
+    def nbytes(self):
+        ''' Memory used by the data of all data sets '''
+        return sum(dataset.nbytes for _, dataset in self._datasets.created())
 
 
     def __str__(self):
@@ -143,12 +355,12 @@ class DataSetHandler(object):
         if len(self._datasets) > 0:
             output = 'Data sets: '
             list_of_datasets = ', '.join(['{}: {}'.format(dataset,
-                self._datasets[dataset]['name']) for dataset \
+                self._registry.properties(dataset)['name']) for dataset \
                 in self._datasets.keys()])
             output = output + list_of_datasets
         else:
             output = 'No data sets present.'
-        return outputs
+        return output
 
 
     def apply_cut(self, key, operator, value):
@@ -159,32 +371,49 @@ class DataSetHandler(object):
                 operator (str): Comparison operator for key and value
                 value (float): Value to compare entries of given column to
         '''
-        for name, dataset in self._datasets.items():
-            if dataset.loaded:
-                # create cut mask
-                if operator == '==':
-                    mask = dataset.data[key] == value
-                elif operator == '!=':
-                    mask = dataset.data[key] != value
-                elif operator == '>=':
-                    mask = dataset.data[key] >= value
-                elif operator == '<=':
-                    mask = dataset.data[key] <= value
-                elif operator == '>':
-                    mask = dataset.data[key] > value
-                elif operator == '<':
-                    mask = dataset.data[key] < value
-                elif operator == 'is':
-                    mask = dataset.data[key] is value
-                elif operator == 'is not':
-                    mask = dataset.data[key] is not value
-                else:
-                    raise ValueError('Operator has to be: ==, !=, >=, <=, >,'\
-                        ' <, is, is not')
+        self.apply_selection([(key, operator, value)],
+                             name='{} {} {}'.format(key, operator, value))
+
+
+    def apply_selection(self, selection, name=None):
+        ''' Keep only events of the loaded data sets passing selection
+
+            The selection is compiled once and added as one vectorized mask
+            per data set, see DataSet.add_mask. Masks can be undone with
+            remove_mask, cutflow lists the events passing each of them.
+
+            Args:
+                selection (str or list): Expression like
+                    'L4.score > 0.9 & LineFit.zenith < 1.5' or list of tuples
+                    (key, operator, value), see selection.Selection
+                name (str): Name of the mask, defaults to the selection
+        '''
+        selection = _selection.Selection(selection)
+        for _, dataset in self._iter_loaded():
+            dataset.apply_selection(selection, name=name)
 
-                # apply cut
-                dataset.data = dataset.data[mask]
-                dataset.weights = dataset.weights[mask]
+
+    def remove_mask(self, name):
+        ''' Undo the mask name in all data sets having it '''
+        for _, dataset in self._datasets.created():
+            if name in dataset.masks:
+                dataset.remove_mask(name)
+
+
+    def clear_masks(self):
+        ''' Undo all masks of all data sets '''
+        for _, dataset in self._datasets.created():
+            dataset.clear_masks()
+
+
+    def cutflow(self):
+        ''' Cutflow of every loaded data set, see DataSet.cutflow
+
+            Returns:
+                Dict of data set type -> cutflow DataFrame
+        '''
+        return dict((name, dataset.cutflow())
+                    for name, dataset in self._iter_loaded())
 
 
     def drop(self, to_drop):
@@ -194,31 +423,166 @@ class DataSetHandler(object):
                 to_drop (dict): Reasons (keys) and attributes (value list)
                     to drop
         '''
-        for name, dataset in self._datasets.items():
-            if self._datasets[name].loaded:
-                for reason, cols in to_drop.items():
-                    if len(cols) > 0:
-                        dataset.drop(keys=cols, reason=reason)
+        for name, dataset in self._iter_loaded():
+            for reason, cols in to_drop.items():
+                if len(cols) > 0:
+                    dataset.drop(keys=cols, reason=reason)
+
+
+    def _loading_keys(self, name, keys):
+        ''' keys extended by the keys and weights of the loading properties
+            of the data set name
+        '''
+        temp_keys = copy.copy(keys)
+        props = self._loading_properties.get(name, dict())
+        if 'keys' in props.keys():
+            temp_keys += props['keys']
+        if 'weights' in props.keys():
+            temp_keys += props['weights']
+        return temp_keys, props.get('n_files', None)
+
+
+    def refresh_remote(self, force=False, n_workers=8):
+        ''' Fetch the expired listings of all data sets with a remote path
+
+            Listings are fetched in threads sharing one connection per
+            host, so the SSH handshakes aren't serialized.
+
+            Args:
+                force (bool): Fetch listings even if they didn't expire
+                n_workers (int): Number of listings fetched at once
+
+            Returns:
+                OrderedDict of data set type -> number of remote files, None
+                if the listing couldn't be fetched
+        '''
+        names = [name for name in sorted(self._datasets.keys())
+                 if ':' in self._registry.properties(name).get(
+                     'remote_path', '')]
+        if len(names) == 0:
+            return OrderedDict()
+
+        def refresh(name):
+            dataset = self._datasets[name]
+            try:
+                dataset.refresh_remote(force=force)
+                return name, len(dataset.remote_listing), None
+            except Exception as error:
+                return name, None, error
+
+        n_files = dict()
+        pool = ThreadPool(max(1, min(n_workers, len(names))))
+        try:
+            for name, n, error in pool.imap_unordered(refresh, names):
+                if error is not None:
+                    print("Can't list remote files of {}: {}".format(name,
+                                                                     error))
+                n_files[name] = n
+        finally:
+            pool.close()
+            pool.join()
+        return OrderedDict((name, n_files[name]) for name in names)
+
 
+    def load_all(self, keys=None, skip=None, n_workers=None, **kwargs):
+        ''' Load all data sets with the given options in kwargs
 
-    def load_all(self, keys=None, skip=None, **kwargs):
-        ''' Load all data sets with the given options in kwargs '''
-        if not skip is None:
-            if isinstance(skip, str):
-                skip = list(skip)
+            Args:
+                keys (list): Observables to load, None loads the
+                    observables all data sets have in common
+                skip (list): Types of data sets not to load
+                n_workers (int): Budget of processes used for loading in
+                    total. Data sets are loaded in up to n_workers processes
+                    at once, workers left over are used to read the files of
+                    each data set in parallel. None uses the n_workers of
+                    the handler.
+                kwargs: Options passed to DataSet.load
+
+            Returns:
+                OrderedDict of data set type -> seconds it took to load
+        '''
+        if isinstance(skip, str):
+            skip = [skip]
+        if n_workers is None:
+            n_workers = self.n_workers
         if keys is None:
-                keys = copy.copy(self.observables)
-        for dataset, data in tqdm(self._datasets.items(), desc="Datasets "):
-            if not skip is None and not dataset in skip:
-                # TODO: parallelize loading
-                temp_keys = copy.copy(keys)
-                n_files = self._loading_properties[dataset]['n_files']
-                props = self._loading_properties[dataset]
-                if 'keys' in props.keys():
-                    temp_keys += props['keys']
-                if 'weights' in props.keys():
-                    temp_keys += props['weights']
-                data.load(keys=temp_keys, n_files=n_files, **kwargs)
+            keys = copy.copy(self.observables)
+        names = [name for name in sorted(self._datasets.keys())
+                 if skip is None or name not in skip]
+        if len(names) == 0:
+            return OrderedDict()
+        n_parallel = 1 if n_workers is None else \
+            max(1, min(n_workers, len(names)))
+        per_dataset = None if n_workers is None else \
+            n_workers // n_parallel
+        if per_dataset is not None and per_dataset < 2:
+            per_dataset = None
+        timings = OrderedDict()
+        if n_parallel == 1:
+            for name in tqdm.tqdm(names, desc="Datasets "):
+                temp_keys, n_files = self._loading_keys(name, keys)
+                start = time.time()
+                self._datasets[name].load(keys=temp_keys, n_files=n_files,
+                                          n_workers=per_dataset, **kwargs)
+                timings[name] = time.time() - start
+                self._track(name)
+                print('Loaded {} in {:.1f} s'.format(name, timings[name]))
+            return timings
+        if kwargs.get('lazy', False):
+            raise ValueError("Lazy loads can't be run in parallel processes.")
+        tmp_dir = tempfile.mkdtemp(prefix='load_all_')
+        try:
+            args_list = []
+            for name in names:
+                temp_keys, n_files = self._loading_keys(name, keys)
+                options = dict(kwargs, keys=temp_keys, n_files=n_files,
+                               n_workers=per_dataset)
+                args_list.append((self._datasets[name], options,
+                                  join(tmp_dir, name)))
+            with tqdm.tqdm(total=len(names), desc="Datasets ") as progress:
+                for i, result in _run_processes(_load_dataset, args_list,
+                                                n_parallel):
+                    name = names[i]
+                    self._datasets[name]._set_loaded(
+                        columnar.read_columnar(join(tmp_dir, name)),
+                        observables=result['observables'],
+                        files_loaded=result['files_loaded'])
+                    shutil.rmtree(join(tmp_dir, name))
+                    self._track(name)
+                    timings[name] = result['time']
+                    progress.update(1)
+                    print('Loaded {} in {:.1f} s'.format(name, timings[name]))
+        finally:
+            shutil.rmtree(tmp_dir)
+        return OrderedDict((name, timings[name]) for name in names)
+
+
+    def export(self, directory, backend='parquet', datasets=None):
+        ''' Export loaded data sets to files of a faster backend
+
+            Each data set is written to <directory>/<type>/<name>.<suffix>,
+            pointing the local_path of a .dataset file there makes
+            DataSet.load read it with the backend.
+
+            Args:
+                directory (str): Root directory of the exported files
+                backend (str): Name of a backend, e.g. 'parquet' or 'feather'
+                datasets (list): Types of the data sets to export, None
+                    exports all loaded ones
+
+            Returns:
+                Dict of data set type -> path of the written file
+        '''
+        suffix = get_backend_by_name(backend).suffixes[0]
+        paths = dict()
+        for name, dataset in self._iter_loaded():
+            if datasets is not None and name not in datasets:
+                continue
+            create_folder(join(directory, name))
+            paths[name] = join(directory, name,
+                               '{}.{}'.format(dataset.name, suffix))
+            dataset.export(paths[name], backend=backend)
+        return paths
 
 
     def info(self, include_setup=False):
@@ -240,16 +604,18 @@ class DataSetHandler(object):
                     print("\t\t{}".format(value))
             print("-------------------------")
 
-        for name, dataset in self._datasets.items():
-            print("{} is loaded: {}".format(name, dataset.loaded))
-            if dataset.loaded:
-                dataset.info()
+        created = dict(self._datasets.created())
+        for name in self._datasets.keys():
+            loaded = name in created and created[name].loaded
+            print("{} is loaded: {}".format(name, loaded))
+            if loaded:
+                created[name].info()
             print("-------------------------")
 
 
     def update(self):
-        ''' Update the json file '''
-        for set_name, dataset in self._datasets.items():
+        ''' Update the json files of the data sets created so far '''
+        for set_name, dataset in self._datasets.created():
             with open(self._dataset_paths[set_name],'w') as output:
                 json.dump(dataset.properties, output, sort_keys=True, indent=4,
                           separators=(',', ': '))
@@ -260,7 +626,7 @@ class DataSetHandler(object):
 
 class DataSet(object):
     ''' An object handling the data and meta-data of a given dataset. '''
-    def __init__(self, dataset, data_dir=DATA_DIR):
+    def __init__(self, dataset, data_dir=DATA_DIR, db_dir=DB_CACHE):
         # load properties from dataset json file
         if not isinstance(dataset, dict):
             if isinstance(dataset, str):
@@ -276,12 +642,23 @@ class DataSet(object):
         
         self.blacklist = dataset['blacklist'] if 'blacklist' in dataset \
                                               else None
+        self._weights = None
+        self._spill_path = None
+        # called whenever the data in memory grew, see _resized
+        self._on_resize = None
         self.data = None
         self._data_dir = data_dir
+        self._db_dir = db_dir
+        self._schema_index = None
         self.files_loaded = None
+        self._load_state = None
+        self._load_parts = []
         self.key_log = dict()
+        self.lazy_columns = None
         self.loaded = False 
-        self.n_files = check_type(dataset['n_files'], int, default=1.)
+        self._manifest = None
+        self._remote_listing = None
+        self.n_files = check_type(dataset.get('n_files'), int, default=1.)
         self.name = dataset['name']
         self._observables = None
         if 'local_path' in dataset.keys():
@@ -301,11 +678,20 @@ class DataSet(object):
     def __getitem__(self, observable):
         if self.loaded:
             return self.data[observable].values
+        elif self.lazy_columns is not None:
+            return self.lazy_columns[observable].values
         else:
             print("{} hasn't been loaded, yet.".format(self.name))
             return None
 
 
+    def __getstate__(self):
+        # the callback belongs to the handler of this process
+        state = self.__dict__.copy()
+        state['_on_resize'] = None
+        return state
+
+
     def __str__(self):
         output = ''
         for key, value in self.properties.items():
@@ -318,59 +704,48 @@ class DataSet(object):
                          filelist_only=False,
                          filelist=None,
                          local_dir=None,
+                         n_channels=4,
+                         retries=3,
+                         checksums=None,
                          ):
         ''' Connect to remote location to get/download filelist
 
+            Downloads run in n_channels parallel SFTP channels, resume
+            partial files and verify sizes and checksums, see
+            transfer.TransferEngine. The hostname 'file' copies from the
+            local file system.
+
             Args:
                 hostname (str): SSH Hostname of the remote server
                 remote_dir (str): Path of the source directory
                 filelist_only (bool): Get only a list of all files in the
                     remote dir, or download it
+                filelist (list): Names of the files to download
                 local_dir (str): Path to local download destination
+                n_channels (int): Number of files downloaded at once
+                retries (int): Attempts per file after the first one failed
+                checksums (dict): Expected md5 hex digests of file names
 
-            Warning:
-                Currently not working with Python 3
-        '''
-        # similar to http://stackoverflow.com/a/20381739 and
-        # https://gist.github.com/tell-k/4943359#file-paramiko_proxycommand_sample-py-L11
-        from contextlib import closing
-        import paramiko
-
-        config = paramiko.SSHConfig()
-
-        with open(expandvars('$HOME/.ssh/config')) as config_file:
-           config.parse(config_file)
-        host = config.lookup(hostname)
-
-        # connect
-        with closing(paramiko.SSHClient()) as client:
-            # load matching key
-            client.load_system_host_keys()
-            client.connect(host['hostname'],
-                           username=host['user'],
-                           key_filename=host['identityfile'],
-                           sock=paramiko.ProxyCommand(host.get('proxycommand')))
-            with closing(client.open_sftp()) as sftp:
-                sftp.chdir(remote_dir)
-                if filelist_only:
-                    remote_filelist = sftp.listdir()
-                    return np.array(remote_filelist)
-                else:
-                    if not local_dir is None:
-                        create_folder(local_dir)
-                        # cd to local destination directory
-                        os.chdir(local_dir)
-                    # download all files in it to local_dir directory
-                    for filename in tqdm(filelist,
-                                         desc="Downloading from Remote"):
-                        try:
-                            if not os.path.isfile(filename):
-                                sftp.get(join(remote_dir, filename), filename)
-                            else:
-                                print("{} already exists".format(filename))
-                        except IOError as e:
-                            print("IOError occured, this seems to happen sometimes.")
-                            print(e)
+            Returns:
+                Array of the remote file names if filelist_only, else dict
+                of file name -> 'downloaded', 'exists' or 'failed'
+
+            Raises:
+                transfer.TransferError if files failed after all retries
+        '''
+        engine = transfer.TransferEngine(transfer.get_backend(hostname),
+                                         n_channels=n_channels,
+                                         retries=retries)
+        try:
+            if filelist_only:
+                return np.array(engine.listdir(remote_dir))
+            if local_dir is None:
+                local_dir = self.path
+            return engine.download(remote_dir, filelist, local_dir,
+                                   checksums=checksums)
+        finally:
+            # the connection itself stays open for later calls
+            engine.close()
 
 
     def _get_weight_names(self, observables, weight_tab=None):
@@ -392,33 +767,224 @@ class DataSet(object):
 
 
     def _load_from_hdf(self, files, keys=None, exists_col=None,
-                       observables_only=False, **kwargs):
+                       observables_only=False, n_workers=None, cuts=None,
+                       compact=False, float64_cols=None, lazy=False,
+                       max_bytes=None, check_all=False, **kwargs):
         if ':' in self.path:
             raise NotImplementedError("Files are on a remote location. Loading to cache from remote isn't supported, yet.")
         file_list = [join(self.path, filename) for filename in files]
         try:
-            container = HDFContainer(exists_col=exists_col, file_list=file_list)
+            container = i3hdf_to_df.HDFContainer(exists_col=exists_col,
+                                     file_list=file_list,
+                                     n_workers=n_workers,
+                                     cuts=cuts,
+                                     compact=compact,
+                                     float64_cols=float64_cols)
         except:
             container = None
 
         if not container is None:
-            if not observables_only:
-                if keys is not None:
-                    self.data = container.get_df(keys)
-                    self._observables = keys
-                else:
-                    if self._observables is None:
+            with container:
+                if not observables_only:
+                    if keys is not None:
+                        self._observables = keys
+                    elif self._observables is None:
                         self._observables = container.get_observables(
-                            check_all=False, **kwargs)
-                    self.data = container.get_df(self._observables)
-                self.loaded = True
-            else:
-                self._observables = container.get_observables(check_all=False,
-                                                              **kwargs)
+                            check_all=check_all,
+                            schema_index=self.schema_index, **kwargs)
+                        self.schema_index.save()
+                    if lazy:
+                        self.data = None
+                        self.lazy_columns = i3hdf_to_df.LazyColumns(container,
+                                                        self._observables,
+                                                        max_bytes=max_bytes)
+                        self.loaded = False
+                    else:
+                        self.data = container.get_df(self._observables)
+                        self.lazy_columns = None
+                        self.loaded = True
+                else:
+                    self._observables = container.get_observables(
+                        check_all=check_all, schema_index=self.schema_index,
+                        **kwargs)
+                    self.schema_index.save()
         else:
             print("Error while loading")
 
 
+    @property
+    def columnar_path(self):
+        ''' Directory of the columnar store of this data set
+
+            Taken from the 'columnar_path' property, defaults to
+            <data_dir>/<name>.columnar.
+        '''
+        if 'columnar_path' in self.properties:
+            return expandvars(self.properties['columnar_path'])
+        return join(self._data_dir, '{}.{}'.format(self.name,
+                                                   COLUMNAR_SUFFIX))
+
+
+    def to_columnar(self, keys=None, exists_col=None, compact=False,
+                    float64_cols=None, path=None, **kwargs):
+        ''' Convert the data set into a memory mappable columnar store
+
+            Files are converted one after another, so the data set doesn't
+            need to fit into memory. Open the store with
+            load(from_columnar=True).
+
+            Args:
+                keys: List of observables to store, None stores all
+                exists_col (str): Column marking valid rows, see load
+                compact (bool): Store compact dtypes, see load
+                float64_cols (list): Observables keeping float64 if compact
+                path (str): Directory of the store, default columnar_path
+                kwargs:
+                    Surpass attributes to i3hdf_to_df.get_observables
+        '''
+        if ':' in self.path:
+            raise NotImplementedError("Files are on a remote location. Loading to cache from remote isn't supported, yet.")
+        files = np.array(self.files)
+        if not is_ending_in(HDF_SUFFIX, files):
+            raise TypeError("Only hdf files can be converted.")
+        if path is not None:
+            self.properties['columnar_path'] = path
+        container = i3hdf_to_df.HDFContainer(exists_col=exists_col,
+                                 file_list=[join(self.path, filename)
+                                            for filename in sorted(files)],
+                                 compact=compact,
+                                 float64_cols=float64_cols)
+        if keys is None:
+            keys = self.observables(**kwargs)
+        columnar.convert(container, keys, self.columnar_path)
+        print('Wrote {} observables of {} to {}'.format(
+            len(keys), self.name, self.columnar_path))
+
+
+    @property
+    def load_cache(self):
+        ''' Cache of load results in <db_dir>/load_cache '''
+        return loadcache.LoadCache(join(self._db_dir, LOAD_CACHE_DIR),
+                         max_bytes=LOAD_CACHE_MAX_BYTES)
+
+
+    def _load_cache_key(self, files, keys, **options):
+        ''' Everything determining the result of loading keys from files '''
+        file_stats = []
+        for filename in sorted(map(str, files)):
+            stat = os.stat(join(self.path, filename))
+            file_stats.append([filename, stat.st_size, stat.st_mtime])
+        return {'type': self.type,
+                'path': self.path,
+                'files': file_stats,
+                'keys': sorted(map(str, keys)) if keys is not None else None,
+                'options': options}
+
+
+    @property
+    def _loaded_path(self):
+        ''' Path of the json file tracking incrementally loaded files '''
+        return join(self._db_dir, '{}.{}'.format(self.type, LOADED_SUFFIX))
+
+
+    @property
+    def _loaded_dir(self):
+        ''' Directory holding one pickle per incremental load '''
+        return self._loaded_path + '.d'
+
+
+    def _restore_increments(self, state):
+        ''' Data and files of the increments stored for state
+
+            Returns:
+                (data, parts) or (None, []) if nothing or only something
+                else is stored
+        '''
+        stored = read_json(self._loaded_path, 'Load state')
+        if stored is None or stored.get('state') != state or \
+                'parts' not in stored:
+            return None, []
+        try:
+            data = [pd.read_pickle(join(self._loaded_dir, part['file']))
+                    for part in stored['parts']]
+        except (IOError, OSError):
+            print('Increments of {} are missing, reading all files.'.format(
+                self.name))
+            return None, []
+        data = pd.concat(data) if len(data) > 1 else data[0]
+        if stored['sort']:
+            data.sort_index(inplace=True)
+        return data, stored['parts']
+
+
+    def _store_increment(self, state, data, files, sort):
+        ''' Add data read from files to the increments in db_dir
+
+            The pickle is written first and renamed, the json listing the
+            increments last. Increments of a process dying in between aren't
+            listed and are ignored.
+        '''
+        if len(self._load_parts) == 0 and os.path.isdir(self._loaded_dir):
+            # increments of other keys or options
+            shutil.rmtree(self._loaded_dir)
+        create_folder(self._loaded_dir)
+        name = 'part_{}.pkl'.format(len(self._load_parts))
+        tmp_path = join(self._loaded_dir, name + '.tmp')
+        data.to_pickle(tmp_path)
+        os.rename(tmp_path, join(self._loaded_dir, name))
+        parts = self._load_parts + [{'file': name, 'files': files}]
+        if write_json(self._loaded_path,
+                      {'state': state, 'sort': sort, 'parts': parts,
+                       'files': [f for part in parts
+                                 for f in part['files']]},
+                      'Load state'):
+            self._load_parts = parts
+
+
+    def _load_incremental(self, files, keys=None, exists_col=None,
+                          n_workers=None, cuts=None, compact=False,
+                          float64_cols=None, **kwargs):
+        ''' Read only files not in files_loaded and append them to data
+
+            The data of every increment is written to its own pickle in
+            <db_dir>/<type>.loaded.d, <db_dir>/<type>.loaded lists them with
+            their files and the loading options. The data loaded in previous
+            sessions is restored from there.
+        '''
+        if keys is None:
+            keys = self.observables(**kwargs)
+        state = {'keys': sorted(map(str, keys)),
+                 'exists_col': exists_col,
+                 'cuts': [list(cut) for cut in cuts] if cuts else None,
+                 'compact': compact,
+                 'float64_cols': sorted(map(str, float64_cols or []))}
+        if self.data is None or self._load_state != state:
+            self.data, self._load_parts = self._restore_increments(state)
+            self.files_loaded = [f for part in self._load_parts
+                                 for f in part['files']]
+        self._load_state = state
+
+        loaded = set(self.files_loaded)
+        new_files = [str(f) for f in files if str(f) not in loaded]
+        if len(new_files) > 0:
+            print("Loading {} new files from {}".format(len(new_files),
+                                                        self.path))
+            previous = self.full_data
+            self._load_from_hdf(new_files, keys, exists_col=exists_col,
+                                n_workers=n_workers, cuts=cuts,
+                                compact=compact, float64_cols=float64_cols)
+            sort = len(set(i3hdf_to_df.ObservableName(obs_name=k).tab
+                           for k in keys)) > 1
+            self._store_increment(state, self.data, new_files, sort)
+            if previous is not None:
+                self.data = pd.concat([previous, self.data])
+                if sort:
+                    self.data.sort_index(inplace=True)
+            self.files_loaded = self.files_loaded + new_files
+        self._observables = keys
+        self.loaded = True
+
+
     def _load_from_i3(self, files, keys):
         file_list = [join(self.path, filename) for filename in files]
         if keys is None:
@@ -439,47 +1005,168 @@ class DataSet(object):
             path = self.path if path is None else path
             if ':' in path:
                 # hostname available
-                hostname, remote_dir = path.split(':')
-                self._files = self._get_from_remote(
-                    hostname,
-                    remote_dir,
-                    filelist_only=True)
+                self._files = self._drop_blacklisted(
+                    self.remote_listing.names)
             else:
-                self._files = np.array(listdir(path))
-            # only store files that aren't in the blacklist
-            blacklist = self.blacklist if not self.blacklist is None else []
-            blacklist.append('.DS_Store')
-            self._files = self._files[~np.in1d(self._files, blacklist)]
+                self._files = self._drop_blacklisted(self.manifest.names)
         return self._files
 
 
+    def _drop_blacklisted(self, files):
+        ''' Array of the files that aren't in the blacklist or partial
+            downloads
+        '''
+        blacklist = set(self.blacklist or []) | {'.DS_Store'}
+        return np.array([f for f in files if f not in blacklist and
+                         not f.endswith(transfer.PART_SUFFIX)], dtype=str)
+
+
+    @property
+    def manifest(self):
+        ''' Manifest of the files in the local path of this data set
+
+            Stored as <type>.manifest next to the .dataset files in db_dir
+            and refreshed if files were added or removed.
+        '''
+        if self._manifest is None:
+            if ':' in self.path:
+                raise IOError('{} is a remote location.'.format(self.path))
+            self._manifest = manifest.FileManifest(
+                join(self._db_dir, '{}.{}'.format(self.type,
+                                                  MANIFEST_SUFFIX)),
+                self.path)
+        return self._manifest
+
+
+    @property
+    def remote_listing(self):
+        ''' Cached listing of the remote path of this data set
+
+            Stored as <type>.listing next to the .dataset files in db_dir
+            and fetched again after listing_ttl seconds, see
+            transfer.RemoteListing.
+        '''
+        if self._remote_listing is None:
+            location = self.properties.get('remote_path')
+            if location is None or ':' not in location:
+                raise IOError('{} has no remote path.'.format(self.name))
+            self._remote_listing = transfer.RemoteListing(
+                join(self._db_dir, '{}.{}'.format(self.type,
+                                                  LISTING_SUFFIX)),
+                expandvars(location), ttl=self.listing_ttl)
+        return self._remote_listing
+
+
+    @property
+    def listing_ttl(self):
+        ''' Seconds a remote listing is cached, None caches it forever '''
+        return self.properties.get('listing_ttl', transfer.LISTING_TTL)
+
+
+    def refresh_remote(self, force=False):
+        ''' Fetch the remote listing if it expired or force is set
+
+            Returns:
+                True if the remote files changed
+        '''
+        changed = self.remote_listing.refresh(force=force)
+        if changed and ':' in self.path:
+            self._files = None
+        return changed
+
+
+    def refresh_files(self, force=False):
+        ''' Rescan the local path for changed files, see
+            manifest.FileManifest.refresh
+        '''
+        if self.manifest.refresh(force=force) or force:
+            self._files = None
+
+
+    @property
+    def schema_index(self):
+        ''' Persistent index of the schemas of the files of this data set
+
+            Stored as <type>.schema next to the .dataset files in db_dir.
+        '''
+        if self._schema_index is None:
+            self._schema_index = schema.SchemaIndex(
+                join(self._db_dir, '{}.{}'.format(self.type, SCHEMA_SUFFIX)))
+        return self._schema_index
+
+
+    def is_schema_indexed(self):
+        ''' True if the observables of this local hdf5 data set can be
+            taken from its schema index without opening a file
+        '''
+        if ':' in self.path or len(self.files) == 0 or \
+                not is_ending_in(HDF_SUFFIX, self.files):
+            return False
+        return len(self.schema_index.missing(
+            [join(self.path, self.files[0])])) == 0
+
+
     @property
     def size_on_disk(self):
+        ''' Size of the files in KiB, like du -s '''
         if 'size_on_disk' in self.properties.keys():
             self._size_on_disk = int(self.properties['size_on_disk'])
         else:
             if isdir(self.path):
-                self._size_on_disk = int(subprocess.check_output(['du', '-s',
-                    self.path]).split('\t')[0])
+                self._size_on_disk = int(math.ceil(
+                    self.manifest.size(self.files) / 1024.))
             else:
                 self._size_on_disk = 0
                 raise IOError('{} is no directory'.format(self.path))
         return self._size_on_disk
 
 
+    @property
+    def n_files(self):
+        ''' Number of files, taken from the manifest for local data sets
+            and from the n_files property otherwise
+        '''
+        if ':' not in self.path and isdir(self.path):
+            return len(self.files)
+        return self._n_files
+
+    @n_files.setter
+    def n_files(self, value):
+        self._n_files = value
+
+
+    @property
+    def n_events(self):
+        ''' Number of events in all hdf5 files, counted once per file '''
+        return self.manifest.n_events(self.files)
+
+
     @property
     def weights(self):
         ''' Stores the weights of a given data set '''
+        if self._spill_path is not None:
+            # the weights were spilled together with the data
+            self.restore()
         if self._weights is None:
             if self.loaded:
-                self._weights = self.data[self.weight_names]
+                self._weights = self.full_data[self.weight_names]
+            elif self.lazy_columns is not None:
+                self._weights = pd.concat([self.lazy_columns[w]
+                                           for w in self.weight_names], axis=1)
             else:
                 raise IOError("Data should be loaded first.")
-        return self._weights
+        if len(self._masks) == 0:
+            return self._weights
+        if self._weights_view is None:
+            self._weights_view = self._weights[self.mask]
+            self._resized()
+        return self._weights_view
 
     @weights.setter
     def weights(self, value):
+        ''' Weights of all events, regardless of the masks '''
         self._weights = value
+        self._weights_view = None
 
 
     @property
@@ -494,6 +1181,7 @@ class DataSet(object):
     def close(self):
         ''' Cut reference to data in order to free memory '''
         self.data = None
+        self.lazy_columns = None
         self.loaded = False
 
 
@@ -514,14 +1202,278 @@ class DataSet(object):
             else:
                 self.key_log[reason] += keys
             try:
-                self.data = self.data.drop(keys, axis=1)
+                self._data = self.full_data.drop(keys, axis=1)
+                self._view = None
+                self._weights_view = None
                 self._observables = [o for o in self.observables() if o not in keys]
             except ValueError:
                 print('Tried to remove some attributes, that didn\'t exist')
 
 
+    @property
+    def data(self):
+        ''' Loaded events passing all masks, see add_mask
+
+            The selected events are copied on first access after the masks
+            changed, full_data holds all events.
+        '''
+        data = self.full_data
+        if data is None or len(self._masks) == 0:
+            return data
+        if self._view is None:
+            self._view = data[self.mask]
+            self._resized()
+        return self._view
+
+    @data.setter
+    def data(self, value):
+        ''' Replace the loaded events, this removes all masks '''
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
+        self._data = value
+        self._masks = OrderedDict()
+        self._mask = None
+        self._view = None
+        self._weights_view = None
+        self._resized()
+
+
+    def _resized(self):
+        ''' Tell the handler the memory used by the data changed, so it
+            can spill other data sets
+        '''
+        if self._on_resize is not None:
+            self._on_resize()
+
+
+    @property
+    def full_data(self):
+        ''' All loaded events, regardless of the masks '''
+        if self._spill_path is not None:
+            self.restore()
+        return self._data
+
+
+    @property
+    def spilled(self):
+        ''' True if the data was moved to disk by spill '''
+        return self._spill_path is not None
+
+
+    def spill(self, directory):
+        ''' Move the loaded data to a file in directory to free memory
+
+            Masks are kept, the data and the weights are read back on the
+            next access.
+        '''
+        if self._data is None or self._spill_path is not None:
+            return
+        create_folder(directory)
+        handle, path = tempfile.mkstemp(prefix=self.type + '_',
+                                        suffix='.pkl', dir=directory)
+        os.close(handle)
+        # weights may have been set independently of the data
+        pd.to_pickle({'data': self._data, 'weights': self._weights}, path)
+        self._spill_path = path
+        self._data = None
+        self._view = None
+        self._weights = None
+        self._weights_view = None
+
+
+    def restore(self):
+        ''' Read back the data moved to disk by spill '''
+        path = self._spill_path
+        self._spill_path = None
+        spilled = pd.read_pickle(path)
+        self._data = spilled['data']
+        self._weights = spilled['weights']
+        os.remove(path)
+        self._resized()
+
+
+    @property
+    def nbytes(self):
+        ''' Memory used by the data, weights, selected views and lazy
+            columns
+        '''
+        total = sum(nbytes(value) for value in
+                    [self._data, self._view, self._weights,
+                     self._weights_view]
+                    if value is not None)
+        if self.lazy_columns is not None:
+            total += self.lazy_columns.nbytes
+        return total
+
+
+    @property
+    def masks(self):
+        ''' OrderedDict of mask name -> boolean array over full_data '''
+        return OrderedDict(self._masks)
+
+
+    @property
+    def mask(self):
+        ''' Boolean array of the events passing all masks, None without
+            masks
+        '''
+        if len(self._masks) == 0:
+            return None
+        if self._mask is None:
+            self._mask = np.logical_and.reduce(list(self._masks.values()))
+        return self._mask
+
+
+    def _masks_changed(self):
+        self._mask = None
+        self._view = None
+        self._weights_view = None
+
+
+    def add_mask(self, selection, name=None):
+        ''' Add a named mask of the events passing selection
+
+            The data isn't copied, data and weights only show the events
+            passing all masks. Adding a mask with an existing name replaces
+            it at its position in the cutflow.
+
+            Args:
+                selection (str, list or Selection): Expression like
+                    'L4.score > 0.9 & LineFit.zenith < 1.5' or list of tuples
+                    (key, operator, value)
+                name (str): Name of the mask, defaults to the selection
+
+            Returns:
+                Number of events passing all masks
+        '''
+        if not self.loaded:
+            raise RuntimeError('Load {} before applying a selection.'.format(
+                self.name))
+        selection = _selection.Selection(selection)
+        if name is None:
+            name = str(selection)
+        self._masks[name] = selection.mask(self.full_data)
+        self._masks_changed()
+        return int(self.mask.sum())
+
+
+    def remove_mask(self, name):
+        ''' Undo the mask name '''
+        del self._masks[name]
+        self._masks_changed()
+
+
+    def clear_masks(self):
+        ''' Undo all masks '''
+        self._masks = OrderedDict()
+        self._masks_changed()
+
+
+    def view(self, names=None):
+        ''' Copy of the events passing the masks names
+
+            Args:
+                names (list): Masks to apply, None applies all
+        '''
+        if names is None:
+            return self.data
+        data = self.full_data
+        mask = np.ones(len(data), dtype=bool)
+        for name in names:
+            mask &= self._masks[name]
+        return data[mask]
+
+
+    def apply_selection(self, selection, name=None):
+        ''' Keep only events passing selection in data and weights
+
+            The selection is added as mask, see add_mask, so it can be
+            undone with remove_mask without reloading.
+
+            Returns:
+                Number of events passing
+        '''
+        return self.add_mask(selection, name=name)
+
+
+    def cutflow(self, weight_names=None):
+        ''' Events passing the masks one after another
+
+            Args:
+                weight_names (list): Weight columns to sum, None uses
+                    weight_names
+
+            Returns:
+                DataFrame with a row for all events and one per mask in the
+                order they were added. Column 'events' counts the events
+                passing the mask and all before, the other columns are the
+                sums of the weights of these events.
+        '''
+        if not self.loaded:
+            raise RuntimeError('Load {} before creating a cutflow.'.format(
+                self.name))
+        if weight_names is None:
+            weight_names = self.weight_names
+        data = self.full_data
+        weights = data[weight_names].to_numpy(dtype=float, na_value=np.nan)
+        passing = np.ones(len(data), dtype=bool)
+        rows = []
+        for name, mask in [('all', None)] + list(self._masks.items()):
+            if mask is not None:
+                passing &= mask
+            rows.append([int(passing.sum())] +
+                        list(np.nansum(weights[passing], axis=0)))
+        return pd.DataFrame(rows, columns=['events'] + list(weight_names),
+                            index=pd.Index(['all'] + list(self._masks.keys()),
+                                           name='mask'))
+
+
+    def _reset_load_state(self):
+        ''' Forget the state of incremental loads, the next one restores
+            its data from db_dir or reads all files again
+        '''
+        self._load_state = None
+        self._load_parts = []
+        self.files_loaded = None
+
+
+    def _set_loaded(self, data, observables=None, files_loaded=None):
+        ''' Take data loaded elsewhere, e.g. in another process '''
+        self._reset_load_state()
+        self.data = data
+        self._observables = observables if observables is not None \
+            else list(data.columns)
+        self.lazy_columns = None
+        self.loaded = True
+        self.files_loaded = files_loaded
+        self._weights = self.data[self.weight_names]
+
+
+    def _choose_files(self, files, n_files=None, seed=None):
+        ''' Randomly choose n_files of files, None keeps all
+
+            The same seed always chooses the same files.
+        '''
+        if n_files is not None:
+            files = np.sort(files)
+            random_state = np.random.RandomState(seed) if seed is not None \
+                else np.random
+            # get n_files random indices for number of files to load
+            #rand_ind = np.random.randint(0, len(files), n_files)
+            rand_ind = random_state.choice(np.arange(0, len(files)), n_files,
+                                           replace=False)
+            files = files[rand_ind]
+            print("Loading the following files from {}:".format(self.path))
+            print(files)
+        return files
+
+
     def load(self, keys=None, n_files=None, to_cache=True, exists_col=None,
-             weight_tab=None, **kwargs):
+             weight_tab=None, n_workers=None, cuts=None, compact=False,
+             float64_cols=None, lazy=False, max_bytes=None,
+             incremental=False, cache=False, seed=None, from_columnar=False,
+             **kwargs):
         ''' Load i3 or hdf5 file in memory or on disc
 
             Args:
@@ -535,6 +1487,37 @@ class DataSet(object):
                 exists_col (str): Column with values determining if a algorithm
                     worked. If exists is 0 all other attributes for the event
                     are set to NaN.
+                n_workers (int): Number of processes reading files in
+                    parallel. None reads them one after another. With
+                    to_cache=False the number of files downloaded at once,
+                    4 by default.
+                cuts (list): Tuples (observable, operator, value) evaluated
+                    while reading, e.g. [('L4.score', '>', 0.9)]. Only events
+                    passing all cuts are loaded.
+                compact (bool): Load floats as float32, Run/Event/SubEvent as
+                    the smallest fitting unsigned integers and keep integer
+                    or bool columns masked by exists_col as nullable types,
+                    instead of float64 for everything.
+                float64_cols (list): Observables to keep as float64 in
+                    compact mode, e.g. ['weights.honda']
+                lazy (bool): Don't read any data yet, but load every
+                    observable (or all keys of a table) on its first access
+                    via dataset['Tab.col'] (or dataset['Tab']).
+                max_bytes (int): Memory budget of the lazily loaded columns,
+                    the least recently used ones are dropped above it.
+                incremental (bool): Only read files which aren't in
+                    files_loaded yet and append them to the data loaded
+                    before. The data of each increment is stored in db_dir,
+                    so this works across sessions. Loading other keys or
+                    options starts from scratch.
+                cache (bool): Take the result from the load cache in
+                    db_dir if the same files (and mtimes), keys and options
+                    were loaded before, else store it there.
+                seed (int): Seed for the random choice of n_files. Random
+                    choices are only cached with a seed.
+                from_columnar (bool): Memory map keys from the columnar store
+                    created by to_columnar instead of reading the files.
+                    No data is copied, processes share the page cache.
                 kwargs:
                     Surpass attributes to i3hdf_to_df.get_observables e.g.
                     blacklist_obs=['LineFit.x'], blacklist_tabs=['SplineMPE']
@@ -547,37 +1530,81 @@ class DataSet(object):
                 >>> load(keys=['LineFit.energy'])
 
         '''
+        if from_columnar:
+            self._reset_load_state()
+            self.data = columnar.read_columnar(self.columnar_path,
+                                               columns=keys, mmap=True)
+            self._observables = list(self.data.columns)
+            self.lazy_columns = None
+            self.loaded = True
+            self._weights = self.data[self.weight_names]
+            return
+        if incremental and (n_files is not None or lazy or not to_cache):
+            raise ValueError("Incremental loading reads all local files, "\
+                "it can't be combined with n_files, lazy or to_cache=False.")
+        if cache and (lazy or incremental):
+            raise ValueError("Lazy or incremental loads can't be cached.")
         if to_cache is True:
+            if incremental and not 'files' in self.properties:
+                # rescan the directory for new files
+                self.refresh_files()
             files = np.array(self.files)
         elif to_cache is False:
-            import sys
-            if sys.version_info.major > 2:
-                raise NotImplementedError("Since paramiko only works with python 2 "\
-                    "this function doesn't support python 3, as well.")
             # need to get file list from remote
-            hostname, remote_dir = self.properties['remote_path'].split(':')
-            files = np.array(self._get_from_remote(
-                        hostname,
-                        remote_dir,
-                        filelist_only=True))
-        if n_files is not None:
-            # get n_files random indices for number of files to load
-            #rand_ind = np.random.randint(0, len(files), n_files)
-            rand_ind = np.random.choice(np.arange(0, len(files)), n_files,
-                                        replace=False)
-            files = files[rand_ind]
-            print("Loading the following files from {}:".format(self.path))
-            print(files)
+            hostname, remote_dir = self.remote_listing.location.split(':')
+            files = self._drop_blacklisted(self.remote_listing.names)
+        files = self._choose_files(files, n_files, seed=seed)
 
         if to_cache is True:
-            if is_ending_in(HDF_SUFFIX, files):
-                self._load_from_hdf(files, keys, exists_col=exists_col,
-                                    **kwargs)
+            is_hdf = is_ending_in(HDF_SUFFIX, files)
+            if not incremental:
+                # these events don't continue an incremental load
+                self._reset_load_state()
+            if is_hdf and incremental:
+                self._load_incremental(files, keys, exists_col=exists_col,
+                                       n_workers=n_workers, cuts=cuts,
+                                       compact=compact,
+                                       float64_cols=float64_cols, **kwargs)
                 self._weights = self.data[self.weight_names]
+            elif is_hdf:
+                cache_key = None
+                if cache and n_files is not None and seed is None:
+                    print("Random file choices without seed aren't cached.")
+                elif cache:
+                    cache_key = self._load_cache_key(
+                        files, keys, exists_col=exists_col, cuts=cuts,
+                        compact=compact, float64_cols=float64_cols, **kwargs)
+                cached = None
+                if cache_key is not None:
+                    cached = self.load_cache.get(cache_key)
+                if cached is not None:
+                    self.data = cached
+                    self._observables = keys if keys is not None \
+                        else list(cached.columns)
+                    self.lazy_columns = None
+                    self.loaded = True
+                else:
+                    self._load_from_hdf(files, keys, exists_col=exists_col,
+                                        n_workers=n_workers, cuts=cuts,
+                                        compact=compact,
+                                        float64_cols=float64_cols, lazy=lazy,
+                                        max_bytes=max_bytes, **kwargs)
+                    if cache_key is not None:
+                        self.load_cache.put(cache_key, self.data)
+                self.files_loaded = [str(f) for f in files]
+                self._weights = None if lazy else self.data[self.weight_names]
             elif is_ending_in(I3_SUFFIX, files):
                 self._load_from_i3(files, keys)
             else:
-                raise TypeError("File ending unknown.")
+                self.data = get_backend(files).load([join(self.path, filename)
+                                          for filename in files],
+                                         keys=keys, cuts=cuts)
+                self._observables = keys if keys is not None \
+                    else list(self.data.columns)
+                self.lazy_columns = None
+                self.loaded = True
+                self.files_loaded = [str(f) for f in files]
+                self._weights = self.data[self.weight_names]
         elif to_cache is False:
             if 'local_path' in self.properties.keys():
                 local_path = expandvars(self.properties['local_path'])
@@ -585,14 +1612,63 @@ class DataSet(object):
                 local_path = join(self._data_dir, self.name)
                 self.properties['local_path'] = local_path
                 self.path = self.properties['local_path']
+                self._manifest = None
                 
-            #hostname, remote_dir = self.properties['remote_path'].split(':')
-            self._files = self._get_from_remote(
-                    hostname,
-                    remote_dir,
-                    filelist_only=False,
-                    filelist=files,
-                    local_dir=local_path)
+            self._get_from_remote(hostname,
+                                  remote_dir,
+                                  filelist_only=False,
+                                  filelist=files,
+                                  local_dir=local_path,
+                                  n_channels=n_workers or 4)
+            self.refresh_files()
+
+
+    def iter_load(self, keys=None, n_files=None, exists_col=None,
+                  chunk_rows=None, as_numpy=False, cuts=None, compact=False,
+                  float64_cols=None, **kwargs):
+        ''' Iterate over the data set in chunks instead of loading it
+
+            Args:
+                keys: List of attributes to load, None loads all observables
+                n_files (int): Number of files to load from available files in
+                    self.path. None loads all.
+                exists_col (str): Column with values determining if a algorithm
+                    worked. If exists is 0 all other attributes for the event
+                    are set to NaN, separately for every chunk.
+                chunk_rows (int): Maximum number of events per chunk. None
+                    yields one chunk per file.
+                as_numpy (bool): Yield numpy arrays instead of DataFrames
+                cuts (list): Tuples (observable, operator, value), only
+                    events passing all of them are read
+                compact (bool): Use compact dtypes, see load
+                float64_cols (list): Observables to keep as float64 in
+                    compact mode
+                kwargs:
+                    Surpass attributes to i3hdf_to_df.get_observables
+
+            Yields:
+                DataFrame (or numpy array) holding keys for a block of events
+
+            Examples:
+                >>> for chunk in iter_load(keys=['LineFit.energy']):
+                ...     hist += np.histogram(chunk['LineFit.energy'], bins)[0]
+        '''
+        if ':' in self.path:
+            raise NotImplementedError("Files are on a remote location. Loading to cache from remote isn't supported, yet.")
+        files = self._choose_files(np.array(self.files), n_files)
+        if not is_ending_in(HDF_SUFFIX, files):
+            raise TypeError("Only hdf files can be loaded in chunks.")
+        container = i3hdf_to_df.HDFContainer(exists_col=exists_col,
+                                 file_list=[join(self.path, filename)
+                                            for filename in files],
+                                 cuts=cuts,
+                                 compact=compact,
+                                 float64_cols=float64_cols)
+        if keys is None:
+            keys = self.observables(**kwargs)
+        for chunk in container.iter_chunks(keys, chunk_rows=chunk_rows,
+                                           as_numpy=as_numpy):
+            yield chunk
 
 
     def info(self):
@@ -604,10 +1680,37 @@ class DataSet(object):
             self.weights.shape[1]))
         print("\t\tUsed weights: {}".format(self.weight_names))
 
-    def observables(self, **kwargs):
+    def export(self, path, backend='parquet'):
+        ''' Write the loaded data to a file of the given backend
+
+            Args:
+                path (str): Path of the file to write
+                backend (str): Name of a backend in backends.BACKENDS,
+                    e.g. 'parquet' or 'feather'
+        '''
+        if not self.loaded:
+            raise IOError("Data should be loaded first.")
+        get_backend_by_name(backend).export(self.data, path)
+
+
+    def observables(self, check_all=False, **kwargs):
+        ''' Observables of the data set
+
+            Args:
+                check_all (bool): Intersect the observables of all files
+                    instead of taking those of the first one. Schemas come
+                    from the schema index, so only files which weren't
+                    indexed yet are opened.
+                kwargs: Blacklists passed to HDFContainer.get_observables
+        '''
+        if check_all:
+            # the stored observables may come from the first file only
+            self._observables = None
+        if self._observables is None and ':' not in self.path and \
+                not is_ending_in(HDF_SUFFIX + I3_SUFFIX, self.files):
+            self._observables = get_backend(self.files).observables(
+                [join(self.path, filename) for filename in self.files])
         if self._observables is None:            
-            if len(kwargs.keys()) > 0:
-                self._load_from_hdf(self.files, observables_only=True, **kwargs)
-            else:
-                self._load_from_hdf(self.files, observables_only=True)
+            self._load_from_hdf(self.files, observables_only=True,
+                                check_all=check_all, **kwargs)
         return self._observables
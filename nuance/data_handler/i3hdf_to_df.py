@@ -4,11 +4,18 @@
 from __future__ import division, print_function
 
 import glob
-import warnings
-import numpy as np
-import tables
-import pandas as pd
-from tqdm import tqdm
+from collections import OrderedDict
+from functools import partial, reduce, wraps
+from multiprocessing import Pool
+
+from ..lazy import lazy_import
+from .lrucache import LRUCache, nbytes
+from .schema import scan_schema
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+tables = lazy_import('tables')
+tqdm = lazy_import('tqdm')
 
 class ObservableName(object):
     def __init__(self,
@@ -67,11 +74,420 @@ def split_obs_str(obs):
         obs_dict[key] = current_content
     return obs_dict
 
-def get_values_from_table(table, cols, dtype=float):
-    values = np.empty((table.nrows, len(cols)), dtype=float)
-    for i, row in enumerate(table.iterrows()):
-        values[i, :] = [row[col] for col in cols]
-    return values
+def get_values_from_table(table, cols, dtype=float, start=None, stop=None,
+                          out=None, block_rows=65536, coords=None):
+    ''' Read cols of a PyTables table with bulk record reads
+
+        The rows are read in blocks of whole records, each block is copied
+        column wise into the result, so every row is decoded only once.
+
+        Args:
+            table (tables.Table): Table to read from
+            cols (list): Columns to read
+            dtype: dtype of the 2d result array. None keeps the dtypes of the
+                columns and returns a structured array with fields cols.
+            start (int): First row to read, None starts at the beginning
+            stop (int): Row to stop before, None reads to the end
+            out: Array to read into instead of allocating the result. Either
+                of the shape/dtype the result would have or a list of one
+                1d array per column.
+            block_rows (int): Number of rows read at once
+            coords (array): Row indices to read instead of start:stop
+
+        Returns:
+            out or the newly allocated array with n_rows x len(cols) values
+    '''
+    if coords is None:
+        start, stop, _ = slice(start, stop).indices(table.nrows)
+        n_rows = max(stop - start, 0)
+    else:
+        n_rows = len(coords)
+    if out is None:
+        if dtype is None:
+            out = np.empty(n_rows,
+                           dtype=[(col, table.coldtypes[col]) for col in cols])
+        else:
+            out = np.empty((n_rows, len(cols)), dtype=dtype, order='F')
+    if isinstance(out, (list, tuple)):
+        targets = out
+    elif out.dtype.names is not None:
+        targets = [out[col] for col in cols]
+    else:
+        targets = [out[:, i] for i in range(len(cols))]
+    for target in targets:
+        if len(target) != n_rows:
+            raise ValueError('out needs to hold {} rows, got {}.'.format(
+                n_rows, len(target)))
+    for block_start in range(0, n_rows, block_rows):
+        block_stop = min(block_start + block_rows, n_rows)
+        if coords is None:
+            records = table.read(start + block_start, start + block_stop)
+        else:
+            records = table.read_coordinates(coords[block_start:block_stop])
+        for col, target in zip(cols, targets):
+            target[block_start:block_stop] = records[col]
+    return out
+
+def pack_ids(id_arrays, bounds):
+    ''' Pack the id columns of an event into a single int64 key
+
+        Keys sort in the same lexicographic order as the id tuples, the
+        first id column ending up in the most significant bits.
+
+        Args:
+            id_arrays (list): One integer array per id column
+            bounds (list): (min, max) of every id column over all tables
+
+        Returns:
+            int64 array of keys or None if the ids don't fit into 63 bits
+    '''
+    bits = [int(hi - lo).bit_length() for lo, hi in bounds]
+    if sum(bits) > 63:
+        return None
+    keys = np.zeros(len(id_arrays[0]), dtype=np.int64)
+    for ids, (lo, _), n_bits in zip(id_arrays, bounds, bits):
+        keys <<= n_bits
+        keys |= ids.astype(np.int64) - lo
+    return keys
+
+
+def unpack_ids(keys, bounds):
+    ''' Inverse of pack_ids, returns one int64 array per id column '''
+    bits = [int(hi - lo).bit_length() for lo, hi in bounds]
+    id_arrays = []
+    for (lo, _), n_bits in zip(bounds[::-1], bits[::-1]):
+        id_arrays.append((keys & ((1 << n_bits) - 1)) + lo)
+        keys = keys >> n_bits
+    return id_arrays[::-1]
+
+
+def id_dtype(id_range):
+    ''' Smallest dtype holding ids in id_range (min, max), None if they are
+        negative
+    '''
+    lo, hi = id_range
+    if lo < 0:
+        return None
+    return np.min_scalar_type(hi)
+
+
+def to_nullable(values, mask):
+    ''' Nullable pandas array of integer or bool values, missing where mask '''
+    if values.dtype.kind == 'b':
+        return pd.arrays.BooleanArray(values, mask)
+    return pd.arrays.IntegerArray(values, mask)
+
+
+def scatter_nullable(values, positions, n_rows):
+    ''' Nullable array of length n_rows holding values at positions '''
+    dtype = getattr(values.dtype, 'numpy_dtype', values.dtype)
+    data = np.zeros(n_rows, dtype=dtype)
+    mask = np.ones(n_rows, dtype=bool)
+    data[positions] = np.asarray(values.to_numpy(dtype=dtype, na_value=0)
+                                 if not isinstance(values, np.ndarray)
+                                 else values)
+    mask[positions] = pd.isna(values)
+    return to_nullable(data, mask)
+
+
+def merge_tables(tabs, compact=False):
+    ''' Outer join DataFrames sharing the same id MultiIndex in one pass
+
+        The ids of every table are packed into int64 keys, the sorted union
+        of all keys becomes the new index and each column is scattered into
+        a preallocated array of that length. Columns of tables already
+        holding the sorted union in order are reused without copying. The
+        result equals chaining DataFrame.join(how='outer') over tabs; if ids
+        are duplicated or don't fit into 63 bits the chained join is used
+        instead.
+
+        To keep the peak memory low, the entries of tabs are set to None
+        once their columns are merged, so tables only referenced by the list
+        are freed one by one.
+
+        Args:
+            tabs (list): DataFrames indexed by the same id columns, emptied
+                while merging
+            compact (bool): Keep integer and bool columns of events missing
+                in a table as nullable types instead of upcasting them
+
+        Returns:
+            DataFrame holding the columns of all tabs
+    '''
+    if len(tabs) == 1:
+        return tabs[0]
+    n_levels = tabs[0].index.nlevels
+    index_names = tabs[0].index.names
+    index_dtypes = [np.result_type(*[tab.index.levels[i].dtype
+                                     for tab in tabs])
+                    for i in range(n_levels)]
+    id_arrays = [[np.asarray(tab.index.get_level_values(i))
+                  for i in range(n_levels)] for tab in tabs]
+    bounds = []
+    for i in range(n_levels):
+        level = [ids[i] for ids in id_arrays if len(ids[i]) > 0]
+        if len(level) == 0:
+            bounds.append((0, 0))
+        else:
+            bounds.append((min(int(ids.min()) for ids in level),
+                           max(int(ids.max()) for ids in level)))
+    keys = [pack_ids(ids, bounds) for ids in id_arrays]
+    if any(k is None or len(np.unique(k)) != len(k) for k in keys):
+        return reduce(lambda df, tab: df.join(tab, how='outer'), tabs)
+
+    del id_arrays
+    union = np.unique(np.concatenate(keys))
+    columns = OrderedDict()
+    for i, tab_keys in enumerate(keys):
+        tab = tabs[i]
+        complete = len(tab_keys) == len(union)
+        if complete and np.all(tab_keys[1:] > tab_keys[:-1]):
+            # the table holds the sorted union already
+            for col in tab.columns:
+                columns[col] = tab[col].values
+            tabs[i] = None
+            continue
+        positions = np.searchsorted(union, tab_keys)
+        for col in tab.columns:
+            values = tab[col].values
+            if compact and values.dtype.kind in 'iub' and \
+                    not (complete and isinstance(values, np.ndarray)):
+                columns[col] = scatter_nullable(values, positions, len(union))
+                continue
+            if complete:
+                col_values = np.empty(len(union), dtype=values.dtype)
+            elif values.dtype.kind in 'fc':
+                col_values = np.full(len(union), np.nan, dtype=values.dtype)
+            elif values.dtype.kind in 'iu':
+                col_values = np.full(len(union), np.nan)
+            else:
+                col_values = np.full(len(union), np.nan, dtype=object)
+            col_values[positions] = values
+            columns[col] = col_values
+        # release the table's columns before the next table is scattered
+        tab = values = None
+        tabs[i] = None
+    index = pd.MultiIndex.from_arrays(
+        [ids.astype(dtype) for ids, dtype
+         in zip(unpack_ids(union, bounds), index_dtypes)],
+        names=index_names)
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def filter_observables(schema,
+                       blacklist_tabs=[],
+                       blacklist_cols=[],
+                       blacklist_obs=[]):
+    ''' Set of observables of a file schema except blacklisted ones
+
+        Args:
+            schema (dict): Table name -> list of [column name, dtype], as
+                returned by schema.scan_schema
+    '''
+    file_set = set()
+    for table_name, columns in schema.items():
+        #if table_name not in blacklist_tabs:
+        if not any([tab in table_name for tab in blacklist_tabs]):
+            col_names = [c for c, _ in columns if c not in blacklist_cols]
+            for c in col_names:
+                obs = ObservableName(table_name=table_name, col_name=c)
+                if obs not in blacklist_obs:
+                    file_set.add(obs)
+    return file_set
+
+
+def get_file_observables(file_name,
+                         blacklist_tabs=[],
+                         blacklist_cols=[],
+                         blacklist_obs=[]):
+    ''' Set of observables of all tables in file_name except blacklisted '''
+    return filter_observables(scan_schema(file_name),
+                              blacklist_tabs=blacklist_tabs,
+                              blacklist_cols=blacklist_cols,
+                              blacklist_obs=blacklist_obs)
+
+
+def get_id_range(file_name, table_key, id_cols):
+    ''' (min, max) of each of id_cols in table_key of file_name, None if
+        the table is empty or the ids aren't integers
+    '''
+    with tables.open_file(file_name, 'r') as f:
+        table = f.get_node('/', table_key)
+        if table.nrows == 0 or any(table.coldtypes[col].kind not in 'iu'
+                                   for col in id_cols):
+            return None
+        ranges = []
+        for col in id_cols:
+            ids = table.col(col)
+            ranges.append((int(ids.min()), int(ids.max())))
+        return ranges
+
+
+def get_n_rows(file_name, table_key):
+    ''' Number of rows of table_key in file_name, read from metadata '''
+    with tables.open_file(file_name, 'r') as f:
+        return f.get_node('/', table_key).nrows
+
+
+CUT_OPERATORS = ['==', '!=', '>=', '<=', '>', '<']
+
+
+def create_cut_dict(cuts):
+    ''' Group cuts [(observable, operator, value), ...] by table
+
+        Returns:
+            OrderedDict of table name -> list of (col, operator, value)
+    '''
+    cut_dict = OrderedDict()
+    for obs, operator, value in cuts:
+        if operator not in CUT_OPERATORS:
+            raise ValueError('Operator has to be: {}'.format(
+                ', '.join(CUT_OPERATORS)))
+        if not isinstance(obs, ObservableName):
+            obs = ObservableName(obs_name=obs)
+        cut_dict.setdefault(obs.tab, []).append((obs.col, operator, value))
+    return cut_dict
+
+
+def get_cut_condition(table, cuts, exists_col=None):
+    ''' In-kernel condition and condvars selecting the rows passing cuts
+
+        If the table holds exists_col, rows where it is 0 are treated like
+        the NaNs they become after loading: they only pass '!=' cuts.
+    '''
+    conditions = []
+    condvars = {}
+    for i, (col, operator, value) in enumerate(cuts):
+        condvars['c%d' % i] = table.cols._f_col(col)
+        condvars['v%d' % i] = value
+        condition = '(c{0} {1} v{0})'.format(i, operator)
+        if exists_col is not None and exists_col in table.colnames:
+            condvars['exists'] = table.cols._f_col(exists_col)
+            if operator == '!=':
+                condition = '({} | (exists == 0))'.format(condition)
+            else:
+                condition = '({} & (exists != 0))'.format(condition)
+        conditions.append(condition)
+    return ' & '.join(conditions), condvars
+
+
+def _read_ids(table, id_cols, coords=None):
+    ''' MultiIndex of the id_cols of the rows coords of table '''
+    ids = get_values_from_table(table, id_cols, dtype=None, coords=coords)
+    return pd.MultiIndex.from_arrays([ids[c] for c in id_cols])
+
+
+def get_passing_events(file_name, cut_dict, id_cols, exists_col=None):
+    ''' Events of file_name passing all cuts
+
+        The cuts of each table are evaluated with one in-kernel query.
+        Events missing in a cut table are treated like the NaNs they become
+        after loading: they only pass if all cuts on that table are '!='.
+
+        Args:
+            file_name (str): Path to the hdf5 file
+            cut_dict (dict): Cuts as returned by create_cut_dict
+            id_cols (list): Columns identifying an event
+            exists_col (str): Column marking rows as valid
+
+        Returns:
+            Dict with 'include', the ids all passing events are in (None if
+            every event may pass), 'exclude', the ids of events failing a
+            cut (None if there are none), and 'coords', table name ->
+            passing rows for tables whose rows follow from their own cuts
+    '''
+    include = None
+    exclude = None
+    coords_dict = dict()
+    with tables.open_file(file_name, 'r') as f:
+        for cut_key, cuts in cut_dict.items():
+            cut_table = f.get_node('/', cut_key)
+            condition, condvars = get_cut_condition(cut_table, cuts,
+                                                    exists_col)
+            coords = cut_table.get_where_list(condition, condvars, sort=True)
+            if len(cut_dict) == 1:
+                coords_dict[cut_key] = coords
+            if all(operator == '!=' for _, operator, _ in cuts):
+                # missing events pass, so only exclude the failing ones
+                failing = np.ones(cut_table.nrows, dtype=bool)
+                failing[coords] = False
+                ids = _read_ids(cut_table, id_cols,
+                                coords=np.flatnonzero(failing))
+                exclude = ids if exclude is None else exclude.union(ids)
+            else:
+                ids = _read_ids(cut_table, id_cols, coords=coords)
+                include = ids if include is None else \
+                    include.intersection(ids)
+    return {'include': include, 'exclude': exclude, 'coords': coords_dict}
+
+
+def get_cut_coordinates(file_name, table_key, cut_dict, id_cols,
+                        exists_col=None, passing=None):
+    ''' Rows of table_key in file_name belonging to events passing all cuts
+
+        Args:
+            file_name (str): Path to the hdf5 file
+            table_key (str): Name of the table to get the rows of
+            cut_dict (dict): Cuts as returned by create_cut_dict
+            id_cols (list): Columns identifying an event
+            exists_col (str): Column marking rows as valid
+            passing (dict): Result of get_passing_events for file_name, it
+                is evaluated if None
+
+        Returns:
+            Sorted array of row indices of table_key
+    '''
+    if passing is None:
+        passing = get_passing_events(file_name, cut_dict, id_cols,
+                                     exists_col)
+    if table_key in passing['coords']:
+        return passing['coords'][table_key]
+    with tables.open_file(file_name, 'r') as f:
+        ids = _read_ids(f.get_node('/', table_key), id_cols)
+    selected = np.ones(len(ids), dtype=bool)
+    if passing['include'] is not None:
+        selected &= ids.isin(passing['include'])
+    if passing['exclude'] is not None:
+        selected &= ~ids.isin(passing['exclude'])
+    return np.flatnonzero(selected)
+
+
+def read_fields(file_name, table_key, fields, out=None, coords=None):
+    ''' Read fields of table_key in file_name
+
+        Args:
+            file_name (str): Path to the hdf5 file
+            table_key (str): Name of the table in the file
+            fields (list): Columns to read
+            out (list): Optional arrays, one per field, to read into
+            coords (array): Only read these rows
+
+        Returns:
+            List of arrays, one per field
+    '''
+    with tables.open_file(file_name, 'r') as f:
+        table = f.get_node('/', table_key)
+        if out is None:
+            n_rows = table.nrows if coords is None else len(coords)
+            out = [np.empty(n_rows, dtype=table.coldtypes[field])
+                   for field in fields]
+        return get_values_from_table(table, fields, out=out, coords=coords)
+
+
+def _star_call(args):
+    ''' Unpack (func, args) tuples for Pool.imap '''
+    func, args = args
+    return func(*args)
+
+
+def _pooled(method):
+    ''' Share one process pool among all reads of an HDFContainer method '''
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class HDFContainer:
     def __init__(self,
@@ -80,7 +496,33 @@ class HDFContainer:
                  id_cols=['Run',
                           'Event',
                           'SubEvent'],
-                 exists_col=None):
+                 exists_col=None,
+                 n_workers=None,
+                 cuts=None,
+                 compact=False,
+                 float64_cols=None):
+        ''' Access tables of a list of I3TableWriter hdf5 files
+
+            Args:
+                file_list (list): Paths of the hdf5 files
+                directory (str): Glob pattern to get file_list from
+                id_cols (list): Columns identifying an event
+                exists_col (str): Column marking rows as valid, rows where it
+                    is 0 are set to NaN
+                n_workers (int): Number of processes reading files in
+                    parallel. None or 1 reads files one after another. The
+                    pool is started once per call, use the container as
+                    context manager to share it among several calls.
+                cuts (list): Tuples (observable, operator, value), e.g.
+                    [('L4.score', '>', 0.9)]. Only events passing all cuts
+                    are read.
+                compact (bool): Store float columns as float32, id_cols in
+                    the smallest fitting unsigned integer and integer/bool
+                    columns masked by exists_col as nullable types instead
+                    of upcasting everything to float64.
+                float64_cols (list): Observables keeping float64 in compact
+                    mode
+        '''
         assert (directory is not None) or (file_list is not None), \
             'If component is not from aggregation directory or file_list'\
             'is needed!'
@@ -91,66 +533,329 @@ class HDFContainer:
         self.file_list = file_list
         self.id_cols = id_cols
         self.exists_col = exists_col
+        self.n_workers = n_workers
+        self.cut_dict = create_cut_dict(cuts) if cuts else None
+        # file name -> events passing the cuts, see get_passing_events
+        self._passing = dict()
+        self.compact = compact
+        self.float64_cols = set(map(str, float64_cols or []))
+        # table key -> (min, max) of each id col in all files, see id_dtypes
+        self._id_ranges = dict()
+        # process pool of _imap, kept until the outermost with block exits
+        self._pool = None
+        self._pool_users = 0
+
+    def __enter__(self):
+        ''' Keep the process pool alive for all reads inside the block '''
+        self._pool_users += 1
+        return self
 
+    def __exit__(self, *exc_info):
+        self._pool_users -= 1
+        if self._pool_users == 0:
+            self.close()
+
+    def close(self):
+        ''' Terminate the process pool '''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _imap(self, func, args_list):
+        ''' Ordered map of func over args_list, in a process pool if
+            n_workers > 1. Results are yielded in the order of args_list.
+        '''
+        if self.n_workers is None or self.n_workers < 2 or \
+                len(args_list) < 2:
+            for args in args_list:
+                yield func(*args)
+        else:
+            with self:
+                if self._pool is None:
+                    self._pool = Pool(self.n_workers)
+                for result in self._pool.imap(
+                        _star_call, [(func, args) for args in args_list]):
+                    yield result
+
+    @_pooled
     def get_observables(self,
                         blacklist_tabs=[],
                         blacklist_cols=[],
                         blacklist_obs=[],
                         check_all=False,
-                        return_str=False):
-        component_set = set()
+                        return_str=False,
+                        schema_index=None):
+        ''' Observables present in all (or the first) files
+
+            Args:
+                blacklist_tabs (list): Skip tables containing these strings
+                blacklist_cols (list): Skip these columns in all tables
+                blacklist_obs (list): Skip these observables
+                check_all (bool): Intersect observables of all files instead
+                    of only using the first one
+                schema_index (schema.SchemaIndex): Index to take file schemas
+                    from instead of opening the files. Files not indexed yet
+                    are scanned and added to it.
+
+            Returns:
+                Sorted list of ObservableName
+        '''
         if check_all:
             files = self.file_list
         else:
             files = self.file_list[:1]
-        for i, file_name in enumerate(files):
-            file_set = set()
-            f = tables.open_file(file_name)
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore')
-                for table in f.iter_nodes('/', classname='Table'):
-                    table_name = table.name
-                    #if table_name not in blacklist_tabs:
-                    if not any([tab in table_name for tab in blacklist_tabs]):
-                        col_names = [c for c in table.colnames
-                                     if c not in blacklist_cols]
-                        for c in col_names:
-                            obs = ObservableName(table_name=table_name,
-                                                 col_name=c)
-                            if obs not in blacklist_obs:
-                                file_set.add(obs)
-                f.close()
-                if i == 0:
-                    component_set = file_set
-                else:
-                    component_set = component_set.intersection(file_set)
+        if schema_index is not None:
+            missing = schema_index.missing(files)
+            for file_name, schema in zip(missing, self._imap(
+                    scan_schema, [(file_name,) for file_name in missing])):
+                schema_index.update(file_name, schema)
+            file_sets = (filter_observables(schema_index.get(file_name),
+                                            blacklist_tabs=blacklist_tabs,
+                                            blacklist_cols=blacklist_cols,
+                                            blacklist_obs=blacklist_obs)
+                         for file_name in files)
+        else:
+            file_sets = self._imap(get_file_observables,
+                                   [(file_name, blacklist_tabs,
+                                     blacklist_cols, blacklist_obs)
+                                    for file_name in files])
+        component_set = set()
+        for i, file_set in enumerate(file_sets):
+            if i == 0:
+                component_set = file_set
+            else:
+                component_set = component_set.intersection(file_set)
         return sorted(component_set)
 
-    def get_values(self, table_key, cols):
+    def _get_fields(self, table, cols):
+        ''' Columns of table needed to serve cols, in on-disk order '''
+        needed = set(cols) | set(self.id_cols)
+        if self.exists_col is not None:
+            needed.add(self.exists_col)
+        return [c for c in table.colnames if c in needed]
+
+    def id_dtypes(self, table_keys):
+        ''' dtypes of the id_cols holding the ids of table_keys in all files
+
+            In compact mode the ids are narrowed to the smallest dtype
+            fitting the ids of all files, so every frame of a load has the
+            same index dtypes, whichever file or chunk it was read from.
+            The ranges are read once per table.
+
+            Returns:
+                dict id col -> dtype, None if not compact
+        '''
+        if not self.compact:
+            return None
+        missing = [table_key for table_key in table_keys
+                   if table_key not in self._id_ranges]
+        for table_key in missing:
+            ranges = [r for r in self._imap(
+                get_id_range, [(file_name, table_key, self.id_cols)
+                               for file_name in self.file_list])
+                      if r is not None]
+            self._id_ranges[table_key] = [
+                (min(r[i][0] for r in ranges), max(r[i][1] for r in ranges))
+                for i in range(len(self.id_cols))] if ranges else None
+        ranges = [self._id_ranges[table_key] for table_key in table_keys
+                  if self._id_ranges[table_key] is not None]
+        dtypes = dict()
+        for i, col in enumerate(self.id_cols):
+            if len(ranges) > 0:
+                dtype = id_dtype((min(r[i][0] for r in ranges),
+                                  max(r[i][1] for r in ranges)))
+                if dtype is not None:
+                    dtypes[col] = dtype
+        return dtypes
+
+    def read_table(self, file_name, table_key, cols, id_dtypes=None):
+        ''' Read only the requested columns of a table from disk
+
+            Only cols, the id_cols and the exists_col are kept from the bulk
+            record reads instead of the whole table.
+
+            Args:
+                file_name (str): Path to the hdf5 file
+                table_key (str): Name of the table in the file
+                cols (list): Columns of the table to read
+                id_dtypes (dict): dtypes of the id_cols, None takes
+                    id_dtypes([table_key])
+
+            Returns:
+                DataFrame indexed by id_cols
+        '''
+        if id_dtypes is None:
+            id_dtypes = self.id_dtypes([table_key])
+        with tables.open_file(file_name, 'r') as f:
+            table = f.get_node('/', table_key)
+            fields = self._get_fields(table, cols)
+            coords = None
+            if self.cut_dict is not None:
+                coords = get_cut_coordinates(
+                    file_name, table_key, self.cut_dict, self.id_cols,
+                    self.exists_col, self._get_passing([file_name])[0])
+            n_rows = table.nrows if coords is None else len(coords)
+            data = np.empty(n_rows, dtype=[
+                (field, self._field_dtype(table_key, field,
+                                          table.coldtypes[field]))
+                for field in fields])
+            get_values_from_table(table, fields, out=data, coords=coords)
+        return self._to_frame(OrderedDict((f, data[f]) for f in fields),
+                              id_dtypes)
+
+    def _field_dtype(self, table_key, field, dtype):
+        ''' dtype to hold field of table_key in, narrowed in compact mode '''
+        if self.compact and dtype.kind == 'f' and dtype.itemsize > 4 and \
+                field not in self.id_cols and \
+                '%s.%s' % (table_key, field) not in self.float64_cols:
+            return np.dtype(np.float32)
+        return dtype
+
+    def _to_frame(self, columns, id_dtypes=None):
+        ''' DataFrame of the column arrays in columns, indexed by id_cols
+            cast to id_dtypes
+        '''
+        for col, dtype in (id_dtypes or {}).items():
+            columns[col] = columns[col].astype(dtype, copy=False)
+        values = pd.DataFrame(columns, copy=False)
+        values.set_index(self.id_cols, inplace=True)
+        return values
+
+    @_pooled
+    def get_n_rows(self, table_key):
+        ''' Number of rows of table_key in each file, read from metadata '''
+        return list(self._imap(get_n_rows,
+                               [(file_name, table_key)
+                                for file_name in self.file_list]))
+
+    def _get_passing(self, file_list):
+        ''' Events passing the cuts for each file of file_list
+
+            The cuts are evaluated once per file, all tables read later
+            select their rows from the stored ids.
+        '''
+        missing = [file_name for file_name in file_list
+                   if file_name not in self._passing]
+        for file_name, passing in zip(missing, self._imap(
+                get_passing_events,
+                [(file_name, self.cut_dict, self.id_cols, self.exists_col)
+                 for file_name in missing])):
+            self._passing[file_name] = passing
+        return [self._passing[file_name] for file_name in file_list]
+
+    @_pooled
+    def get_cut_coordinates(self, table_key):
+        ''' Rows of table_key passing the cuts, for each file '''
+        return list(self._imap(get_cut_coordinates,
+                               [(file_name, table_key, self.cut_dict,
+                                 self.id_cols, self.exists_col, passing)
+                                for file_name, passing in zip(
+                                    self.file_list,
+                                    self._get_passing(self.file_list))]))
+
+    @_pooled
+    def get_values(self, table_key, cols, id_dtypes=None):
+        ''' Read cols of table_key from all files into a single DataFrame
+
+            The row counts of all files are read first, so every column is
+            filled into one preallocated buffer instead of growing a
+            DataFrame file by file. With n_workers > 1 the files are read in
+            a process pool and copied into the buffers in file order.
+            With cuts only the rows of events passing them are read.
+            id_dtypes are passed to read_table.
+        '''
+        if id_dtypes is None:
+            id_dtypes = self.id_dtypes([table_key])
         if isinstance(cols, str):
             cols = [cols]
-        for i, file_name in enumerate(self.file_list):
-            f = pd.HDFStore(file_name, 'r')
-            table = f[table_key]
-            drops = [c for c in table.columns
-                     if c not in cols and c not in self.id_cols and
-                     c != self.exists_col]
-            table.drop(drops, axis=1, inplace=True)
-            table.set_index(self.id_cols, inplace=True)
-            f.close()
-            if i == 0:
-                values = table
-            else:
-                values = values.append(table)
+        if len(self.file_list) == 0:
+            raise IOError('No files to read {} from.'.format(table_key))
+        if self.cut_dict is None:
+            coords = [None] * len(self.file_list)
+            offsets = np.cumsum([0] + self.get_n_rows(table_key))
+        else:
+            coords = self.get_cut_coordinates(table_key)
+            offsets = np.cumsum([0] + [len(c) for c in coords])
+        with tables.open_file(self.file_list[0], 'r') as f:
+            table = f.get_node('/', table_key)
+            buffers = OrderedDict(
+                (field, np.empty(offsets[-1], dtype=self._field_dtype(
+                    table_key, field, table.coldtypes[field])))
+                for field in self._get_fields(table, cols))
+        fields = list(buffers.keys())
+        if self.n_workers is None or self.n_workers < 2:
+            for file_name, file_coords, start, stop in zip(self.file_list,
+                                                           coords,
+                                                           offsets[:-1],
+                                                           offsets[1:]):
+                read_fields(file_name, table_key, fields,
+                            out=[buf[start:stop] for buf in buffers.values()],
+                            coords=file_coords)
+        else:
+            chunks = self._imap(read_fields,
+                                [(file_name, table_key, fields, None,
+                                  file_coords)
+                                 for file_name, file_coords
+                                 in zip(self.file_list, coords)])
+            for start, stop, chunk in zip(offsets[:-1], offsets[1:], chunks):
+                for buf, values in zip(buffers.values(), chunk):
+                    buf[start:stop] = values
+        return self._finalize_values(self._to_frame(buffers, id_dtypes),
+                                     table_key)
+
+    def _finalize_values(self, values, table_key):
+        ''' Apply exists_col and prefix columns with the table name '''
         if self.exists_col is not None:
             mask = values.get(self.exists_col) == 0
-            values[mask] = np.NaN
-            values.drop(self.exists_col, axis=1, inplace=True)
+            if self.compact:
+                mask = mask.values
+                values.drop(self.exists_col, axis=1, inplace=True)
+                for col in values.columns:
+                    col_values = values[col].values
+                    if col_values.dtype.kind in 'iub':
+                        values[col] = to_nullable(col_values, mask)
+                    else:
+                        values.loc[mask, col] = np.nan
+            else:
+                values[mask] = np.nan
+                values.drop(self.exists_col, axis=1, inplace=True)
         rename_dict = {col: '%s.%s' % (table_key, col)
                        for col in values.columns}
         values.rename(columns=rename_dict, inplace=True)
         return values
 
+    def iter_chunks(self, observables, chunk_rows=None, as_numpy=False):
+        ''' Iterate over the observables of all files without loading all
+
+            Every file is read and its tables are aligned like in get_df,
+            hence at most one file is held in memory at a time.
+
+            Args:
+                observables (list): Observables to read
+                chunk_rows (int): Maximum number of rows per chunk. None
+                    yields one chunk per file.
+                as_numpy (bool): Yield 2d numpy arrays instead of DataFrames
+
+            Yields:
+                DataFrame (or numpy array) with the observables of a block of
+                rows, in file order
+        '''
+        obs_dict = self.create_obs_dict(observables)
+        id_dtypes = self.id_dtypes(list(obs_dict.keys()))
+        for file_name in self.file_list:
+            df = merge_tables([
+                self._finalize_values(
+                    self.read_table(file_name, table_key, cols, id_dtypes),
+                    table_key)
+                for table_key, cols in obs_dict.items()], compact=self.compact)
+            step = chunk_rows if chunk_rows is not None else max(len(df), 1)
+            for start in range(0, len(df), step):
+                chunk = df.iloc[start:start + step]
+                if as_numpy:
+                    yield chunk.values
+                else:
+                    yield chunk
+
 
     def create_obs_dict(self, observables):
         obs_dict = {}
@@ -163,16 +868,95 @@ class HDFContainer:
                 obs_dict[obs.tab] = [obs.col]
         return obs_dict
 
+    @_pooled
     def get_df(self, observables):
         obs_dict = self.create_obs_dict(observables)
+        id_dtypes = self.id_dtypes(list(obs_dict.keys()))
         n_obs = len(observables)
-        finished_cols = 0
-        with tqdm(total=n_obs, unit=' Observables') as pbar:
-            for i, [table_key, cols] in enumerate(obs_dict.items()):
-                tab_values = self.get_values(table_key, cols)
-                if i == 0:
-                    df = tab_values
-                else:
-                    df = df.join(tab_values, how='outer')
+        tabs = []
+        with tqdm.tqdm(total=n_obs, unit=' Observables') as pbar:
+            for table_key, cols in obs_dict.items():
+                tabs.append(self.get_values(table_key, cols, id_dtypes))
                 pbar.update(len(cols))
-        return df
+        return merge_tables(tabs, compact=self.compact)
+
+
+class LazyColumns(object):
+    ''' Observables of an HDFContainer, read on first access
+
+        Columns are aligned to the union of the ids of all tables holding
+        the observables, i.e. the index get_df would produce, and kept in a
+        LRUCache bounded in bytes. Cached columns are sized by their values,
+        the index they share is charged once.
+    '''
+    def __init__(self, container, observables, max_bytes=None):
+        ''' Args:
+                container (HDFContainer): Container to read columns from
+                observables (list): Observables available for access
+                max_bytes (int): Budget of the cached columns and their
+                    index, None keeps all
+        '''
+        self.container = container
+        self.obs_dict = container.create_obs_dict(observables)
+        self.observables = sorted(map(str, observables))
+        self.max_bytes = max_bytes
+        self.cache = LRUCache(max_bytes, sizeof=partial(nbytes, index=False))
+        self._index = None
+
+    def __contains__(self, key):
+        return key in self.observables or key in self.obs_dict
+
+    def __len__(self):
+        return len(self.observables)
+
+    @property
+    def index(self):
+        ''' Ids of all events, read once from the id columns only '''
+        if self._index is None:
+            self._index = merge_tables([
+                self.container.get_values(table_key, [], self._id_dtypes())
+                for table_key in self.obs_dict.keys()]).index
+            if self.max_bytes is not None:
+                self.cache.max_bytes = max(
+                    self.max_bytes - nbytes(self._index), 0)
+                self.cache.evict()
+        return self._index
+
+    @property
+    def nbytes(self):
+        ''' Memory used by the cached columns and their index '''
+        index_bytes = nbytes(self._index) if self._index is not None else 0
+        return self.cache.nbytes + index_bytes
+
+    def _id_dtypes(self):
+        ''' Index dtypes shared by all tables of the observables '''
+        return self.container.id_dtypes(list(self.obs_dict.keys()))
+
+    def _load(self, table_key, cols):
+        ''' Read cols of table_key into the cache '''
+        values = self.container.get_values(table_key, cols,
+                                           self._id_dtypes())
+        values = values.reindex(self.index)
+        for col in values.columns:
+            self.cache[col] = values[col]
+        return values
+
+    def __getitem__(self, key):
+        ''' Series of the observable key or DataFrame of the table key '''
+        if key in self.obs_dict:
+            cols = ['%s.%s' % (key, col) for col in self.obs_dict[key]]
+            # take the cached columns before loading may evict them
+            columns = {col: self.cache[col] for col in cols
+                       if col in self.cache}
+            missing = [col for col in cols if col not in columns]
+            if len(missing) > 0:
+                loaded = self._load(key, [ObservableName(obs_name=col).col
+                                          for col in missing])
+                columns.update((col, loaded[col]) for col in missing)
+            return pd.concat([columns[col] for col in cols], axis=1)
+        if key not in self.observables:
+            raise KeyError(key)
+        if key not in self.cache:
+            obs = ObservableName(obs_name=key)
+            return self._load(obs.tab, [obs.col])[key]
+        return self.cache[key]
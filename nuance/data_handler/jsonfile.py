@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Reading and atomically writing the json sidecar files of the data handler.
+
+Indices like schema.SchemaIndex or manifest.FileManifest are rebuilt from
+their sources if their file is missing or corrupt, and are written to
+<path>.<pid>.tmp first and renamed, so readers never see half written files.
+'''
+from __future__ import division, print_function
+
+import json
+import os
+
+
+def read_json(path, description='File'):
+    ''' Content of the json file path
+
+        Args:
+            path (str): Path of the json file
+            description (str): Name of the file for the warning printed if
+                it is corrupt, e.g. 'Schema index'
+
+        Returns:
+            The decoded content, None if the file is missing or corrupt
+    '''
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as json_file:
+            return json.load(json_file)
+    except ValueError:
+        print('{} {} is corrupt, rebuilding it.'.format(description, path))
+        return None
+
+
+def write_json(path, content, description='File'):
+    ''' Atomically replace path by content encoded as json
+
+        Args:
+            path (str): Path of the json file
+            content: Object to encode
+            description (str): Name of the file for the warning printed if
+                it can't be written
+
+        Returns:
+            True if the file was written
+    '''
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as output:
+            json.dump(content, output)
+        os.rename(tmp_path, path)
+        return True
+    except (IOError, OSError) as error:
+        print("Can't write {} {}: {}".format(description.lower(), path,
+                                              error))
+        return False
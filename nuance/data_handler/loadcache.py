@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Content addressed on-disk cache of loaded data sets.
+
+Every entry is a columnar store named after the hash of everything
+determining the result of a load: data set, files with their mtimes, keys
+and loading options. Entries are evicted least recently used first once the
+cache exceeds its size.
+'''
+from __future__ import division, print_function
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from os.path import join
+
+from ..lazy import lazy_import
+
+columnar = lazy_import('.columnar', __package__)
+
+
+def hash_key(key):
+    ''' Stable hash of a json serializable key '''
+    serialized = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class LoadCache(object):
+    ''' Directory of cached load results, bounded by max_bytes '''
+    def __init__(self, path, max_bytes=None):
+        ''' Args:
+                path (str): Directory holding the cache entries
+                max_bytes (int): Size limit of all entries, None is unbounded
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return join(self.path, hash_key(key))
+
+    def __contains__(self, key):
+        return os.path.isdir(self._entry(key))
+
+    def get(self, key, mmap=False):
+        ''' Cached DataFrame of key or None if it isn't cached '''
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return None
+        # the entry's mtime marks its last use
+        now = time.time()
+        os.utime(entry, (now, now))
+        return columnar.read_columnar(entry, mmap=mmap)
+
+    def put(self, key, df):
+        ''' Store df as result of key and evict old entries if needed '''
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        columnar.write_columnar(df, self._entry(key))
+        self.evict()
+
+    def entries(self):
+        ''' Paths of all entries, least recently used first '''
+        if not os.path.isdir(self.path):
+            return []
+        entries = [join(self.path, name) for name in os.listdir(self.path)
+                   if not name.endswith('.tmp')]
+        entries = [entry for entry in entries if os.path.isdir(entry)]
+        return sorted(entries, key=os.path.getmtime)
+
+    @property
+    def nbytes(self):
+        return sum(columnar.store_size(entry) for entry in self.entries())
+
+    def evict(self):
+        ''' Remove least recently used entries until max_bytes is kept '''
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        sizes = [columnar.store_size(entry) for entry in entries]
+        total = sum(sizes)
+        # never remove the most recently used entry
+        for entry, size in zip(entries[:-1], sizes[:-1]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry)
+            total -= size
+
+    def clear(self):
+        for entry in self.entries():
+            shutil.rmtree(entry)
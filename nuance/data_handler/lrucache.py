@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Mapping evicting its least recently used items once their size exceeds a
+budget in bytes.
+'''
+from __future__ import division, print_function
+
+from collections import OrderedDict
+
+from ..lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+def nbytes(value, index=True):
+    ''' Memory footprint of numpy arrays, pandas objects or containers
+
+        Args:
+            value: Object to measure
+            index (bool): Count the index of Series and DataFrames, leave it
+                out for values sharing one index
+    '''
+    if hasattr(value, 'memory_usage'):
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            usage = value.memory_usage(index=index, deep=True)
+        else:
+            usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+
+class LRUCache(object):
+    ''' Least recently used cache bounded by the size of its values '''
+    def __init__(self, max_bytes=None, sizeof=nbytes, on_evict=None):
+        ''' Create an empty cache
+
+            Args:
+                max_bytes (int): Budget for the summed size of all values.
+                    None never evicts. The most recently added value is kept
+                    even if it exceeds the budget on its own.
+                sizeof (callable): Returns the size of a value in bytes
+                on_evict (callable): Called with key and value of every
+                    evicted item
+        '''
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._items = OrderedDict()
+        self._sizes = dict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.keys()))
+
+    def __getitem__(self, key):
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._items:
+            del self[key]
+        self._items[key] = value
+        self._sizes[key] = self._sizeof(value)
+        self.evict()
+
+    def __delitem__(self, key):
+        del self._items[key]
+        del self._sizes[key]
+
+    @property
+    def nbytes(self):
+        ''' Summed size of all cached values '''
+        return sum(self._sizes.values())
+
+    def resize(self, key):
+        ''' Update the stored size of key after its value changed in place '''
+        self._sizes[key] = self._sizeof(self._items[key])
+        self.evict()
+
+    def evict(self):
+        ''' Drop least recently used items until max_bytes is kept '''
+        if self.max_bytes is None:
+            return
+        while len(self._items) > 1 and self.nbytes > self.max_bytes:
+            key, value = self._items.popitem(last=False)
+            del self._sizes[key]
+            if self._on_evict is not None:
+                self._on_evict(key, value)
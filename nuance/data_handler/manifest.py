@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Persistent manifest of the files of a data set directory.
+
+Names, sizes and mtimes of all files are taken from one scandir pass and
+stored as json. As long as the modification time of the directory is
+unchanged no file was added or removed, so the manifest is used without
+touching the files at all. Event counts are read from hdf5 metadata on
+demand and kept as long as size and mtime of a file are unchanged.
+'''
+from __future__ import division, print_function
+
+import os
+
+from ..lazy import lazy_import
+from .jsonfile import read_json, write_json
+
+tables = lazy_import('tables')
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+def scan_directory(directory):
+    ''' Dict of file name -> [size, mtime] of all files in directory '''
+    files = dict()
+    if scandir is not None:
+        for entry in scandir(directory):
+            if entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime]
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files[name] = [stat.st_size, stat.st_mtime]
+    return files
+
+
+def count_events(file_name):
+    ''' Number of rows of the first table of an I3TableWriter hdf5 file '''
+    with tables.open_file(file_name, 'r') as f:
+        for table in f.iter_nodes('/', classname='Table'):
+            return int(table.nrows)
+    return 0
+
+
+class FileManifest(object):
+    ''' Files of a directory with sizes, mtimes and event counts '''
+    def __init__(self, path, directory):
+        ''' Load the manifest stored in path and refresh it if needed
+
+            Args:
+                path (str): Path of the json file holding the manifest
+                directory (str): Directory of the data set files
+        '''
+        self.path = path
+        self.directory = directory
+        self._dir_mtime = None
+        # file name -> {'size', 'mtime', 'n_events'}
+        self._files = dict()
+        stored = read_json(path, 'Manifest')
+        if stored is not None and stored.get('directory') == directory:
+            self._dir_mtime = stored['dir_mtime']
+            self._files = stored['files']
+        self.refresh()
+
+    def refresh(self, force=False):
+        ''' Rescan the directory if files were added or removed
+
+            Args:
+                force (bool): Rescan even if the directory is unchanged,
+                    e.g. after files were rewritten in place
+
+            Returns:
+                True if the manifest changed
+        '''
+        dir_mtime = os.stat(self.directory).st_mtime
+        if not force and dir_mtime == self._dir_mtime:
+            return False
+        files = dict()
+        for name, (size, mtime) in scan_directory(self.directory).items():
+            entry = self._files.get(name)
+            if entry is None or [entry['size'], entry['mtime']] != \
+                    [size, mtime]:
+                entry = {'size': size, 'mtime': mtime, 'n_events': None}
+            files[name] = entry
+        changed = files != self._files or dir_mtime != self._dir_mtime
+        self._files = files
+        self._dir_mtime = dir_mtime
+        if changed:
+            self.save()
+        return changed
+
+    def save(self):
+        write_json(self.path, {'directory': self.directory,
+                               'dir_mtime': self._dir_mtime,
+                               'files': self._files}, 'Manifest')
+
+    @property
+    def names(self):
+        ''' Sorted names of all files '''
+        return sorted(self._files.keys())
+
+    def size(self, names=None):
+        ''' Summed size of the files names in bytes, None sums all '''
+        names = self._files.keys() if names is None else names
+        return sum(self._files[name]['size'] for name in names)
+
+    def n_events(self, names=None):
+        ''' Summed event counts of the files names, None sums all
+
+            Counts missing in the manifest are read from the files and
+            stored.
+        '''
+        names = self.names if names is None else names
+        missing = [name for name in names
+                   if self._files[name]['n_events'] is None]
+        for name in missing:
+            self._files[name]['n_events'] = count_events(
+                os.path.join(self.directory, name))
+        if len(missing) > 0:
+            self.save()
+        return sum(self._files[name]['n_events'] for name in names)
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, name):
+        return name in self._files
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 # Inital version by Mathis Börner
+from __future__ import division, print_function
+
 import numpy as np
 import pandas as pd
 from fnmatch import fnmatch
 
+PROFILE_COLUMNS = ['nan_ratio', 'constant', 'min', 'max', 'mean', 'std']
+
 
 def get_nan_ratio(df, white_list, weight=None, rel=True):
     # init nan_count with zeros
@@ -15,27 +19,145 @@ def get_nan_ratio(df, white_list, weight=None, rel=True):
             weight = weight.flatten()
         denominator = np.sum(weight)
     else:
-        weight = 1.
+        weight = np.ones(len(df))
         denominator = len(df)
 
-    # calculate nan count/ratio for each attribute, taking weight into account
-    for o in white_list:
-        nan_array = np.array(df[o].isnull(), dtype=float)
-        nan_count[o] = np.sum(nan_array * weight)
-        if rel:
-            nan_count[o] /= denominator
+    # calculate nan count/ratio for all attributes, taking weight into account
+    nan_count[:] = np.dot(weight, df[white_list].isnull().values)
+    if rel:
+        nan_count /= denominator
     return nan_count
 
 
 def get_nan_ratio_total(dfs, white_list, weight=None):
-    sum_ws = [np.sum(df[weight]) for df in dfs]
-    nan_ratios = [get_nan_ratio(df, white_list, weight) for df in dfs]
-    nan_ratios = np.array(nan_ratios)
-    nan_vals = np.zeros(len(white_list), dtype=float)
-    for i in range(len(dfs)):
-        nan_vals += nan_ratios[i, :] * sum_ws[i]
-    nan_vals /= np.sum(sum_ws)
-    return pd.Series(nan_vals, index=white_list)
+    return profile_columns(dfs, white_list, weights=weight)['nan_ratio']
+
+
+class ColumnProfile(object):
+    ''' Weighted statistics of columns, accumulated chunk by chunk
+
+        Means and variances of chunks are merged with the pairwise update of
+        Chan et al., so chunks, files or data sets can be profiled separately
+        and combined with merge.
+    '''
+    def __init__(self, columns):
+        n = len(columns)
+        self.columns = list(columns)
+        self.sum_w = 0.
+        self.nan_w = np.zeros(n)
+        self.valid_w = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+
+    def add(self, df, weights=None):
+        ''' Add the rows of df
+
+            Args:
+                df (pandas.DataFrame): Chunk holding all columns
+                weights (array): Weight of each row, None weights all rows 1
+        '''
+        values = df[self.columns].to_numpy(dtype=float, na_value=np.nan,
+                                          copy=True)
+        if weights is None:
+            weights = np.ones(len(values))
+        weights = np.asarray(weights, dtype=float).ravel()
+        nan = np.isnan(values)
+        values[nan] = 0.
+        valid_weights = np.where(nan, 0., weights[:, None])
+        chunk = ColumnProfile(self.columns)
+        chunk.sum_w = weights.sum()
+        chunk.nan_w = np.dot(weights, nan)
+        chunk.valid_w = valid_weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk.mean = np.nan_to_num(
+                (valid_weights * values).sum(axis=0) / chunk.valid_w)
+        chunk.m2 = (valid_weights * (values - chunk.mean)**2).sum(axis=0)
+        values[nan] = np.inf
+        chunk.min = values.min(axis=0, initial=np.inf)
+        values[nan] = -np.inf
+        chunk.max = values.max(axis=0, initial=-np.inf)
+        self.merge(chunk)
+
+    def merge(self, other):
+        ''' Combine the statistics of other with these '''
+        valid_w = self.valid_w + other.valid_w
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(valid_w > 0, other.valid_w / valid_w, 0.)
+        self.mean = self.mean + delta * fraction
+        self.m2 = self.m2 + other.m2 + delta**2 * self.valid_w * fraction
+        self.valid_w = valid_w
+        self.sum_w += other.sum_w
+        self.nan_w = self.nan_w + other.nan_w
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def to_frame(self):
+        ''' DataFrame of column -> nan_ratio, constant, min, max, mean and
+            std
+        '''
+        has_values = self.valid_w > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            nan_ratio = self.nan_w / self.sum_w
+            std = np.sqrt(self.m2 / self.valid_w)
+        return pd.DataFrame(
+            {'nan_ratio': nan_ratio,
+             'constant': has_values & (self.min == self.max),
+             'min': np.where(has_values, self.min, np.nan),
+             'max': np.where(has_values, self.max, np.nan),
+             'mean': np.where(has_values, self.mean, np.nan),
+             'std': np.where(has_values, std, np.nan)},
+            index=self.columns, columns=PROFILE_COLUMNS)
+
+
+def profile_columns(df_or_chunks, white_list=None, weights=None):
+    ''' Weighted NaN ratio, constant-ness, min, max, mean and std of
+        columns in one pass over the data
+
+        Args:
+            df_or_chunks: DataFrame or iterable of DataFrames, e.g. chunks of
+                DataSet.iter_load or the data of several data sets
+            white_list (list): Columns to profile, None profiles all numeric
+                columns of the first chunk except a weights column
+            weights: Name of a column of each chunk, weights of the rows of a
+                single DataFrame or an iterable of those of each chunk. None
+                weights all rows 1.
+
+        Returns:
+            DataFrame with a row per column of white_list and the columns
+            nan_ratio (weighted), constant (all non-NaN values equal), min,
+            max, mean and std (weighted, ddof=0). Statistics except nan_ratio
+            ignore NaNs and are NaN for columns without values.
+    '''
+    if isinstance(df_or_chunks, pd.DataFrame):
+        df_or_chunks = [df_or_chunks]
+        if weights is not None and not isinstance(weights, str):
+            weights = [weights]
+    if weights is None or isinstance(weights, str):
+        weight_name = weights
+        weights = None
+    else:
+        weight_name = None
+        weights = iter(weights)
+    profile = None
+    for df in df_or_chunks:
+        if profile is None:
+            if white_list is None:
+                white_list = [o for o in df.select_dtypes(
+                    include=[np.number, bool]).columns if o != weight_name]
+            profile = ColumnProfile(white_list)
+        if weight_name is not None:
+            chunk_weights = df[weight_name].values
+        elif weights is not None:
+            chunk_weights = next(weights)
+        else:
+            chunk_weights = None
+        profile.add(df, chunk_weights)
+    if profile is None:
+        profile = ColumnProfile(white_list or [])
+    return profile.to_frame()
 
 
 def get_dups(df, white_list, threshold=0.5):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Compiled index of the .dataset files in a directory.
+
+Parsing hundreds of .dataset json files on every start of a DataSetHandler
+is slow, especially on network file systems. The registry stores their
+properties in one json file together with size and mtime of each .dataset
+file. Only files which were added or changed since are parsed again.
+'''
+from __future__ import division, print_function
+
+import copy
+import json
+import os
+from collections import OrderedDict
+from glob import glob
+from os.path import join
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .jsonfile import read_json, write_json
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+class DataSetRegistry(object):
+    ''' Properties of all .dataset files of a directory '''
+    def __init__(self, db_dir, suffix='dataset', file_name='registry.json'):
+        ''' Load the registry of db_dir and update it if needed
+
+            Args:
+                db_dir (str): Directory holding the .dataset files
+                suffix (str): Ending of the dataset files
+                file_name (str): Name of the compiled registry in db_dir
+        '''
+        self.db_dir = db_dir
+        self.suffix = suffix
+        self.path = join(db_dir, file_name)
+        self._entries = read_json(self.path, 'Registry') or dict()
+        self.compile()
+
+    def compile(self):
+        ''' Parse the .dataset files added or changed since the last call
+
+            Returns:
+                True if the registry changed
+        '''
+        paths = sorted(glob(join(self.db_dir, '*.' + self.suffix)))
+        entries = dict()
+        changed = set(self._entries.keys()) != set(paths)
+        for path in paths:
+            stat = _stat(path)
+            entry = self._entries.get(path)
+            if entry is None or entry['stat'] != stat:
+                with open(path, 'r') as dataset_file:
+                    entry = {'stat': stat,
+                             'properties': json.load(dataset_file)}
+                changed = True
+            entries[path] = entry
+        self._entries = entries
+        if changed:
+            self.save()
+        return changed
+
+    def save(self):
+        write_json(self.path, self._entries, 'Registry')
+
+    @property
+    def paths(self):
+        ''' OrderedDict of data set type -> path of its .dataset file '''
+        paths = OrderedDict()
+        for path in sorted(self._entries.keys()):
+            paths[self._entries[path]['properties']['type']] = path
+        return paths
+
+    def properties(self, data_type):
+        ''' Copy of the properties of the data set data_type '''
+        path = self.paths[data_type]
+        return copy.deepcopy(self._entries[path]['properties'])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LazyDataSets(Mapping):
+    ''' Mapping of data set type -> DataSet, creating each on first access '''
+    def __init__(self, types, factory):
+        ''' Args:
+                types (list): Types of the available data sets
+                factory (callable): Returns the DataSet of a type
+        '''
+        self._types = list(types)
+        self._factory = factory
+        self._datasets = dict()
+
+    def __getitem__(self, data_type):
+        if data_type not in self._datasets:
+            if data_type not in self._types:
+                raise KeyError(data_type)
+            self._datasets[data_type] = self._factory(data_type)
+        return self._datasets[data_type]
+
+    def __iter__(self):
+        return iter(self._types)
+
+    def __len__(self):
+        return len(self._types)
+
+    def __contains__(self, data_type):
+        return data_type in self._types
+
+    def created(self):
+        ''' List of (type, DataSet) of the data sets created so far '''
+        return [(data_type, self._datasets[data_type])
+                for data_type in self._types if data_type in self._datasets]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Persistent index of the tables, columns and dtypes of hdf5 files.
+
+Entries are keyed by the absolute file path and only trusted as long as size
+and modification time of the file are unchanged, so observable discovery
+doesn't need to open files which have been scanned before.
+'''
+from __future__ import division, print_function
+
+import os
+import warnings
+
+from ..lazy import lazy_import
+from .jsonfile import read_json, write_json
+
+tables = lazy_import('tables')
+
+
+def scan_schema(file_name):
+    ''' Read tables, columns and dtypes of all top level tables of file_name
+
+        Returns:
+            Dict of table name -> list of [column name, dtype string]
+    '''
+    schema = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with tables.open_file(file_name, 'r') as f:
+            for table in f.iter_nodes('/', classname='Table'):
+                schema[table.name] = [[col, str(table.coldtypes[col])]
+                                      for col in table.colnames]
+    return schema
+
+
+class SchemaIndex(object):
+    ''' Schemas of hdf5 files, stored as json file '''
+    def __init__(self, path):
+        ''' Load the index stored in path, if there is one
+
+            Args:
+                path (str): Path of the json file holding the index
+        '''
+        self.path = path
+        self._changed = False
+        self._entries = read_json(path, 'Schema index') or dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, file_name):
+        ''' Stored schema of file_name or None if it is unknown or changed '''
+        entry = self._entries.get(os.path.abspath(file_name))
+        if entry is None:
+            return None
+        stat = os.stat(file_name)
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            return None
+        return entry['tables']
+
+    def update(self, file_name, schema):
+        ''' Store schema for the current state of file_name '''
+        stat = os.stat(file_name)
+        self._entries[os.path.abspath(file_name)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'tables': schema}
+        self._changed = True
+
+    def missing(self, file_names):
+        ''' Files of file_names without a valid entry in the index '''
+        return [f for f in file_names if self._lookup(f) is None]
+
+    def get(self, file_name):
+        ''' Schema of file_name, scanning the file if it isn't indexed '''
+        schema = self._lookup(file_name)
+        if schema is None:
+            schema = scan_schema(file_name)
+            self.update(file_name, schema)
+        return schema
+
+    def save(self):
+        ''' Write the index to disk if it changed '''
+        if not self._changed:
+            return
+        if write_json(self.path, self._entries, 'Schema index'):
+            self._changed = False
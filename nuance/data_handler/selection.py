@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Compile selections of events into one vectorized mask.
+
+A selection is either a string expression of observables, e.g.
+
+    'L4.score > 0.9 & LineFit.zenith < 1.5'
+
+or a list of tuples (observable, operator, value). Both are translated into
+a single expression evaluated by pandas.eval, with numexpr as engine if it
+is installed, so all cuts are computed in one pass without intermediate
+DataFrames.
+'''
+from __future__ import division, print_function
+
+import re
+from collections import OrderedDict
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # python 2
+    from pkgutil import find_loader as find_spec
+
+from ..lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# engine of pandas.eval, None uses numexpr if it is installed
+ENGINE = None
+
+OPERATORS = ['==', '!=', '>=', '<=', '>', '<', 'is', 'is not']
+# Tab.col, not matching numbers like 1.5 or 1.5e3
+OBSERVABLE_PATTERN = re.compile(r'(?<![\w.])([A-Za-z_]\w*)\.([A-Za-z_]\w*)')
+
+
+def _engine():
+    if ENGINE is not None:
+        return ENGINE
+    return 'numexpr' if find_spec('numexpr') is not None else 'python'
+
+
+def column_values(series):
+    ''' Float or bool numpy array of series, missing values become NaN '''
+    values = series.values
+    if isinstance(values, (pd.arrays.IntegerArray, pd.arrays.BooleanArray)):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        values = values.astype(float)
+    return values
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class Selection(object):
+    ''' Selection compiled into one expression over named variables '''
+    def __init__(self, selection):
+        ''' Args:
+                selection (str, list or Selection): Expression of
+                    observables combined with &, |, ~ (or and, or, not) or
+                    list of tuples (observable, operator, value) which all
+                    have to pass. Operators are ==, !=, >=, <=, >, <, is and
+                    is not, where 'is None' (or NaN) selects missing values.
+        '''
+        if isinstance(selection, Selection):
+            selection = selection.source
+        self.source = selection
+        # variable name -> (observable, is None test)
+        self._variables = OrderedDict()
+        self._constants = dict()
+        if isinstance(selection, str):
+            self.expression = self._compile_expression(selection)
+        else:
+            self.expression = self._compile_cuts(selection)
+
+    def _variable(self, observable, isnull=False):
+        key = (str(observable), isnull)
+        for name, value in self._variables.items():
+            if value == key:
+                return name
+        name = '_v{}'.format(len(self._variables))
+        self._variables[name] = key
+        return name
+
+    def _compile_expression(self, expression):
+        return OBSERVABLE_PATTERN.sub(
+            lambda match: self._variable(match.group(0)), expression)
+
+    def _compile_cuts(self, cuts):
+        terms = []
+        for observable, operator, value in cuts:
+            if operator not in OPERATORS:
+                raise ValueError('Operator has to be: {}'.format(
+                    ', '.join(OPERATORS)))
+            if operator in ('is', 'is not') and _is_missing(value):
+                term = self._variable(observable, isnull=True)
+                if operator == 'is not':
+                    term = '~' + term
+            else:
+                if operator in ('is', 'is not'):
+                    operator = '==' if operator == 'is' else '!='
+                constant = '_c{}'.format(len(self._constants))
+                self._constants[constant] = value
+                term = '({} {} {})'.format(self._variable(observable),
+                                           operator, constant)
+            terms.append(term)
+        if len(terms) == 0:
+            return 'True'
+        return ' & '.join(terms)
+
+    @property
+    def observables(self):
+        ''' Observables the selection depends on '''
+        return list(OrderedDict.fromkeys(
+            observable for observable, _ in self._variables.values()))
+
+    def mask(self, df):
+        ''' Boolean numpy array of the rows of df passing the selection
+
+            Raises:
+                KeyError if observables of the selection are missing in df
+        '''
+        missing = [o for o in self.observables if o not in df.columns]
+        if len(missing) > 0:
+            raise KeyError('Observables {} not loaded.'.format(missing))
+        local_dict = dict(self._constants)
+        for name, (observable, isnull) in self._variables.items():
+            if isnull:
+                local_dict[name] = np.asarray(pd.isna(df[observable]))
+            else:
+                local_dict[name] = column_values(df[observable])
+        mask = pd.eval(self.expression, local_dict=local_dict,
+                       global_dict={}, engine=_engine())
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (len(df),))
+
+    def __str__(self):
+        return str(self.source)
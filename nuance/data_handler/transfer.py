@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Concurrent, resumable downloads of data set files.
+
+Files are copied by a pool of threads, each with its own channel of the
+backend (one SFTP channel per thread sharing one SSH connection). Data is
+written to <name>.part first, so interrupted transfers resume where they
+stopped. A file only gets its final name after its size and md5 checksum
+were verified. The checksum is taken from the caller, from the server if it
+supports the check-file extension (stock OpenSSH doesn't) or else computed
+from the bytes read from the source. Failing transfers are retried with
+exponential backoff on a fresh channel.
+
+Backends are chosen by the host part of remote paths, 'file:/data/numu'
+copies from the local file system, every other host is reached via SFTP
+using ~/.ssh/config. One connection per host is kept open and shared by all
+transfers and listings of the process.
+
+Listings of remote directories are cached as json by RemoteListing and only
+fetched again after their time to live expired.
+'''
+from __future__ import division, print_function
+
+import atexit
+import binascii
+import hashlib
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from os.path import expandvars, join
+
+from ..lazy import lazy_import
+from .jsonfile import read_json, write_json
+
+tqdm = lazy_import('tqdm')
+
+LOCAL_HOST = 'file'
+PART_SUFFIX = '.part'
+BLOCK_SIZE = 1024 * 1024
+LISTING_TTL = 3600.
+
+# hostname -> open backend, see get_backend
+_backends = dict()
+_backends_lock = threading.Lock()
+# hostname -> lock held while connecting to it
+_host_locks = dict()
+
+
+class TransferError(IOError):
+    ''' Raised if files couldn't be transferred after all retries '''
+    def __init__(self, failed):
+        self.failed = failed
+        super(TransferError, self).__init__(
+            'Transfer of {} file(s) failed: {}'.format(
+                len(failed), ', '.join(sorted(failed))))
+
+
+def md5sum(file_obj, block_size=BLOCK_SIZE):
+    ''' md5 hex digest of everything left in the binary file_obj '''
+    md5 = hashlib.md5()
+    for block in iter(lambda: file_obj.read(block_size), b''):
+        md5.update(block)
+    return md5.hexdigest()
+
+
+class LocalChannel(object):
+    ''' Channel reading from the local file system '''
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def open(self, path):
+        return open(path, 'rb')
+
+    def checksum(self, path):
+        with self.open(path) as source:
+            return md5sum(source)
+
+    def close(self):
+        pass
+
+
+class LocalBackend(object):
+    ''' Backend for remote paths like file:/data/numu, mainly for tests '''
+    def open_channel(self):
+        return LocalChannel()
+
+    def is_active(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class SFTPChannel(object):
+    ''' One SFTP channel of an SSH connection '''
+    def __init__(self, sftp):
+        self._sftp = sftp
+
+    def listdir(self, path):
+        return self._sftp.listdir(path)
+
+    def size(self, path):
+        return self._sftp.stat(path).st_size
+
+    def open(self, path):
+        source = self._sftp.open(path, 'rb')
+        source.prefetch()
+        return source
+
+    def checksum(self, path):
+        ''' md5 computed by the server, None if it doesn't support it '''
+        try:
+            with self._sftp.open(path, 'rb') as source:
+                return binascii.hexlify(source.check('md5')).decode('ascii')
+        except IOError:
+            return None
+
+    def close(self):
+        self._sftp.close()
+
+
+class SFTPBackend(object):
+    ''' SSH connection to hostname, configured via ssh_config '''
+    def __init__(self, hostname, ssh_config='$HOME/.ssh/config'):
+        import paramiko
+
+        config = paramiko.SSHConfig()
+        with open(expandvars(ssh_config)) as config_file:
+            config.parse(config_file)
+        host = config.lookup(hostname)
+        proxy = host.get('proxycommand')
+        self._client = paramiko.SSHClient()
+        self._client.load_system_host_keys()
+        self._client.connect(host['hostname'],
+                             port=int(host.get('port', 22)),
+                             username=host.get('user'),
+                             key_filename=host.get('identityfile'),
+                             sock=paramiko.ProxyCommand(proxy) if proxy
+                             else None)
+
+    def open_channel(self):
+        return SFTPChannel(self._client.open_sftp())
+
+    def is_active(self):
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        self._client.close()
+
+
+def get_backend(hostname):
+    ''' Shared backend reaching hostname, LOCAL_HOST is the local file system
+
+        The connection is opened on the first call and reused afterwards,
+        it is reopened if it was closed or dropped in between. Connections
+        to different hosts are opened concurrently.
+    '''
+    with _backends_lock:
+        host_lock = _host_locks.setdefault(hostname, threading.Lock())
+    with host_lock:
+        backend = _backends.get(hostname)
+        if backend is None or not backend.is_active():
+            if hostname == LOCAL_HOST:
+                backend = LocalBackend()
+            else:
+                backend = SFTPBackend(hostname)
+            with _backends_lock:
+                _backends[hostname] = backend
+        return backend
+
+
+@atexit.register
+def close_backends():
+    ''' Close the connections of all hosts '''
+    with _backends_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        try:
+            backend.close()
+        except Exception:
+            pass
+
+
+def list_remote(location):
+    ''' Names of the files in a remote location like host:/data/numu '''
+    hostname, remote_dir = location.split(':')
+    channel = get_backend(hostname).open_channel()
+    try:
+        return channel.listdir(remote_dir)
+    finally:
+        channel.close()
+
+
+class RemoteListing(object):
+    ''' Cached listing of a remote directory '''
+    def __init__(self, path, location, ttl=LISTING_TTL):
+        ''' Load the listing of location stored in path
+
+            Args:
+                path (str): Path of the json file holding the listing
+                location (str): Remote directory like host:/data/numu
+                ttl (float): Seconds after which the listing is fetched
+                    again, None keeps it until refresh(force=True)
+        '''
+        self.path = path
+        self.location = location
+        self.ttl = ttl
+        self._time = None
+        self._names = None
+        stored = read_json(path, 'Listing')
+        if stored is not None and stored.get('location') == location:
+            self._time = stored['time']
+            self._names = stored['files']
+
+    @property
+    def expired(self):
+        if self._names is None:
+            return True
+        return self.ttl is not None and time.time() - self._time > self.ttl
+
+    def refresh(self, force=False):
+        ''' Fetch the listing if it expired
+
+            Args:
+                force (bool): Fetch it even if it didn't expire
+
+            Returns:
+                True if the listing changed
+        '''
+        if not force and not self.expired:
+            return False
+        names = sorted(list_remote(self.location))
+        changed = names != self._names
+        self._names = names
+        self._time = time.time()
+        self.save()
+        return changed
+
+    def save(self):
+        write_json(self.path, {'location': self.location,
+                               'time': self._time,
+                               'files': self._names}, 'Listing')
+
+    @property
+    def names(self):
+        ''' Sorted names of the remote files, fetched if expired '''
+        self.refresh()
+        return list(self._names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TransferEngine(object):
+    ''' Download files concurrently from a backend '''
+    def __init__(self, backend, n_channels=4, retries=3, backoff=1.,
+                 verify_checksum=True, block_size=BLOCK_SIZE):
+        ''' Args:
+                backend: LocalBackend, SFTPBackend or any object with
+                    open_channel() and close()
+                n_channels (int): Number of files transferred at once
+                retries (int): Additional attempts for each file
+                backoff (float): Seconds to wait before the first retry,
+                    doubled for every further retry
+                verify_checksum (bool): Compare md5 checksums of the
+                    transferred files with the ones of the source. If
+                    neither the caller nor the server provides them, they
+                    are computed from the source bytes while copying, the
+                    prefix of a resumed file is read once more for it.
+                block_size (int): Bytes copied at once
+        '''
+        self.backend = backend
+        self.n_channels = n_channels
+        self.retries = retries
+        self.backoff = backoff
+        self.verify_checksum = verify_checksum
+        self.block_size = block_size
+        self._local = threading.local()
+        self._channels = []
+        self._lock = threading.Lock()
+
+    def _channel(self, reopen=False):
+        ''' Channel of the calling thread '''
+        channel = getattr(self._local, 'channel', None)
+        if channel is not None and reopen:
+            try:
+                channel.close()
+            except Exception:
+                pass
+            channel = None
+        if channel is None:
+            channel = self.backend.open_channel()
+            self._local.channel = channel
+            with self._lock:
+                self._channels.append(channel)
+        return channel
+
+    def _copy(self, channel, source_path, target_path, checksum=None):
+        ''' Copy source_path to target_path, resuming a .part file
+
+            Returns:
+                'exists' if target_path was complete already, else
+                'downloaded'
+        '''
+        size = channel.size(source_path)
+        part_path = target_path + PART_SUFFIX
+        if os.path.isfile(target_path):
+            if os.path.getsize(target_path) == size:
+                return 'exists'
+            # a stale or broken file, its content can't be trusted
+            os.remove(target_path)
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) \
+            else 0
+        if offset > size:
+            os.remove(part_path)
+            offset = 0
+        if self.verify_checksum and checksum is None:
+            checksum = channel.checksum(source_path)
+        # hash the source bytes if no checksum is known
+        md5 = hashlib.md5() if self.verify_checksum and checksum is None \
+            else None
+        with channel.open(source_path) as source:
+            if md5 is not None and offset > 0:
+                for block in iter(lambda: source.read(
+                        min(self.block_size, offset - source.tell())), b''):
+                    md5.update(block)
+            source.seek(offset)
+            with open(part_path, 'ab') as target:
+                for block in iter(lambda: source.read(self.block_size),
+                                  b''):
+                    target.write(block)
+                    if md5 is not None:
+                        md5.update(block)
+        if os.path.getsize(part_path) != size:
+            raise IOError('{} has {} bytes instead of {}.'.format(
+                part_path, os.path.getsize(part_path), size))
+        if md5 is not None:
+            checksum = md5.hexdigest()
+        if checksum is not None:
+            with open(part_path, 'rb') as target:
+                local_checksum = md5sum(target, self.block_size)
+            if local_checksum != checksum:
+                os.remove(part_path)
+                raise IOError('Checksum of {} differs from {}.'.format(
+                    part_path, source_path))
+        os.rename(part_path, target_path)
+        return 'downloaded'
+
+    def _transfer(self, args):
+        source_path, target_path, checksum = args
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2**(attempt - 1))
+            try:
+                channel = self._channel(reopen=error is not None)
+                return target_path, self._copy(channel, source_path,
+                                               target_path, checksum), None
+            except Exception as e:
+                # e.g. IOError, socket errors or a broken SSH session
+                error = e
+        return target_path, 'failed', error
+
+    def download(self, remote_dir, file_names, local_dir, checksums=None,
+                 raise_errors=True):
+        ''' Download file_names from remote_dir to local_dir
+
+            Args:
+                remote_dir (str): Directory of the files on the backend
+                file_names (list): Names of the files to download
+                local_dir (str): Destination directory, created if needed
+                checksums (dict): Expected md5 hex digests of file names,
+                    taken from the backend if missing
+                raise_errors (bool): Raise TransferError if files failed
+
+            Returns:
+                Dict of file name -> 'downloaded', 'exists' or 'failed'
+        '''
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        checksums = checksums or dict()
+        args_list = [(join(remote_dir, name), join(local_dir, name),
+                      checksums.get(name)) for name in file_names]
+        status = dict()
+        failed = dict()
+        pool = ThreadPool(max(1, min(self.n_channels, len(args_list))))
+        try:
+            for target_path, result, error in tqdm.tqdm(
+                    pool.imap_unordered(self._transfer, args_list),
+                    total=len(args_list), desc="Downloading from Remote"):
+                name = os.path.basename(target_path)
+                status[name] = result
+                if error is not None:
+                    failed[name] = error
+                    print('Transfer of {} failed: {}'.format(name, error))
+        finally:
+            pool.close()
+            pool.join()
+            self.close()
+        if raise_errors and len(failed) > 0:
+            raise TransferError(failed)
+        return status
+
+    def listdir(self, remote_dir):
+        ''' Names of the files in remote_dir '''
+        return self._channel().listdir(remote_dir)
+
+    def close(self):
+        ''' Close all channels opened so far '''
+        with self._lock:
+            channels, self._channels = self._channels, []
+        for channel in channels:
+            try:
+                channel.close()
+            except Exception:
+                pass
+        self._local = threading.local()
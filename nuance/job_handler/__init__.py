@@ -1,5 +1,4 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from . import dagman_job_creator
-from . import phido
\ No newline at end of file
+from . import phido
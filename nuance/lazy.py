@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Defer imports of heavy modules until they are used.
+
+    np = lazy_import('numpy')
+
+binds np to a placeholder importing numpy on its first attribute access,
+so modules only pay for dependencies of the code paths actually run.
+'''
+from __future__ import division, print_function
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    ''' Placeholder of a module, imported on first attribute access '''
+    def _load(self):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name, package=None):
+    ''' Module name, imported on first use if it isn't imported yet
+
+        Args:
+            name (str): Absolute name or name relative to package like
+                '.columnar'
+            package (str): Package of relative names, usually __package__
+    '''
+    if name.startswith('.'):
+        name = package + name
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,82 @@
+# coding: utf-8
+''' Helpers to create small hdf5 files laid out like I3TableWriter output '''
+from __future__ import division, print_function
+
+import json
+import os
+
+import numpy as np
+import tables
+
+
+ID_COLS = ['Run', 'Event', 'SubEvent', 'SubEventStream']
+
+
+def write_i3_hdf(file_name, tabs):
+    ''' Write tables with the I3TableWriter column layout to file_name
+
+        Args:
+            file_name (str): Path of the hdf5 file to create
+            tabs (dict): Table name -> dict of column name -> array.
+                Missing id columns and 'exists' are filled with defaults.
+    '''
+    with tables.open_file(file_name, 'w') as f:
+        for tab_name, cols in tabs.items():
+            n_rows = len(cols['Event'])
+            dtype = [('Run', np.uint32),
+                     ('Event', np.uint32),
+                     ('SubEvent', np.uint32),
+                     ('SubEventStream', np.uint32),
+                     ('exists', np.uint8)]
+            dtype += [(c, np.asarray(v).dtype) for c, v in cols.items()
+                      if c not in ID_COLS and c != 'exists']
+            data = np.zeros(n_rows, dtype=dtype)
+            data['exists'] = 1
+            for c, v in cols.items():
+                data[c] = v
+            f.create_table('/', tab_name, obj=data)
+
+
+def make_dataset(directory, n_files=3, n_events=5, run_offset=100):
+    ''' Write n_files files with a 'LineFit', 'L4' and 'weights' table
+
+        Returns:
+            List of created file paths
+    '''
+    file_list = []
+    for i in range(n_files):
+        events = np.arange(n_events)
+        run = np.full(n_events, run_offset + i)
+        exists = np.ones(n_events, dtype=np.uint8)
+        exists[0] = 0
+        tabs = {
+            'LineFit': {'Run': run, 'Event': events,
+                        'exists': exists,
+                        'zenith': np.linspace(0., 3., n_events) + i,
+                        'azimuth': np.linspace(0., 6., n_events),
+                        'energy': np.arange(n_events) * 10. + i},
+            'L4': {'Run': run, 'Event': events,
+                   'score': np.linspace(0., 1., n_events)},
+            'weights': {'Run': run, 'Event': events,
+                        'honda': np.full(n_events, 0.5 * (i + 1))},
+        }
+        file_name = '{}/Run{:04d}.hd5'.format(directory, i)
+        write_i3_hdf(file_name, tabs)
+        file_list.append(file_name)
+    return file_list
+
+
+def dataset_properties(directory, data_type='numu'):
+    ''' Properties of a .dataset json file pointing to directory '''
+    return {'name': data_type + '_test',
+            'type': data_type,
+            'n_files': 3,
+            'local_path': directory}
+
+
+def write_dataset_file(db_dir, directory, data_type='numu'):
+    ''' Write <db_dir>/<data_type>.dataset pointing to directory '''
+    path = os.path.join(db_dir, '{}.dataset'.format(data_type))
+    with open(path, 'w') as output:
+        json.dump(dataset_properties(directory, data_type), output)
+    return path
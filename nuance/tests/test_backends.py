@@ -0,0 +1,72 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from nuance.data_handler import backends
+from nuance.data_handler.datasethandler import DataSet, DataSetHandler
+from nuance.tests.helpers import dataset_properties
+from nuance.tests.helpers import make_dataset
+from nuance.tests.helpers import write_dataset_file
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestRegistry(unittest.TestCase):
+    def test_get_backend(self):
+        self.assertEqual(backends.get_backend(['a.parquet']).name, 'parquet')
+        self.assertEqual(backends.get_backend(['a.arrow']).name, 'feather')
+        for files in [['a.hd5', 'b.parquet'], ['a.hd5'], ['a.i3.bz2']]:
+            with self.assertRaises(TypeError):
+                backends.get_backend(files)
+        with self.assertRaises(ValueError):
+            backends.get_backend_by_name('root')
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestArrowBackends(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.export_dir = tempfile.mkdtemp()
+        make_dataset(self.path)
+        write_dataset_file(self.db_dir, self.path)
+        self.handler = DataSetHandler(db_dir=self.db_dir,
+                                      data_dir=self.path)
+        self.keys = ['LineFit.zenith', 'L4.score', 'weights.honda']
+        self.handler['numu'].load(keys=self.keys, exists_col='exists')
+
+    def tearDown(self):
+        for path in [self.path, self.db_dir, self.export_dir]:
+            shutil.rmtree(path)
+
+    def _check_backend(self, backend):
+        paths = self.handler.export(self.export_dir, backend=backend)
+        self.assertEqual(list(paths.keys()), ['numu'])
+        expected = self.handler['numu'].data
+        dataset = DataSet(dataset_properties(os.path.dirname(paths['numu'])))
+        self.assertEqual(dataset.observables(), self.keys)
+        dataset.load(keys=['L4.score', 'weights.honda'],
+                     cuts=[('L4.score', '>', 0.3)])
+        pd.testing.assert_frame_equal(
+            dataset.data, expected.loc[expected['L4.score'] > 0.3,
+                                       ['L4.score', 'weights.honda']])
+        self.assertEqual(list(dataset.weights.columns), ['weights.honda'])
+
+    def test_parquet(self):
+        self._check_backend('parquet')
+
+    def test_feather(self):
+        self._check_backend('feather')
+
+
+if __name__ == '__main__':
+    unittest.main()
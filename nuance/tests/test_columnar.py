@@ -0,0 +1,78 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from nuance.data_handler.columnar import ColumnarWriter
+from nuance.data_handler.columnar import read_columnar
+from nuance.data_handler.columnar import write_columnar
+from nuance.data_handler.loadcache import LoadCache
+
+
+def example_frame(n_rows=4):
+    index = pd.MultiIndex.from_arrays(
+        [np.arange(n_rows, dtype=np.uint32),
+         np.zeros(n_rows, dtype=np.uint8)], names=['Run', 'Event'])
+    return pd.DataFrame({
+        'LineFit.zenith': np.linspace(0., 1., n_rows).astype(np.float32),
+        'L4.flag': pd.arrays.BooleanArray(np.ones(n_rows, dtype=bool),
+                                          np.arange(n_rows) == 0),
+        'weights.honda': np.ones(n_rows)}, index=index)
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        df = example_frame()
+        store = os.path.join(self.path, 'store')
+        write_columnar(df, store)
+        pd.testing.assert_frame_equal(read_columnar(store), df)
+        mapped = read_columnar(store, columns=['weights.honda'], mmap=True)
+        pd.testing.assert_frame_equal(mapped, df[['weights.honda']])
+        with self.assertRaises(KeyError):
+            read_columnar(store, columns=['LineFit.azimuth'])
+
+    def test_writer_promotes_chunks(self):
+        df = example_frame(6)
+        store = os.path.join(self.path, 'store')
+        writer = ColumnarWriter(store, block_rows=2)
+        first = df.iloc[:3].copy()
+        first['weights.honda'] = np.arange(3, dtype=np.uint16)
+        writer.append(first)
+        writer.append(df.iloc[3:])
+        writer.close()
+        result = read_columnar(store, mmap=True)
+        self.assertEqual(result['weights.honda'].dtype, np.float64)
+        np.testing.assert_array_equal(result['weights.honda'],
+                                      [0., 1., 2., 1., 1., 1.])
+        expected = df.copy()
+        expected['weights.honda'] = result['weights.honda'].values
+        pd.testing.assert_frame_equal(result, expected)
+        self.assertEqual(sorted(os.listdir(self.path)), ['store'])
+
+    def test_load_cache_eviction(self):
+        df = example_frame(1000)
+        cache = LoadCache(os.path.join(self.path, 'cache'))
+        cache.put({'keys': 1}, df)
+        size = cache.nbytes
+        cache.max_bytes = int(size * 1.5)
+        os.utime(cache.entries()[0], (0, 0))
+        cache.put({'keys': 2}, df)
+        self.assertNotIn({'keys': 1}, cache)
+        pd.testing.assert_frame_equal(cache.get({'keys': 2}), df)
+        self.assertIsNone(cache.get({'keys': 3}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,406 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from nuance.data_handler.datasethandler import DataSet, DataSetHandler
+from nuance.data_handler.i3hdf_to_df import HDFContainer
+from nuance.tests.helpers import dataset_properties
+from nuance.tests.helpers import make_dataset
+from nuance.tests.helpers import write_dataset_file
+from nuance.tests.helpers import write_i3_hdf
+
+
+class TestDataSet(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.file_list = make_dataset(self.path)
+        self.dataset = DataSet(dataset_properties(self.path),
+                               db_dir=self.db_dir)
+        self.keys = ['LineFit.zenith', 'L4.score', 'weights.honda']
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.db_dir)
+
+
+class TestLoad(TestDataSet):
+    def test_load(self):
+        self.dataset.load(keys=self.keys, exists_col='exists')
+        self.assertTrue(self.dataset.loaded)
+        self.assertEqual(self.dataset.data.shape, (15, 3))
+        self.assertEqual(list(self.dataset.weights.columns), ['weights.honda'])
+
+
+class TestIterLoad(TestDataSet):
+    def test_chunks_equal_load(self):
+        chunks = list(self.dataset.iter_load(keys=self.keys,
+                                             exists_col='exists',
+                                             chunk_rows=2))
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1] * 3)
+        self.dataset.load(keys=self.keys, exists_col='exists')
+        pd.testing.assert_frame_equal(pd.concat(chunks).sort_index(),
+                                      self.dataset.data)
+
+    def test_numpy_chunks(self):
+        chunks = list(self.dataset.iter_load(keys=self.keys,
+                                             exists_col='exists',
+                                             as_numpy=True))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0].shape, (5, 3))
+        self.assertTrue(np.isnan(chunks[0][0, 0]))
+
+
+class TestLazyLoad(TestDataSet):
+    def test_columns_on_access(self):
+        self.dataset.load(keys=self.keys, exists_col='exists', lazy=True)
+        self.assertFalse(self.dataset.loaded)
+        lazy = self.dataset.lazy_columns
+        self.assertEqual(len(lazy.cache), 0)
+        zenith = self.dataset['LineFit.zenith']
+        self.assertEqual(list(lazy.cache), ['LineFit.zenith'])
+        # columns are sized by their values, the shared index once
+        self.assertEqual(lazy.cache.nbytes, zenith.nbytes)
+        self.assertEqual(lazy.nbytes, zenith.nbytes +
+                         lazy.index.memory_usage(deep=True))
+
+        full = DataSet(dataset_properties(self.path))
+        full.load(keys=self.keys, exists_col='exists')
+        np.testing.assert_array_equal(zenith, full['LineFit.zenith'])
+        pd.testing.assert_frame_equal(self.dataset.weights, full.weights)
+
+    def test_table_group_and_eviction(self):
+        self.dataset.load(keys=['LineFit.zenith', 'LineFit.energy',
+                                'L4.score'], lazy=True, max_bytes=200)
+        values = self.dataset['LineFit']
+        self.assertEqual(values.shape, (15, 2))
+        self.dataset['L4.score']
+        self.assertEqual(list(self.dataset.lazy_columns.cache), ['L4.score'])
+        with self.assertRaises(KeyError):
+            self.dataset['LineFit.azimuth']
+
+    def test_table_after_cached_column(self):
+        self.dataset.load(keys=['LineFit.zenith', 'LineFit.energy'],
+                          lazy=True, max_bytes=200)
+        lazy = self.dataset.lazy_columns
+        zenith = self.dataset['LineFit.zenith']
+        # loading energy evicts the cached zenith column
+        values = lazy['LineFit']
+        self.assertEqual(list(values.columns),
+                         ['LineFit.zenith', 'LineFit.energy'])
+        np.testing.assert_array_equal(values['LineFit.zenith'].values, zenith)
+
+
+class TestIncrementalLoad(TestDataSet):
+    def _add_file(self):
+        run = np.full(2, 200)
+        events = np.arange(2)
+        write_i3_hdf(os.path.join(self.path, 'Run0200.hd5'), {
+            'LineFit': {'Run': run, 'Event': events, 'zenith': [1., 2.]},
+            'L4': {'Run': run, 'Event': events, 'score': [.5, .6]},
+            'weights': {'Run': run, 'Event': events, 'honda': [1., 1.]}})
+
+    def test_only_new_files_across_sessions(self):
+        self.dataset.load(keys=self.keys, exists_col='exists',
+                          incremental=True)
+        self.assertEqual(len(self.dataset.files_loaded), 3)
+        self.assertEqual(len(self.dataset.data), 15)
+        self._add_file()
+
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        dataset.load(keys=self.keys, exists_col='exists', incremental=True)
+        self.assertEqual(sorted(dataset.files_loaded)[-1], 'Run0200.hd5')
+        self.assertEqual(len(dataset.files_loaded), 4)
+        self.assertEqual(len(dataset.weights), 17)
+
+        full = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        full.load(keys=self.keys, exists_col='exists')
+        pd.testing.assert_frame_equal(dataset.data, full.data)
+
+    def test_increments_committed_last(self):
+        from nuance.data_handler import datasethandler
+        self.dataset.load(keys=self.keys, incremental=True)
+        self._add_file()
+        # the process dies after the pickle but before the json is written
+        write_json = datasethandler.write_json
+        datasethandler.write_json = lambda *args: False
+        try:
+            self.dataset.load(keys=self.keys, incremental=True)
+        finally:
+            datasethandler.write_json = write_json
+        self.assertEqual(len(self.dataset.data), 17)
+
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        dataset.load(keys=self.keys, incremental=True)
+        self.assertEqual(len(dataset.data), 17)
+        self.assertFalse(dataset.data.index.duplicated().any())
+        # only the new file was pickled for the increment
+        parts = sorted(os.listdir(dataset._loaded_dir))
+        self.assertEqual(parts, ['part_0.pkl', 'part_1.pkl'])
+        self.assertEqual(len(pd.read_pickle(
+            os.path.join(dataset._loaded_dir, 'part_1.pkl'))), 2)
+
+    def test_other_load_in_between(self):
+        self.dataset.load(keys=self.keys, incremental=True)
+        self.dataset.load(keys=self.keys, cuts=[('L4.score', '>', 0.5)])
+        self.assertEqual(len(self.dataset.data), 6)
+        self.dataset.load(keys=self.keys, incremental=True)
+        self.assertEqual(len(self.dataset.data), 15)
+        self._add_file()
+        self.dataset.load(keys=self.keys, incremental=True)
+        self.assertEqual(len(self.dataset.data), 17)
+
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        dataset.load(keys=self.keys, incremental=True)
+        pd.testing.assert_frame_equal(dataset.data, self.dataset.data)
+
+    def test_changed_options_reload(self):
+        self.dataset.load(keys=self.keys, incremental=True)
+        keys = ['LineFit.zenith', 'weights.honda']
+        self.dataset.load(keys=keys, incremental=True)
+        self.assertEqual(list(self.dataset.data.columns), keys)
+        with self.assertRaises(ValueError):
+            self.dataset.load(keys=self.keys, n_files=1, incremental=True)
+
+
+class TestLoadCache(TestDataSet):
+    def test_cache_hit_skips_hdf(self):
+        self.dataset.load(keys=self.keys, exists_col='exists', cache=True)
+        expected = self.dataset.data
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        get_df = HDFContainer.get_df
+        HDFContainer.get_df = None
+        try:
+            dataset.load(keys=self.keys, exists_col='exists', cache=True)
+        finally:
+            HDFContainer.get_df = get_df
+        pd.testing.assert_frame_equal(dataset.data, expected)
+        self.assertEqual(list(dataset.data.dtypes), list(expected.dtypes))
+        self.assertEqual(list(dataset.weights.columns), ['weights.honda'])
+
+        # bool column of events missing in its table
+        write_i3_hdf(os.path.join(self.path, 'Run0200.hd5'), {
+            'LineFit': {'Run': np.full(3, 200), 'Event': np.arange(3),
+                        'zenith': [1., 2., 3.]},
+            'B': {'Run': np.full(2, 200), 'Event': [1, 2],
+                  'flag': [True, False]}})
+        properties = dict(dataset_properties(self.path),
+                          files=['Run0200.hd5'])
+        keys = ['LineFit.zenith', 'B.flag']
+        first = DataSet(properties, db_dir=self.db_dir)
+        first.load(keys=keys, cache=True)
+        self.assertEqual(first.data['B.flag'].dtype, object)
+        second = DataSet(properties, db_dir=self.db_dir)
+        second.load(keys=keys, cache=True)
+        self.assertEqual(list(second.data.dtypes), list(first.data.dtypes))
+        pd.testing.assert_frame_equal(second.data, first.data)
+
+    def test_options_and_seed_in_key(self):
+        self.dataset.load(keys=self.keys, cache=True, n_files=2, seed=1)
+        first = self.dataset.files_loaded
+        self.dataset.load(keys=self.keys, cache=True, n_files=2, seed=1)
+        self.assertEqual(self.dataset.files_loaded, first)
+        self.dataset.load(keys=self.keys, exists_col='exists', cache=True)
+        self.assertEqual(len(self.dataset.load_cache.entries()), 2)
+        self.assertEqual(self.dataset.data['LineFit.zenith'].isnull().sum(),
+                         3)
+
+
+class TestColumnarStore(TestDataSet):
+    def test_memory_mapped_load(self):
+        dataset = DataSet(dataset_properties(self.path),
+                          data_dir=self.db_dir)
+        dataset.to_columnar(keys=self.keys, exists_col='exists')
+        dataset.load(keys=self.keys[:1] + self.keys[2:], from_columnar=True)
+        self.assertIsInstance(dataset.data['LineFit.zenith'].values,
+                              np.memmap)
+        self.assertEqual(list(dataset.weights.columns), ['weights.honda'])
+
+        self.dataset.load(keys=self.keys, exists_col='exists')
+        dataset.load(from_columnar=True)
+        pd.testing.assert_frame_equal(dataset.data.sort_index(),
+                                      self.dataset.data)
+
+
+class TestMasks(TestDataSet):
+    def setUp(self):
+        super(TestMasks, self).setUp()
+        self.dataset.load(keys=self.keys, exists_col='exists')
+        self.full = self.dataset.data
+
+    def test_masks_dont_copy_full_data(self):
+        n_passing = self.dataset.add_mask('L4.score > 0.3', name='score')
+        self.assertEqual(n_passing, 9)
+        self.dataset.add_mask([('weights.honda', '<', 1.2)], name='honda')
+        self.assertIs(self.dataset.full_data, self.full)
+        expected = self.full[(self.full['L4.score'] > 0.3) &
+                             (self.full['weights.honda'] < 1.2)]
+        pd.testing.assert_frame_equal(self.dataset.data, expected)
+        pd.testing.assert_frame_equal(self.dataset.weights,
+                                      expected[['weights.honda']])
+        pd.testing.assert_frame_equal(self.dataset.view(['honda']),
+                                      self.full[self.full['weights.honda'] <
+                                                1.2])
+        self.dataset.remove_mask('honda')
+        self.assertEqual(len(self.dataset.data), 9)
+        self.dataset.clear_masks()
+        self.assertIs(self.dataset.data, self.full)
+        self.assertEqual(len(self.dataset.weights), 15)
+
+    def test_cutflow(self):
+        self.dataset.add_mask('L4.score > 0.3', name='score')
+        self.dataset.add_mask('weights.honda < 1.2', name='honda')
+        cutflow = self.dataset.cutflow()
+        self.assertEqual(list(cutflow.index), ['all', 'score', 'honda'])
+        self.assertEqual(list(cutflow['events']), [15, 9, 6])
+        np.testing.assert_allclose(cutflow['weights.honda'],
+                                   [15., 9., 4.5])
+
+    def test_drop_keeps_masks(self):
+        self.dataset.add_mask('L4.score > 0.3')
+        self.dataset.drop(['LineFit.zenith'], reason='test')
+        self.assertEqual(self.dataset.data.shape, (9, 2))
+        # loading again replaces the data and removes all masks
+        self.dataset.load(keys=self.keys, exists_col='exists')
+        self.assertEqual(self.dataset.masks, {})
+        self.assertEqual(len(self.dataset.data), 15)
+
+
+    def test_spill_keeps_weights(self):
+        weights = self.dataset.weights * 2.
+        self.dataset.weights = weights
+        self.dataset.add_mask('L4.score > 0.3')
+        self.dataset.spill(self.db_dir)
+        self.assertTrue(self.dataset.spilled)
+        self.assertEqual(self.dataset.nbytes, 0)
+        pd.testing.assert_frame_equal(self.dataset.weights,
+                                      weights[self.dataset.mask])
+        pd.testing.assert_frame_equal(self.dataset.full_data, self.full)
+
+
+class TestLoadAll(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i, data_type in enumerate(['numu', 'nue', 'corsika']):
+            path = tempfile.mkdtemp()
+            make_dataset(path, run_offset=100 * (i + 1))
+            write_dataset_file(self.db_dir, path, data_type)
+            self.paths.append(path)
+        self.keys = ['LineFit.zenith', 'L4.score', 'weights.honda']
+
+    def tearDown(self):
+        for path in self.paths + [self.db_dir]:
+            shutil.rmtree(path)
+
+    def _load(self, **kwargs):
+        handler = DataSetHandler(db_dir=self.db_dir)
+        timings = handler.load_all(keys=self.keys, exists_col='exists',
+                                   **kwargs)
+        return handler, timings
+
+    def test_parallel_equals_serial(self):
+        serial, _ = self._load(skip='corsika')
+        # 4 workers for 2 data sets read the files of each in 2 processes
+        for n_workers in [2, 4]:
+            parallel, timings = self._load(skip='corsika',
+                                           n_workers=n_workers)
+            self.assertEqual(list(timings.keys()), ['nue', 'numu'])
+            self.assertFalse(parallel['corsika'].loaded)
+            for name in ['nue', 'numu']:
+                self.assertTrue(parallel[name].loaded)
+                pd.testing.assert_frame_equal(parallel[name].data,
+                                              serial[name].data)
+                pd.testing.assert_frame_equal(parallel[name].weights,
+                                              serial[name].weights)
+                self.assertEqual(parallel[name].files_loaded,
+                                 serial[name].files_loaded)
+
+    def test_more_datasets_than_workers(self):
+        handler, timings = self._load(n_workers=2)
+        self.assertEqual(len(timings), 3)
+        self.assertTrue(all(handler[name].loaded for name in timings))
+
+    def test_observables(self):
+        expected = sorted(map(str, DataSet(
+            dataset_properties(self.paths[0]),
+            db_dir=tempfile.mkdtemp(dir=self.db_dir)).observables()))
+        self.assertIn('L4.score', expected)
+        handler = DataSetHandler(db_dir=self.db_dir)
+        self.assertFalse(handler['numu'].is_schema_indexed())
+        self.assertEqual(handler.get_observables(n_workers=3), expected)
+        # the workers stored the schemas, a new handler doesn't scan files
+        handler = DataSetHandler(db_dir=self.db_dir)
+        self.assertTrue(all(handler[name].is_schema_indexed()
+                            for name in handler.datasets))
+        self.assertEqual(handler.observables, expected)
+
+    def test_apply_selection(self):
+        handler, _ = self._load(skip=['corsika'])
+        expected = handler['numu'].data
+        expected = expected[(expected['L4.score'] > 0.3) &
+                            (expected['weights.honda'] < 1.2)]
+        handler.apply_selection('L4.score > 0.3 & weights.honda < 1.2')
+        for name in ['numu', 'nue']:
+            self.assertEqual(len(handler[name].data), len(expected))
+            pd.testing.assert_frame_equal(handler[name].weights,
+                                          handler[name].data[['weights.honda']])
+        pd.testing.assert_frame_equal(handler['numu'].data, expected)
+        handler.apply_cut('L4.score', '<=', 0.5)
+        self.assertTrue((handler['numu'].data['L4.score'] <= 0.5).all())
+        self.assertEqual(list(handler.cutflow()['nue'].index),
+                         ['all', 'L4.score > 0.3 & weights.honda < 1.2',
+                          'L4.score <= 0.5'])
+        handler.remove_mask('L4.score <= 0.5')
+        self.assertEqual(len(handler['numu'].data), len(expected))
+        handler.clear_masks()
+        self.assertEqual(len(handler['numu'].data), 15)
+
+    def test_memory_budget(self):
+        serial, _ = self._load()
+        spill_dir = tempfile.mkdtemp(dir=self.db_dir)
+        size = serial['numu'].nbytes
+        self.assertGreater(size, 0)
+        handler = DataSetHandler(db_dir=self.db_dir, max_bytes=size,
+                                 spill_dir=spill_dir)
+        handler.load_all(keys=self.keys, exists_col='exists')
+        spilled = [name for name in handler.datasets
+                   if handler._datasets[name].spilled]
+        self.assertEqual(sorted(spilled), ['corsika', 'nue'])
+        self.assertEqual(len(os.listdir(spill_dir)), 2)
+        self.assertLessEqual(handler.nbytes, size)
+        handler['nue'].add_mask('L4.score > 0.3')
+        # reading back nue spills numu, the least recently used one
+        pd.testing.assert_frame_equal(handler['nue'].full_data,
+                                      serial['nue'].data)
+        self.assertTrue(handler._datasets['numu'].spilled)
+        self.assertFalse(handler._datasets['nue'].spilled)
+        self.assertEqual(len(handler['nue'].data), 9)
+        cutflows = handler.cutflow()
+        self.assertEqual(list(cutflows['nue']['events']), [15, 9])
+        # nue with its selected view exceeds the budget on its own
+        handler.clear_masks()
+        self.assertLessEqual(handler.nbytes, size)
+        for name in ['numu', 'nue', 'corsika']:
+            handler[name].data
+            self.assertFalse(handler._datasets[name].spilled)
+            self.assertLessEqual(handler.nbytes, size)
+        for name in handler.datasets:
+            handler._datasets[name].close()
+        self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_worker_error(self):
+        handler = DataSetHandler(db_dir=self.db_dir)
+        with self.assertRaises(RuntimeError):
+            handler.load_all(keys=['Missing.col'], n_workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
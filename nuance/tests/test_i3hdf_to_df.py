@@ -0,0 +1,323 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import tables
+
+from nuance.data_handler import i3hdf_to_df
+from nuance.data_handler.i3hdf_to_df import HDFContainer
+from nuance.data_handler.i3hdf_to_df import get_values_from_table
+from nuance.data_handler.i3hdf_to_df import merge_tables
+from nuance.data_handler.i3hdf_to_df import pack_ids
+from nuance.data_handler.i3hdf_to_df import unpack_ids
+from nuance.tests.helpers import make_dataset
+from nuance.tests.helpers import write_i3_hdf
+
+
+class TestHDFContainer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_list = make_dataset(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+class TestReadTable(TestHDFContainer):
+    def test_projection(self):
+        container = HDFContainer(file_list=self.file_list)
+        table = container.read_table(self.file_list[0], 'LineFit', ['zenith'])
+        self.assertEqual(list(table.columns), ['zenith'])
+        self.assertEqual(table.index.names, ['Run', 'Event', 'SubEvent'])
+        self.assertEqual(len(table), 5)
+
+    def test_exists_col_is_read(self):
+        container = HDFContainer(file_list=self.file_list, exists_col='exists')
+        table = container.read_table(self.file_list[0], 'LineFit', ['zenith'])
+        self.assertEqual(sorted(table.columns), ['exists', 'zenith'])
+
+    def test_get_values(self):
+        container = HDFContainer(file_list=self.file_list[:1],
+                                 exists_col='exists')
+        values = container.get_values('LineFit', ['zenith', 'energy'])
+        self.assertEqual(list(values.columns),
+                         ['LineFit.zenith', 'LineFit.energy'])
+        self.assertTrue(np.isnan(values['LineFit.zenith'].values[0]))
+        self.assertTrue(np.all(np.isfinite(values['LineFit.zenith'][1:])))
+
+    def test_get_values_all_files(self):
+        container = HDFContainer(file_list=self.file_list)
+        values = container.get_values('LineFit', 'energy')
+        self.assertEqual(len(values), 15)
+        self.assertEqual(container.get_n_rows('LineFit'), [5, 5, 5])
+        np.testing.assert_array_equal(
+            values.index.get_level_values('Run'),
+            np.repeat([100, 101, 102], 5))
+        np.testing.assert_array_equal(values['LineFit.energy'].values[5:10],
+                                      np.arange(5) * 10. + 1)
+
+
+class TestGetValuesFromTable(TestHDFContainer):
+    def setUp(self):
+        super(TestGetValuesFromTable, self).setUp()
+        self.f = tables.open_file(self.file_list[1], 'r')
+        self.table = self.f.root.LineFit
+
+    def tearDown(self):
+        self.f.close()
+        super(TestGetValuesFromTable, self).tearDown()
+
+    def test_float(self):
+        values = get_values_from_table(self.table, ['Event', 'energy'],
+                                       block_rows=2)
+        self.assertEqual(values.dtype, float)
+        np.testing.assert_array_equal(values[:, 0], np.arange(5))
+        np.testing.assert_array_equal(values[:, 1], np.arange(5) * 10. + 1)
+
+    def test_preserve_dtype_and_range(self):
+        values = get_values_from_table(self.table, ['Run', 'exists'],
+                                       dtype=None, start=1, stop=4)
+        self.assertEqual(values.dtype['Run'], np.uint32)
+        self.assertEqual(values.dtype['exists'], np.uint8)
+        np.testing.assert_array_equal(values['Run'], [101] * 3)
+
+    def test_out(self):
+        out = np.zeros((7, 2), dtype=np.float32)
+        get_values_from_table(self.table, ['zenith', 'energy'],
+                              start=3, out=out[5:])
+        np.testing.assert_array_equal(out[5:, 1], [31., 41.])
+        self.assertTrue(np.all(out[:5] == 0))
+        with self.assertRaises(ValueError):
+            get_values_from_table(self.table, ['zenith'], out=out)
+
+
+class TestMergeTables(unittest.TestCase):
+    def _tab(self, run, event, **cols):
+        cols.update(Run=np.array(run, dtype=np.uint32),
+                    Event=np.array(event, dtype=np.uint32))
+        return pd.DataFrame(cols).set_index(['Run', 'Event'])
+
+    def test_pack_roundtrip(self):
+        ids = [np.array([3, 1, 7]), np.array([0, 2**20, 5])]
+        bounds = [(1, 7), (0, 2**20)]
+        keys = pack_ids(ids, bounds)
+        self.assertEqual(list(np.argsort(keys)), [1, 0, 2])
+        for a, b in zip(unpack_ids(keys, bounds), ids):
+            np.testing.assert_array_equal(a, b)
+        self.assertIsNone(pack_ids(ids, [(0, 2**40), (0, 2**40)]))
+
+    def test_equals_outer_join(self):
+        tabs = [self._tab([2, 1, 1], [0, 5, 3], a=[1., 2., 3.]),
+                self._tab([1, 3], [3, 0], b=np.array([7, 8])),
+                self._tab([1], [3], c=np.array([True])),
+                self._tab([1, 1, 2, 3], [5, 3, 0, 0],
+                          d=np.array([1, 2, 3, 4], dtype=np.float32))]
+        expected = reduce(lambda df, tab: df.join(tab, how='outer'), tabs)
+        pd.testing.assert_frame_equal(merge_tables(tabs), expected)
+
+    def test_reuses_sorted_tables_and_releases_inputs(self):
+        tabs = [self._tab([1, 1, 2], [3, 5, 0], a=[1., 2., 3.]),
+                self._tab([2, 1, 1], [0, 3, 5], b=[4., 5., 6.]),
+                self._tab([1], [5], c=[7.])]
+        expected = reduce(lambda df, tab: df.join(tab, how='outer'), tabs)
+        a = tabs[0]['a'].values
+        df = merge_tables(tabs)
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertTrue(np.shares_memory(df['a'].values, a))
+        self.assertFalse(np.shares_memory(df['b'].values, a))
+        self.assertEqual(tabs, [None, None, None])
+
+    def test_duplicates_fall_back_to_join(self):
+        tabs = [self._tab([1, 1], [3, 3], a=[1., 2.]),
+                self._tab([1], [3], b=[5.])]
+        expected = tabs[0].join(tabs[1], how='outer')
+        pd.testing.assert_frame_equal(merge_tables(tabs), expected)
+
+
+class TestGetDf(TestHDFContainer):
+    def test_get_df(self):
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists')
+        df = container.get_df(['LineFit.zenith', 'L4.score', 'weights.honda'])
+        self.assertEqual(df.shape, (15, 3))
+        self.assertEqual(df['LineFit.zenith'].isnull().sum(), 3)
+        self.assertTrue(df.index.is_monotonic_increasing)
+
+    def test_parallel_equals_serial(self):
+        observables = ['LineFit.zenith', 'LineFit.energy', 'L4.score']
+        serial = HDFContainer(file_list=self.file_list, exists_col='exists')
+        parallel = HDFContainer(file_list=self.file_list, exists_col='exists',
+                                n_workers=2)
+        pd.testing.assert_frame_equal(parallel.get_df(observables),
+                                      serial.get_df(observables))
+        self.assertEqual(parallel.get_observables(check_all=True),
+                         serial.get_observables(check_all=True))
+
+
+class TestCuts(TestHDFContainer):
+    observables = ['LineFit.zenith', 'LineFit.energy', 'L4.score']
+
+    def _expected(self, mask_func):
+        df = HDFContainer(file_list=self.file_list,
+                          exists_col='exists').get_df(self.observables)
+        return df[mask_func(df)]
+
+    def test_single_table_cut(self):
+        cuts = [('L4.score', '>', 0.3)]
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', cuts=cuts)
+        expected = self._expected(lambda df: df['L4.score'] > 0.3)
+        pd.testing.assert_frame_equal(container.get_df(self.observables),
+                                      expected)
+
+    def test_exists_and_multiple_tables(self):
+        cuts = [('L4.score', '<', 0.8), ('LineFit.energy', '>=', 1.)]
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', cuts=cuts, n_workers=2)
+        expected = self._expected(lambda df: (df['L4.score'] < 0.8) &
+                                  (df['LineFit.energy'] >= 1.))
+        self.assertEqual(len(expected), 9)
+        pd.testing.assert_frame_equal(container.get_df(self.observables),
+                                      expected)
+        chunks = list(container.iter_chunks(self.observables))
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+    def test_not_equal_keeps_missing(self):
+        cuts = [('LineFit.energy', '!=', 10.)]
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', cuts=cuts)
+        expected = self._expected(lambda df: df['LineFit.energy'] != 10.)
+        pd.testing.assert_frame_equal(container.get_df(self.observables),
+                                      expected)
+
+    def test_missing_events_like_nans(self):
+        # table B lacks events 0 and 1
+        file_name = os.path.join(self.path, 'Run0100.hd5')
+        write_i3_hdf(file_name, {
+            'A': {'Run': np.zeros(4), 'Event': np.arange(4),
+                  'x': np.arange(4.)},
+            'B': {'Run': np.zeros(2), 'Event': [2, 3], 'n': [3., 4.]}})
+        observables = ['A.x', 'B.n']
+        df = HDFContainer(file_list=[file_name]).get_df(observables)
+        for cuts, mask in [([('B.n', '!=', 3.)], df['B.n'] != 3.),
+                           ([('B.n', '<', 4.)], df['B.n'] < 4.),
+                           ([('B.n', '!=', 3.), ('A.x', '<', 3.)],
+                            (df['B.n'] != 3.) & (df['A.x'] < 3.))]:
+            container = HDFContainer(file_list=[file_name], cuts=cuts)
+            pd.testing.assert_frame_equal(container.get_df(observables),
+                                          df[mask])
+
+    def test_cuts_evaluated_once_per_file(self):
+        cuts = [('L4.score', '<', 0.8), ('LineFit.energy', '>=', 1.)]
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', cuts=cuts)
+        get_where_list = tables.Table.get_where_list
+        calls = []
+
+        def counting(table, *args, **kwargs):
+            calls.append(table._v_name)
+            return get_where_list(table, *args, **kwargs)
+
+        tables.Table.get_where_list = counting
+        try:
+            container.get_df(self.observables + ['weights.honda'])
+            list(container.iter_chunks(self.observables))
+        finally:
+            tables.Table.get_where_list = get_where_list
+        self.assertEqual(len(calls), len(self.file_list) * len(cuts))
+
+    def test_one_pool_per_call(self):
+        cuts = [('L4.score', '<', 0.8), ('LineFit.energy', '>=', 1.)]
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', cuts=cuts, n_workers=2)
+        pools = []
+
+        def counting(*args, **kwargs):
+            pools.append(Pool(*args, **kwargs))
+            return pools[-1]
+
+        Pool = i3hdf_to_df.Pool
+        i3hdf_to_df.Pool = counting
+        try:
+            container.get_df(self.observables + ['weights.honda'])
+            self.assertEqual(len(pools), 1)
+            with container:
+                container.get_observables(check_all=True)
+                container.get_df(self.observables)
+            self.assertEqual(len(pools), 2)
+        finally:
+            i3hdf_to_df.Pool = Pool
+        self.assertIsNone(container._pool)
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            HDFContainer(file_list=self.file_list, cuts=[('L4.score', 'in', 1)])
+
+
+class TestCompact(TestHDFContainer):
+    observables = ['LineFit.zenith', 'LineFit.energy', 'L4.score',
+                   'weights.honda']
+
+    def test_dtypes(self):
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', compact=True,
+                                 float64_cols=['weights.honda'])
+        df = container.get_df(self.observables)
+        self.assertEqual(df['LineFit.zenith'].dtype, np.float32)
+        self.assertEqual(df['weights.honda'].dtype, np.float64)
+        self.assertEqual(df.index.levels[0].dtype, np.uint8)
+        self.assertEqual(df['LineFit.zenith'].isnull().sum(), 3)
+        expected = HDFContainer(file_list=self.file_list,
+                                exists_col='exists').get_df(self.observables)
+        np.testing.assert_allclose(df.values.astype(float), expected.values,
+                                   rtol=1e-6)
+        chunks = list(container.iter_chunks(self.observables))
+        self.assertEqual(chunks[0]['L4.score'].dtype, np.float32)
+
+    def test_same_id_dtypes_for_all_files(self):
+        file_list = []
+        for run, events in [(1, np.arange(3)), (2, np.arange(298, 301))]:
+            file_list.append(os.path.join(self.path, 'Ids{}.hd5'.format(run)))
+            write_i3_hdf(file_list[-1], {
+                'A': {'Run': np.full(3, run), 'Event': events,
+                      'x': np.arange(3.)}})
+        container = HDFContainer(file_list=file_list, id_cols=['Run', 'Event'],
+                                 compact=True)
+        chunks = list(container.iter_chunks(['A.x']))
+        for chunk in chunks:
+            self.assertEqual([level.dtype for level in chunk.index.levels],
+                             [np.uint8, np.uint16])
+        self.assertEqual(chunks[0].index.levels[1].dtype,
+                         container.get_df(['A.x']).index.levels[1].dtype)
+
+    def test_nullable_integers(self):
+        container = HDFContainer(file_list=self.file_list,
+                                 exists_col='exists', compact=True)
+        df = container.get_df(['LineFit.SubEventStream', 'L4.score'])
+        self.assertEqual(str(df['LineFit.SubEventStream'].dtype), 'UInt32')
+        self.assertEqual(df['LineFit.SubEventStream'].isnull().sum(), 3)
+
+    def test_merge_missing_rows(self):
+        ids = np.array([1, 2], dtype=np.uint8)
+        a = pd.DataFrame({'Run': ids, 'Event': ids, 'a': [1., 2.]})
+        a = a.set_index(['Run', 'Event'])
+        b = pd.DataFrame({'Run': ids[:1], 'Event': ids[:1],
+                          'b': np.array([3], dtype=np.int16),
+                          'c': np.array([True])})
+        b = b.set_index(['Run', 'Event'])
+        df = merge_tables([a, b], compact=True)
+        self.assertEqual(str(df['b'].dtype), 'Int16')
+        self.assertEqual(str(df['c'].dtype), 'boolean')
+        self.assertEqual(list(df['b'].isnull()), [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import nuance.data_handler
+from nuance.tests.helpers import write_dataset_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+HEAVY = ['numpy', 'pandas', 'tables', 'tqdm', 'numexpr', 'pyarrow']
+# seconds, importing pandas alone takes longer on most machines. Timing
+# depends on the machine, so it is only checked if NUANCE_IMPORT_BUDGET is set.
+IMPORT_BUDGET = os.environ.get('NUANCE_IMPORT_BUDGET')
+
+SCRIPT = '''
+import json, sys, time
+start = time.time()
+{}
+print(json.dumps({{'time': time.time() - start,
+                  'heavy': [m for m in {} if m in sys.modules]}}))
+'''
+
+
+def run_isolated(code):
+    ''' Run code in a fresh interpreter and return import time and the
+        heavy modules it imported
+    '''
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT.format(code, HEAVY)], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+@unittest.skipIf(sys.version_info < (3, 7),
+                 'lazy package attributes need python 3.7')
+class TestImportTime(unittest.TestCase):
+    def check(self, code):
+        result = run_isolated(code)
+        self.assertEqual(result['heavy'], [], code)
+        if IMPORT_BUDGET is not None:
+            self.assertLess(result['time'], float(IMPORT_BUDGET), code)
+
+    def test_packages(self):
+        self.check('import nuance.data_handler\n'
+                   'import nuance.job_handler\n'
+                   'import nuance.icetray_modules')
+
+    def test_light_modules(self):
+        self.check('from nuance.data_handler import parser\n'
+                   'from nuance.data_handler.i3hdf_to_df import '
+                   'ObservableName\n'
+                   'from nuance.data_handler import selection, schema')
+
+    def test_handler_startup(self):
+        db_dir = tempfile.mkdtemp()
+        try:
+            for i in range(50):
+                write_dataset_file(db_dir, '/data', 'type{}'.format(i))
+            self.check('from nuance.data_handler import DataSetHandler\n'
+                       'handler = DataSetHandler(db_dir={!r})\n'
+                       'handler["type0"]'.format(db_dir))
+        finally:
+            shutil.rmtree(db_dir)
+
+    def test_heavy_modules_on_use(self):
+        result = run_isolated('from nuance.data_handler import selection\n'
+                              'selection.pd.DataFrame')
+        self.assertIn('pandas', result['heavy'])
+
+    def test_missing_attributes(self):
+        with self.assertRaises(AttributeError):
+            nuance.data_handler.no_such_module
+        # missing dependencies of a submodule are reported as such
+        error = ModuleNotFoundError("No module named 'paramiko'",
+                                    name='paramiko')
+        with mock.patch('importlib.import_module', side_effect=error):
+            with self.assertRaises(ModuleNotFoundError):
+                nuance.data_handler.remote
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nuance.data_handler.jsonfile import read_json, write_json
+
+
+class TestJsonFile(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.path, 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        self.assertIsNone(read_json(self.file_name))
+        content = {'files': {'Run0000.hd5': [10, 1.5]}}
+        self.assertTrue(write_json(self.file_name, content))
+        self.assertEqual(read_json(self.file_name), content)
+        self.assertEqual(os.listdir(self.path), ['index.json'])
+
+    def test_corrupt_and_unwritable(self):
+        with open(self.file_name, 'w') as output:
+            output.write('{"files": ')
+        self.assertIsNone(read_json(self.file_name, 'Index'))
+        missing_dir = os.path.join(self.path, 'missing', 'index.json')
+        self.assertFalse(write_json(missing_dir, {}, 'Index'))
+
+
+if __name__ == '__main__':
+    unittest.main()
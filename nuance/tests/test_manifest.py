@@ -0,0 +1,77 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from nuance.data_handler import manifest
+from nuance.data_handler.datasethandler import DataSet
+from nuance.data_handler.manifest import FileManifest
+from nuance.tests.helpers import dataset_properties
+from nuance.tests.helpers import make_dataset
+
+
+class TestFileManifest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.file_list = make_dataset(self.path)
+        self.manifest_path = os.path.join(self.db_dir, 'numu.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.db_dir)
+
+    def test_scan_and_reuse(self):
+        files = FileManifest(self.manifest_path, self.path)
+        self.assertEqual(files.names, ['Run0000.hd5', 'Run0001.hd5',
+                                       'Run0002.hd5'])
+        self.assertEqual(files.size(), sum(os.path.getsize(f)
+                                           for f in self.file_list))
+        self.assertEqual(files.n_events(), 15)
+        # unchanged directory: neither scanned nor files opened again
+        with mock.patch.object(manifest, 'scan_directory') as scan, \
+                mock.patch.object(manifest, 'count_events') as count:
+            files = FileManifest(self.manifest_path, self.path)
+            self.assertEqual(files.n_events(), 15)
+            self.assertFalse(scan.called)
+            self.assertFalse(count.called)
+
+    def test_incremental_refresh(self):
+        files = FileManifest(self.manifest_path, self.path)
+        files.n_events()
+        os.remove(self.file_list[0])
+        make_dataset(self.path, n_files=4, n_events=2)
+        with mock.patch.object(manifest, 'count_events',
+                               wraps=manifest.count_events) as count:
+            self.assertTrue(files.refresh())
+            self.assertEqual(len(files), 4)
+            # all files were rewritten, only the new counts are read
+            self.assertEqual(files.n_events(), 8)
+            self.assertEqual(count.call_count, 4)
+        self.assertFalse(files.refresh())
+
+    def test_dataset(self):
+        open(os.path.join(self.path, '.DS_Store'), 'w').close()
+        properties = dict(dataset_properties(self.path),
+                          blacklist=['Run0001.hd5'])
+        dataset = DataSet(properties, db_dir=self.db_dir)
+        self.assertEqual(list(dataset.files), ['Run0000.hd5', 'Run0002.hd5'])
+        self.assertEqual(dataset.n_files, 2)
+        self.assertEqual(dataset.n_events, 10)
+        size = sum(os.path.getsize(f)
+                   for f in [self.file_list[0], self.file_list[2]])
+        self.assertEqual(dataset.size_on_disk, int(math.ceil(size / 1024.)))
+        self.assertTrue(os.path.isfile(self.manifest_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from nuance.data_handler.preprocessing import get_nan_ratio
+from nuance.data_handler.preprocessing import get_nan_ratio_total
+from nuance.data_handler.preprocessing import profile_columns
+
+
+def make_frame(n_rows=200, seed=0):
+    random_state = np.random.RandomState(seed)
+    df = pd.DataFrame({'a': random_state.normal(3., 2., n_rows),
+                       'b': random_state.uniform(-1., 1., n_rows),
+                       'const': np.full(n_rows, 7.),
+                       'empty': np.full(n_rows, np.nan),
+                       'w': random_state.uniform(0.1, 2., n_rows)})
+    df.loc[random_state.rand(n_rows) < 0.2, 'a'] = np.nan
+    df.loc[::7, 'const'] = np.nan
+    return df
+
+
+class TestProfileColumns(unittest.TestCase):
+    def expected(self, df, column):
+        values = df[column].values
+        w = df['w'].values
+        valid = ~np.isnan(values)
+        mean = np.average(values[valid], weights=w[valid])
+        variance = np.average((values[valid] - mean)**2, weights=w[valid])
+        return {'nan_ratio': np.sum(w[~valid]) / np.sum(w),
+                'min': values[valid].min(), 'max': values[valid].max(),
+                'mean': mean, 'std': np.sqrt(variance)}
+
+    def test_weighted_profile(self):
+        df = make_frame()
+        profile = profile_columns(df, weights='w')
+        self.assertEqual(list(profile.index), ['a', 'b', 'const', 'empty'])
+        for column in ['a', 'b', 'const']:
+            for stat, value in self.expected(df, column).items():
+                self.assertAlmostEqual(profile.loc[column, stat], value)
+        self.assertEqual(list(profile['constant']),
+                         [False, False, True, False])
+        self.assertAlmostEqual(profile.loc['empty', 'nan_ratio'], 1.)
+        self.assertTrue(np.isnan(profile.loc['empty', 'mean']))
+
+    def test_chunks_and_datasets(self):
+        df = make_frame(n_rows=500)
+        whole = profile_columns(df, ['a', 'b', 'const'], weights='w')
+        chunks = [df.iloc[i:i + 64] for i in range(0, len(df), 64)]
+        chunked = profile_columns(iter(chunks), ['a', 'b', 'const'],
+                                  weights=(c['w'].values for c in chunks))
+        pd.testing.assert_frame_equal(whole, chunked)
+
+        unweighted = profile_columns(chunks, ['a'])
+        self.assertAlmostEqual(unweighted.loc['a', 'mean'], df['a'].mean())
+        self.assertAlmostEqual(unweighted.loc['a', 'std'],
+                               df['a'].std(ddof=0))
+
+    def test_nan_ratio(self):
+        dfs = [make_frame(seed=1), make_frame(n_rows=50, seed=2)]
+        ratio = get_nan_ratio(dfs[0], ['a', 'const'],
+                              weight=dfs[0]['w'].values)
+        self.assertAlmostEqual(ratio['a'],
+                               self.expected(dfs[0], 'a')['nan_ratio'])
+        total = get_nan_ratio_total(dfs, ['a', 'const'], weight='w')
+        self.assertAlmostEqual(total['a'], self.expected(
+            pd.concat(dfs), 'a')['nan_ratio'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from nuance.data_handler import registry
+from nuance.data_handler.datasethandler import DataSetHandler
+from nuance.data_handler.registry import DataSetRegistry
+from nuance.tests.helpers import write_dataset_file
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.types = ['type{:03d}'.format(i) for i in range(200)]
+        for data_type in self.types:
+            write_dataset_file(self.db_dir, '/data/' + data_type, data_type)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir)
+
+    def test_compiled_once(self):
+        DataSetRegistry(self.db_dir)
+        with mock.patch.object(registry.json, 'load',
+                               wraps=json.load) as load:
+            compiled = DataSetRegistry(self.db_dir)
+            # only the registry itself is parsed
+            self.assertEqual(load.call_count, 1)
+        self.assertEqual(list(compiled.paths.keys()), self.types)
+        self.assertEqual(compiled.properties('type007')['local_path'],
+                         '/data/type007')
+
+    def test_changed_files(self):
+        compiled = DataSetRegistry(self.db_dir)
+        self.assertFalse(compiled.compile())
+        path = compiled.paths['type001']
+        with open(path, 'w') as output:
+            json.dump({'name': 'changed', 'type': 'type001', 'n_files': 1,
+                       'local_path': '/other'}, output)
+        os.remove(compiled.paths['type002'])
+        compiled = DataSetRegistry(self.db_dir)
+        self.assertEqual(compiled.properties('type001')['name'], 'changed')
+        self.assertNotIn('type002', compiled.paths)
+        self.assertEqual(len(compiled), 199)
+
+    def test_lazy_datasets(self):
+        handler = DataSetHandler(db_dir=self.db_dir)
+        self.assertEqual(len(handler._datasets), 200)
+        self.assertEqual(handler._datasets.created(), [])
+        self.assertEqual(handler['type042'].path, '/data/type042')
+        self.assertEqual([t for t, _ in handler._datasets.created()],
+                         ['type042'])
+        self.assertIn('type199', handler.datasets)
+        with self.assertRaises(KeyError):
+            handler['missing']
+
+
+if __name__ == '__main__':
+    unittest.main()
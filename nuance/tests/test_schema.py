@@ -0,0 +1,78 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from nuance.data_handler import schema
+from nuance.data_handler.datasethandler import DataSet
+from nuance.data_handler.i3hdf_to_df import HDFContainer
+from nuance.tests.helpers import dataset_properties
+from nuance.tests.helpers import make_dataset
+from nuance.tests.helpers import write_i3_hdf
+
+
+class TestSchemaIndex(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.file_list = make_dataset(self.path)
+        self.index_path = os.path.join(self.db_dir, 'numu.schema')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.db_dir)
+
+    def test_scan_schema(self):
+        tabs = schema.scan_schema(self.file_list[0])
+        self.assertEqual(sorted(tabs.keys()), ['L4', 'LineFit', 'weights'])
+        self.assertIn(['zenith', 'float64'], tabs['LineFit'])
+
+    def test_persisted_and_invalidated(self):
+        index = schema.SchemaIndex(self.index_path)
+        container = HDFContainer(file_list=self.file_list)
+        expected = container.get_observables(check_all=True)
+        self.assertEqual(container.get_observables(check_all=True,
+                                                   schema_index=index),
+                         expected)
+        index.save()
+
+        index = schema.SchemaIndex(self.index_path)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.missing(self.file_list), [])
+        stat = os.stat(self.file_list[1])
+        os.utime(self.file_list[1], (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(index.missing(self.file_list), [self.file_list[1]])
+
+    def test_dataset_uses_index(self):
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        observables = dataset.observables()
+        self.assertTrue(os.path.isfile(self.index_path))
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        scan_schema = schema.scan_schema
+        schema.scan_schema = None
+        try:
+            self.assertEqual(dataset.observables(), observables)
+        finally:
+            schema.scan_schema = scan_schema
+
+    def test_dataset_check_all(self):
+        # a later file lacks the L4 table
+        write_i3_hdf(os.path.join(self.path, 'Run0200.hd5'), {
+            'LineFit': {'Run': [200], 'Event': [0], 'zenith': [1.],
+                        'azimuth': [1.], 'energy': [1.]},
+            'weights': {'Run': [200], 'Event': [0], 'honda': [1.]}})
+        dataset = DataSet(dataset_properties(self.path), db_dir=self.db_dir)
+        self.assertIn('L4.score', map(str, dataset.observables()))
+        observables = dataset.observables(check_all=True,
+                                          blacklist_cols=['exists'])
+        self.assertNotIn('L4.score', map(str, observables))
+        self.assertIn('LineFit.zenith', map(str, observables))
+        self.assertNotIn('LineFit.exists', map(str, observables))
+        self.assertEqual(len(schema.SchemaIndex(self.index_path)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
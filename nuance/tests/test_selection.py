@@ -0,0 +1,67 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from nuance.data_handler import selection
+from nuance.data_handler.selection import Selection
+
+
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'L4.score': [0.95, 0.5, 0.99, np.nan],
+            'LineFit.zenith': [1.0, 1.0, 2.0, 1.0],
+            'LineFit.n_hits': pd.array([3, None, 12, 7], dtype='Int64')})
+
+    def test_expression(self):
+        cut = Selection('L4.score > 0.9 & LineFit.zenith < 1.5')
+        self.assertEqual(cut.observables, ['L4.score', 'LineFit.zenith'])
+        np.testing.assert_array_equal(cut.mask(self.df),
+                                      [True, False, False, False])
+        cut = Selection('(L4.score < 0.9) | ~(cos(LineFit.zenith) > 0)')
+        np.testing.assert_array_equal(cut.mask(self.df),
+                                      [False, True, True, False])
+
+    def test_cuts_equal_expression(self):
+        cuts = [('L4.score', '>', 0.9), ('LineFit.zenith', '<', 1.5)]
+        expression = 'L4.score > 0.9 and LineFit.zenith < 1.5'
+        np.testing.assert_array_equal(Selection(cuts).mask(self.df),
+                                      Selection(expression).mask(self.df))
+
+    def test_nullable_and_missing(self):
+        np.testing.assert_array_equal(
+            Selection([('LineFit.n_hits', '>', 5)]).mask(self.df),
+            [False, False, True, True])
+        np.testing.assert_array_equal(
+            Selection([('L4.score', 'is', None)]).mask(self.df),
+            [False, False, False, True])
+        np.testing.assert_array_equal(
+            Selection([('LineFit.n_hits', 'is not', np.nan),
+                       ('LineFit.zenith', 'is', 1.0)]).mask(self.df),
+            [True, False, False, True])
+
+    def test_empty_and_errors(self):
+        np.testing.assert_array_equal(Selection([]).mask(self.df),
+                                      [True] * 4)
+        with self.assertRaises(ValueError):
+            Selection([('L4.score', '=>', 0.9)])
+        with self.assertRaises(KeyError):
+            Selection('L3.score > 1e-3').mask(self.df)
+
+    def test_python_engine(self):
+        engine = selection.ENGINE
+        try:
+            selection.ENGINE = 'python'
+            np.testing.assert_array_equal(
+                Selection('L4.score > 0.9 & LineFit.zenith < 1.5').mask(
+                    self.df), [True, False, False, False])
+        finally:
+            selection.ENGINE = engine
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+# coding: utf-8
+from __future__ import division, print_function
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from nuance.data_handler import transfer
+from nuance.data_handler.datasethandler import DataSet, DataSetHandler
+from nuance.data_handler.transfer import LocalBackend, LocalChannel
+from nuance.data_handler.transfer import RemoteListing
+from nuance.data_handler.transfer import TransferEngine, TransferError
+from nuance.tests.helpers import make_dataset
+
+
+class FlakyChannel(LocalChannel):
+    ''' Fails the first read of each file after part of the data '''
+    opened = set()
+
+    def open(self, path):
+        source = super(FlakyChannel, self).open(path)
+        if path not in FlakyChannel.opened:
+            FlakyChannel.opened.add(path)
+            data = source.read(100)
+            source.close()
+            raise IOError('connection lost after {} bytes'.format(len(data)))
+        return source
+
+
+class FlakyBackend(LocalBackend):
+    def open_channel(self):
+        return FlakyChannel()
+
+
+class NoChecksumChannel(LocalChannel):
+    ''' Like an OpenSSH server without the check-file extension '''
+    def checksum(self, path):
+        return None
+
+
+class NoChecksumBackend(LocalBackend):
+    def open_channel(self):
+        return NoChecksumChannel()
+
+
+class TestTransferEngine(unittest.TestCase):
+    def setUp(self):
+        self.remote = tempfile.mkdtemp()
+        self.local = os.path.join(tempfile.mkdtemp(), 'numu')
+        self.files = [os.path.basename(f)
+                      for f in make_dataset(self.remote, n_files=5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.remote)
+        shutil.rmtree(os.path.dirname(self.local))
+
+    def assertSameFiles(self):
+        self.assertEqual(sorted(os.listdir(self.local)), self.files)
+        for name in self.files:
+            with open(os.path.join(self.remote, name), 'rb') as remote, \
+                    open(os.path.join(self.local, name), 'rb') as local:
+                self.assertEqual(remote.read(), local.read())
+
+    def test_download_and_skip(self):
+        engine = TransferEngine(LocalBackend(), n_channels=3)
+        self.assertEqual(sorted(engine.listdir(self.remote)), self.files)
+        status = engine.download(self.remote, self.files, self.local)
+        self.assertEqual(set(status.values()), {'downloaded'})
+        self.assertSameFiles()
+        status = engine.download(self.remote, self.files, self.local)
+        self.assertEqual(set(status.values()), {'exists'})
+
+    def test_resume_partial_files(self):
+        os.makedirs(self.local)
+        with open(os.path.join(self.remote, self.files[0]), 'rb') as remote:
+            head = remote.read(1000)
+        # a .part file and a stale file, which must not be appended to
+        for name in self.files[:2]:
+            path = os.path.join(self.local, name)
+            if name == self.files[0]:
+                path += transfer.PART_SUFFIX
+            with open(path, 'wb') as partial:
+                partial.write(head if name == self.files[0] else
+                              b'x' * 10 + head[10:20])
+        status = TransferEngine(LocalBackend()).download(
+            self.remote, self.files, self.local)
+        self.assertEqual(set(status.values()), {'downloaded'})
+        self.assertSameFiles()
+
+    def test_checksum_without_server_support(self):
+        os.makedirs(self.local)
+        with open(os.path.join(self.remote, self.files[0]), 'rb') as remote:
+            head = remote.read(1000)
+        part_path = os.path.join(self.local, self.files[0]) + \
+            transfer.PART_SUFFIX
+        with open(part_path, 'wb') as partial:
+            partial.write(b'x' * 10 + head[10:])
+        engine = TransferEngine(NoChecksumBackend(), retries=1, backoff=0.)
+        status = engine.download(self.remote, self.files[:1], self.local)
+        self.assertEqual(status[self.files[0]], 'downloaded')
+        with open(os.path.join(self.remote, self.files[0]), 'rb') as remote, \
+                open(os.path.join(self.local, self.files[0]), 'rb') as local:
+            self.assertEqual(remote.read(), local.read())
+
+    def test_retries_and_checksums(self):
+        FlakyChannel.opened = set()
+        engine = TransferEngine(FlakyBackend(), n_channels=2, backoff=0.)
+        engine.download(self.remote, self.files, self.local)
+        self.assertSameFiles()
+
+        checksums = {self.files[0]: 'wrong'}
+        os.remove(os.path.join(self.local, self.files[0]))
+        engine = TransferEngine(LocalBackend(), retries=1, backoff=0.)
+        with self.assertRaises(TransferError) as context:
+            engine.download(self.remote, self.files, self.local,
+                            checksums=checksums)
+        self.assertEqual(list(context.exception.failed), [self.files[0]])
+        self.assertEqual(len(os.listdir(self.local)), len(self.files) - 1)
+
+    def test_dataset_from_remote(self):
+        dataset = DataSet({'name': 'numu_test', 'type': 'numu', 'n_files': 5,
+                           'remote_path': 'file:' + self.remote,
+                           'local_path': self.local},
+                          db_dir=os.path.dirname(self.local))
+        remote_files = dataset._get_from_remote('file', self.remote,
+                                                filelist_only=True)
+        self.assertEqual(sorted(remote_files), self.files)
+        dataset.load(to_cache=False, n_workers=2)
+        self.assertSameFiles()
+        self.assertEqual(list(dataset.files), self.files)
+
+        # leftover of an interrupted transfer
+        shutil.copy(os.path.join(self.local, self.files[0]),
+                    os.path.join(self.local, 'Run0005.hd5.part'))
+        dataset.refresh_files()
+        self.assertEqual(list(dataset.files), self.files)
+        dataset.load(keys=['LineFit.zenith'])
+        self.assertEqual(len(dataset.files_loaded), len(self.files))
+
+
+class TestRemoteListing(unittest.TestCase):
+    def setUp(self):
+        self.remote = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        make_dataset(self.remote, n_files=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.remote)
+        shutil.rmtree(self.db_dir)
+
+    def add_remote_file(self):
+        shutil.copy(os.path.join(self.remote, 'Run0000.hd5'),
+                    os.path.join(self.remote, 'Run0003.hd5'))
+
+    def test_pooled_backend(self):
+        backend = transfer.get_backend(transfer.LOCAL_HOST)
+        self.assertIs(transfer.get_backend(transfer.LOCAL_HOST), backend)
+        transfer.close_backends()
+        self.assertIsNot(transfer.get_backend(transfer.LOCAL_HOST), backend)
+
+    def test_concurrent_handshakes(self):
+        connected = []
+
+        class SlowBackend(LocalBackend):
+            def __init__(self, hostname):
+                time.sleep(0.3)
+                connected.append(hostname)
+
+        sftp_backend = transfer.SFTPBackend
+        transfer.SFTPBackend = SlowBackend
+        try:
+            threads = [threading.Thread(target=transfer.get_backend,
+                                        args=(host,))
+                       for host in ['a', 'b', 'c', 'a']]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLess(time.time() - start, 0.55)
+            # one connection per host
+            self.assertEqual(sorted(connected), ['a', 'b', 'c'])
+        finally:
+            transfer.SFTPBackend = sftp_backend
+            transfer.close_backends()
+
+    def test_ttl(self):
+        path = os.path.join(self.db_dir, 'numu.listing')
+        location = 'file:' + self.remote
+        listing = RemoteListing(path, location, ttl=None)
+        self.assertEqual(len(listing), 3)
+        self.add_remote_file()
+        # stored listings are used until they expire
+        self.assertEqual(len(RemoteListing(path, location, ttl=None)), 3)
+        self.assertEqual(len(RemoteListing(path, location, ttl=0.)), 4)
+        self.assertFalse(listing.refresh())
+        self.assertTrue(listing.refresh(force=True))
+        self.assertEqual(len(listing), 4)
+
+    def test_handler_refresh(self):
+        properties = {'name': 'numu_test', 'type': 'numu', 'n_files': 3,
+                      'remote_path': 'file:' + self.remote,
+                      'listing_ttl': None}
+        with open(os.path.join(self.db_dir, 'numu.dataset'), 'w') as output:
+            json.dump(properties, output)
+        handler = DataSetHandler(db_dir=self.db_dir)
+        self.assertEqual(handler.refresh_remote(), {'numu': 3})
+        dataset = handler._datasets['numu']
+        self.assertEqual(len(dataset.files), 3)
+        self.add_remote_file()
+        self.assertEqual(len(dataset.files), 3)
+        self.assertEqual(handler.refresh_remote(force=True), {'numu': 4})
+        self.assertEqual(len(dataset.files), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,7 @@ config = {
                          'tables',
                          'tqdm',
                          ],
+    'extras_require': {'arrow': ['pyarrow']},
     'packages': ['nuance',
                  'nuance.data_handler',
                  'nuance.icetray_modules',